@@ -4,4 +4,6 @@ if not require_password("5212025"):
 	st.stop()
 
 from src.dashboard import render_dashboard
+from utils.query_log import render_query_panel
 render_dashboard()
+render_query_panel()
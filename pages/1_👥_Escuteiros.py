@@ -6,12 +6,17 @@ if not require_password("5212025"):
 import pandas as pd
 import re
 import io
+import unicodedata
 from datetime import datetime
 from utils.supabase_client import get_supabase_client
+from utils import data_access as db
+from utils import avisos
+from utils.query_log import render_query_panel
 
 st.set_page_config(page_title="Escuteiros", page_icon="👥", layout="wide")
 
 st.title("👥 Gestão de Escuteiros")
+avisos.mostrar()
 
 # Secções disponíveis
 SECCOES = ['Lobitos', 'Exploradores', 'Pioneiros', 'Caminheiros', 'CPP']
@@ -24,6 +29,12 @@ def validate_email(email):
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(pattern, email) is not None
 
+def normalizar_nome(nome):
+    """Chave de comparação de nomes: sem acentos, sem maiúsculas, espaços simples"""
+    decomposto = unicodedata.normalize('NFKD', str(nome).casefold())
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.split())
+
 def validate_phone(phone):
     """Validate phone format (Portuguese format)"""
     if not phone:
@@ -35,7 +46,7 @@ def validate_phone(phone):
 
 # Initialize Supabase client
 try:
-    supabase = get_supabase_client()
+    get_supabase_client()
 except ValueError as e:
     st.error(f"Erro ao conectar ao Supabase: {str(e)}")
     st.stop()
@@ -48,36 +59,43 @@ if 'force_tab_index' not in st.session_state:
     st.session_state.force_tab_index = None
 
 # Tab 1: List scouts
-with tab1:
+@st.fragment
+def render_lista():
     st.subheader("Lista de Escuteiros")
     
     try:
-        response = supabase.table('escuteiros').select('*').order('nome').execute()
+        escuteiros = db.select('escuteiros', '*', order=[('nome', False)])
         
-        if response.data:
-            df = pd.DataFrame(response.data)
+        if escuteiros:
+            df = pd.DataFrame(escuteiros)
             
             # Usar secção da tabela escuteiros se existir, senão buscar dos blocos
             if 'seccao' not in df.columns:
-                # Buscar secção de cada escuteiro (da tabela blocos_rifas) - legado
-                escuteiro_seccoes = {}
-                for escuteiro in response.data:
-                    esc_id = escuteiro['id']
-                    blocos_response = supabase.table('blocos_rifas').select('seccao').eq('escuteiro_id', esc_id).limit(1).execute()
-                    if blocos_response.data and blocos_response.data[0].get('seccao'):
-                        escuteiro_seccoes[esc_id] = blocos_response.data[0]['seccao']
-                    else:
-                        escuteiro_seccoes[esc_id] = '-'
-                
+                # Base de dados antiga (sem escuteiros.seccao): uma só consulta aos
+                # blocos atribuídos. Execute scripts/backfill_seccao_escuteiros.sql
+                # para gravar a secção no escuteiro e dispensar esta consulta.
+                # A secção é a da atribuição mais recente; blocos sem data ficam
+                # para o fim (o PostgreSQL ordena os NULL primeiro em DESC)
+                blocos_seccao = pd.DataFrame(
+                    db.select(
+                        'blocos_rifas', 'escuteiro_id, seccao, data_atribuicao',
+                        filters=[('not_is', 'escuteiro_id', None), ('not_is', 'seccao', None)]
+                    ),
+                    columns=['escuteiro_id', 'seccao', 'data_atribuicao']
+                ).sort_values(
+                    'data_atribuicao', ascending=False, na_position='last', kind='stable'
+                ).drop_duplicates('escuteiro_id')
+                escuteiro_seccoes = dict(zip(blocos_seccao['escuteiro_id'], blocos_seccao['seccao']))
+
                 # Adicionar coluna secção
-                df['seccao'] = df['id'].map(escuteiro_seccoes)
+                df['seccao'] = df['id'].map(escuteiro_seccoes).fillna('-')
             else:
                 # Preencher secções vazias com '-'
                 df['seccao'] = df['seccao'].fillna('-')
             
             # Formatar data
             if 'created_at' in df.columns:
-                df['created_at'] = pd.to_datetime(df['created_at']).dt.strftime('%d-%m-%Y')
+                df['created_at'] = pd.to_datetime(df['created_at'], format='ISO8601').dt.strftime('%d-%m-%Y')
             
             # Criar coluna ID curto para visualização
             if 'id' in df.columns:
@@ -95,7 +113,9 @@ with tab1:
                 df['ativo'] = df['ativo'].apply(lambda v: '✅' if v else '')
 
                 # Criar um Styler para colorir o check em verde e centralizar
-                styler = df.style.applymap(
+                # Styler.applymap foi renomeado para Styler.map (pandas >= 2.1)
+                style_map = getattr(df.style, 'map', None) or df.style.applymap
+                styler = style_map(
                     lambda v: 'color: #28a745; font-weight: 600; text-align: center' if v == '✅' else 'color: #6c757d; text-align: center',
                     subset=['ativo']
                 ).set_properties(**{col: 'text-align: left' for col in df.columns if col != 'ativo'})
@@ -137,8 +157,13 @@ with tab1:
     except Exception as e:
         st.error(f"Erro ao carregar escuteiros: {str(e)}")
 
+
+with tab1:
+    render_lista()
+
 # Tab 2: Add new scout
-with tab2:
+@st.fragment
+def render_adicionar():
     st.subheader("Adicionar Novo Escuteiro")
     
     # Initialize session state apenas para preservar em caso de erro
@@ -199,9 +224,9 @@ with tab2:
             else:
                 try:
                     # Check for duplicate name
-                    existing = supabase.table('escuteiros').select('nome').ilike('nome', nome).execute()
+                    existing = db.select('escuteiros', 'nome', filters=[('ilike', 'nome', nome)])
                     
-                    if existing.data and len(existing.data) > 0:
+                    if existing:
                         st.error(f"⚠️ Já existe um escuteiro com o nome '{nome}'. Por favor, use um nome diferente.")
                         # Preservar valores para correção
                         st.session_state.add_error_nome = nome
@@ -217,9 +242,9 @@ with tab2:
                             "seccao": seccao
                         }
                         
-                        response = supabase.table('escuteiros').insert(data).execute()
+                        inserted = db.insert('escuteiros', data)
                         
-                        if response.data:
+                        if inserted:
                             # Limpar estados de erro
                             st.session_state.add_error_nome = ""
                             st.session_state.add_error_email = ""
@@ -227,12 +252,7 @@ with tab2:
                             st.session_state.add_error_seccao = "Lobitos"
                             st.session_state.show_add_error = False
                             
-                            st.success(f"✅ Escuteiro '{nome}' adicionado com sucesso!")
-                            st.info("🔄 A página será recarregada...")
-                            
-                            # Aguardar para mostrar mensagem
-                            import time
-                            time.sleep(1.5)
+                            avisos.avisar(f"Escuteiro '{nome}' adicionado com sucesso!")
                             st.rerun()
                         else:
                             st.error("Erro ao adicionar escuteiro.")
@@ -252,8 +272,13 @@ with tab2:
                     st.session_state.add_error_seccao = seccao
                     st.session_state.show_add_error = True
 
+
+with tab2:
+    render_adicionar()
+
 # Tab 3: Edit/Delete scouts
-with tab3:
+@st.fragment
+def render_editar():
     st.subheader("Editar ou Eliminar Escuteiro")
     
     # Initialize session state for clearing selection
@@ -261,12 +286,12 @@ with tab3:
         st.session_state.clear_edit_selection = False
     
     try:
-        response = supabase.table('escuteiros').select('*').order('nome').execute()
+        escuteiros = db.select('escuteiros', '*', order=[('nome', False)])
         
-        if response.data:
+        if escuteiros:
             # Create a dictionary for scout selection (id-based for stability)
-            scouts_map = {scout['id']: scout for scout in response.data}
-            scouts_display = {scout['id']: scout['nome'] for scout in response.data}
+            scouts_map = {scout['id']: scout for scout in escuteiros}
+            scouts_display = {scout['id']: scout['nome'] for scout in escuteiros}
             
             # Reset selection index if needed
             if st.session_state.clear_edit_selection:
@@ -311,21 +336,16 @@ with tab3:
                                         "telefone": new_telefone if new_telefone else None
                                     }
                                     
-                                    response = supabase.table('escuteiros').update(update_data).eq('id', scout['id']).execute()
+                                    updated = db.update('escuteiros', update_data, [('eq', 'id', scout['id'])])
                                     
-                                    if response.data:
+                                    if updated:
                                         # Forçar recarregar lista limpa
                                         if 'scout_selector' in st.session_state:
                                             del st.session_state['scout_selector']
                                         if 'edit_scout_form' in st.session_state:
                                             del st.session_state['edit_scout_form']
                                         
-                                        st.success(f"✅ Escuteiro '{new_nome}' atualizado com sucesso!")
-                                        st.info("🔄 A página será recarregada...")
-                                        
-                                        # Aguardar para mostrar mensagem
-                                        import time
-                                        time.sleep(1.5)
+                                        avisos.avisar(f"Escuteiro '{new_nome}' atualizado com sucesso!")
                                         st.rerun()
                                     else:
                                         st.error("Erro ao atualizar escuteiro.")
@@ -348,28 +368,23 @@ with tab3:
                     if delete_button and confirm_delete:
                         try:
                             # Tentar eliminar
-                            response = supabase.table('escuteiros').delete().eq('id', scout['id']).execute()
+                            deleted = db.delete('escuteiros', [('eq', 'id', scout['id'])])
                             
                             # Verificar se funcionou
-                            if response.data and len(response.data) > 0:
+                            if deleted:
                                 # Limpar estados do formulário
                                 if 'scout_selector' in st.session_state:
                                     del st.session_state['scout_selector']
                                 if 'edit_scout_form' in st.session_state:
                                     del st.session_state['edit_scout_form']
                                     
-                                st.success(f"✅ Escuteiro '{scout['nome']}' eliminado com sucesso!")
-                                st.info("🔄 A página será recarregada...")
-                                
-                                # Aguardar um pouco antes de recarregar
-                                import time
-                                time.sleep(1.5)
+                                avisos.avisar(f"Escuteiro '{scout['nome']}' eliminado com sucesso!")
                                 st.rerun()
                             else:
                                 st.error("⚠️ Nenhum registo foi eliminado. Possíveis causas:")
                                 st.info("1. Permissões RLS (Row Level Security) bloqueando a operação")
                                 st.info("2. Escuteiro tem blocos de rifas associados (foreign key constraint)")
-                                st.code(f"Response: {response.data}")
+                                st.code(f"Response: {deleted}")
                         
                         except Exception as e:
                             st.error(f"❌ Erro ao eliminar escuteiro: {str(e)}")
@@ -382,9 +397,24 @@ with tab3:
     except Exception as e:
         st.error(f"Erro ao carregar escuteiros: {str(e)}")
 
+
+with tab3:
+    render_editar()
+
 # Tab 4: Import from Excel
-with tab4:
+@st.fragment
+def render_importar():
     st.subheader("📤 Importar Escuteiros via Excel")
+
+    def mostrar_erros(erros):
+        if erros:
+            st.warning(f"⚠️ {len(erros)} erro(s) encontrado(s):")
+            for erro in erros[:10]:  # Mostrar no máximo 10 erros
+                st.text(f"• {erro}")
+            if len(erros) > 10:
+                st.text(f"... e mais {len(erros)-10} erro(s)")
+
+    mostrar_erros(st.session_state.pop('escuteiros_importacao_erros', None))
     
     col1, col2 = st.columns([2, 1])
     
@@ -496,56 +526,52 @@ with tab4:
                             erros = []
                             
                             dados = st.session_state.get('dados_para_importar', [])
-                            
+
+                            # Nomes existentes carregados uma só vez num índice normalizado
+                            # (sem acentos / maiúsculas); duplicados no próprio ficheiro
+                            # também são detetados aqui
+                            nomes_existentes = {
+                                normalizar_nome(e['nome'])
+                                for e in db.select('escuteiros', 'nome', use_cache=False)
+                            }
+
+                            novos = []
                             for idx, row in enumerate(dados):
+                                nome = row['Nome']
+                                chave = normalizar_nome(nome)
+                                if chave in nomes_existentes:
+                                    erros.append(f"Linha {idx+2}: '{nome}' já existe")
+                                    continue
+                                nomes_existentes.add(chave)
+                                novos.append({
+                                    "nome": nome,
+                                    "email": row.get('Email', '') if row.get('Email', '') else None,
+                                    "telefone": row.get('Telefone', '') if row.get('Telefone', '') else None,
+                                    "seccao": row['Secção']
+                                })
+
+                            # Inserção em lotes (tudo ou nada)
+                            if novos:
                                 try:
-                                    # Verificar duplicados
-                                    nome = row['Nome']
-                                    existing = supabase.table('escuteiros').select('nome').ilike('nome', nome).execute()
-                                    
-                                    if existing.data and len(existing.data) > 0:
-                                        erros.append(f"Linha {idx+2}: '{nome}' já existe")
-                                        continue
-                                    
-                                    # Preparar dados
-                                    data = {
-                                        "nome": nome,
-                                        "email": row.get('Email', '') if row.get('Email', '') else None,
-                                        "telefone": row.get('Telefone', '') if row.get('Telefone', '') else None,
-                                        "seccao": row['Secção']
-                                    }
-                                    
-                                    # Inserir
-                                    response = supabase.table('escuteiros').insert(data).execute()
-                                    
-                                    if response.data:
-                                        importados += 1
-                                    else:
-                                        erros.append(f"Linha {idx+2}: Erro ao inserir '{nome}'")
-                                
+                                    importados = len(db.insert_many('escuteiros', novos))
                                 except Exception as e:
-                                    erros.append(f"Linha {idx+2}: {str(e)}")
+                                    por_remover = getattr(e, 'leftover_ids', [])
+                                    if por_remover:
+                                        erros.append(f"Erro ao inserir escuteiros: {str(e)}. {len(por_remover)} "
+                                                     f"escuteiro(s) já inseridos não puderam ser removidos.")
+                                    else:
+                                        erros.append(f"Erro ao inserir escuteiros (nenhum foi importado): {str(e)}")
                             
                             # Limpar dados do session_state
                             if 'dados_para_importar' in st.session_state:
                                 del st.session_state['dados_para_importar']
                             
-                            # Mostrar resultados
-                            if importados > 0:
-                                st.success(f"✅ {importados} escuteiro(s) importado(s) com sucesso!")
-                            
-                            if erros:
-                                st.warning(f"⚠️ {len(erros)} erro(s) encontrado(s):")
-                                for erro in erros[:10]:  # Mostrar no máximo 10 erros
-                                    st.text(f"• {erro}")
-                                if len(erros) > 10:
-                                    st.text(f"... e mais {len(erros)-10} erro(s)")
-                            
+                            # Mostrar resultados (os erros continuam visíveis depois do rerun)
                             if importados > 0:
-                                st.info("🔄 A página será recarregada...")
-                                import time
-                                time.sleep(2)
+                                avisos.avisar(f"{importados} escuteiro(s) importado(s) com sucesso!")
+                                st.session_state['escuteiros_importacao_erros'] = erros
                                 st.rerun()
+                            mostrar_erros(erros)
                     
                     if cancelar:
                         # Limpar session_state e recarregar
@@ -556,3 +582,9 @@ with tab4:
         except Exception as e:
             st.error(f"❌ Erro ao ler arquivo: {str(e)}")
             st.info("Certifique-se de que o arquivo está no formato correto (Excel .xlsx ou .xls)")
+
+
+with tab4:
+    render_importar()
+
+render_query_panel()
@@ -5,33 +5,39 @@ if not require_password("5212025"):
     st.stop()
 import pandas as pd
 from utils.supabase_client import get_supabase_client
+from utils import data_access as db
+from utils.blocos import dividir_intervalo, indice_campanha
+from utils import estado_rifas
+from utils import avisos
+from utils.query_log import render_query_panel
 
 st.set_page_config(page_title="Blocos de Rifas", page_icon="🎟️", layout="wide")
 
 st.title("🎟️ Gestão de Blocos de Rifas")
+avisos.mostrar()
 
 st.info("💡 **Nota:** Os blocos de rifas são criados automaticamente na página 'Campanhas'. Aqui pode atribuir blocos aos escuteiros.")
 
 # Initialize Supabase client
 try:
-    supabase = get_supabase_client()
+    get_supabase_client()
 except ValueError as e:
     st.error(f"Erro ao conectar ao Supabase: {str(e)}")
     st.stop()
 
 # Get campaigns for filtering
 try:
-    campanhas_response = supabase.table('campanhas').select('*').order('created_at', desc='desc').execute()
+    campanhas = db.select('campanhas', '*', order=[('created_at', True)])
     
-    if campanhas_response.data:
+    if campanhas:
         # Create campaign selector
         col1, col2 = st.columns([3, 1])
         with col1:
-            campanhas_dict = {c['nome']: c for c in campanhas_response.data}
+            campanhas_dict = {c['nome']: c for c in campanhas}
             
             # Set default to active campaign
             default_idx = 0
-            for idx, c in enumerate(campanhas_response.data):
+            for idx, c in enumerate(campanhas):
                 if c.get('ativa', False):
                     default_idx = idx
                     break
@@ -54,10 +60,18 @@ except Exception as e:
     st.stop()
 
 
+ROTULOS_ESTADO_RIFA = {
+    estado_rifas.POR_VENDER: "⬜ Por vender",
+    estado_rifas.VENDIDA: "✅ Vendida",
+    estado_rifas.DEVOLVIDA: "🔄 Devolvida",
+    estado_rifas.PERDIDA: "❌ Perdida",
+}
+
 # Tabs for different operations
 tab1, tab2, tab3, tab4 = st.tabs(["📋 Lista de Blocos", "🏷️ Atribuição de Secção", "➕ Atribuir a Escuteiro", "📥 Importar Atribuições"])
 # Tab 4: Importação em lote de atribuições
-with tab4:
+@st.fragment
+def render_importar():
     st.subheader("📥 Importar Atribuições em Lote")
     st.markdown("""
     Faça download do modelo, preencha as colunas e faça upload para atribuir blocos a escuteiros em massa.
@@ -69,13 +83,14 @@ with tab4:
     import io
 
     # Buscar escuteiros para sheet auxiliar
-    escuteiros_resp = supabase.table('escuteiros').select('id,nome,seccao').execute()
-    escuteiros = escuteiros_resp.data or []
+    escuteiros = db.select('escuteiros', 'id,nome,seccao')
 
     # Buscar blocos da campanha selecionada para aba de apoio
 
-    blocos_resp = supabase.table('blocos_rifas').select('id,numero_inicial,numero_final,estado,escuteiro_id,data_atribuicao,observacoes').eq('campanha_id', selected_campanha['id']).order('numero_inicial').execute()
-    blocos = blocos_resp.data or []
+    blocos = db.select(
+        'blocos_rifas', 'id,numero_inicial,numero_final,estado,escuteiro_id,data_atribuicao,observacoes',
+        filters=[('eq', 'campanha_id', selected_campanha['id'])], order=[('numero_inicial', False)]
+    )
 
     # Sheet principal: só cabeçalhos e linha vazia
     colunas_modelo = ['bloco_id','escuteiro_id','data_atribuicao','observacoes']
@@ -100,7 +115,7 @@ with tab4:
 
     # Gerar Excel com múltiplas sheets
     modelo_bytes = io.BytesIO()
-    with pd.ExcelWriter(modelo_bytes, engine='xlsxwriter') as writer:
+    with pd.ExcelWriter(modelo_bytes, engine='openpyxl') as writer:
         modelo_df.to_excel(writer, index=False, sheet_name='ModeloAtribuicao')
         escuteiros_df.to_excel(writer, index=False, sheet_name='Escuteiros')
         blocos_df.to_excel(writer, index=False, sheet_name='Blocos')
@@ -114,6 +129,19 @@ with tab4:
     st.caption("O modelo agora inclui apenas cabeçalhos e abas auxiliares com escuteiros, secção e blocos disponíveis. Preencha bloco_id e escuteiro_id conforme necessário.")
 
     st.markdown("---")
+
+    # Outcome of the last import, kept across the rerun that refreshes the other tabs
+    relatorio = st.session_state.pop('blocos_importacao_relatorio', None)
+    if relatorio is not None:
+        relatorio_df = pd.DataFrame(relatorio)
+        sucessos = int((relatorio_df['Resultado'] == "✅ Atribuído").sum()) if not relatorio_df.empty else 0
+        erros = [f"Linha {r['Linha']}: {r['Resultado'][2:]}" for r in relatorio if r['Resultado'] != "✅ Atribuído"]
+        if sucessos:
+            st.success(f"✅ {sucessos} atribuições realizadas/atualizadas com sucesso!")
+        if erros:
+            st.error("\n".join(erros))
+        st.dataframe(relatorio_df, hide_index=True, use_container_width=True)
+
     st.markdown("### 1️⃣ Faça upload do Excel preenchido")
     uploaded_file = st.file_uploader("Carregar arquivo Excel de atribuições", type=["xlsx"])
 
@@ -127,62 +155,191 @@ with tab4:
             else:
                 # Preview e botão de importação
                 if st.button("🚀 Importar atribuições", type="primary", use_container_width=True):
-                    erros = []
-                    sucessos = 0
-                    for idx, row in df_import.iterrows():
-                        bloco_id = row['bloco_id']
-                        escuteiro_id = row['escuteiro_id']
-                        data_atribuicao = row['data_atribuicao'] if 'data_atribuicao' in row and pd.notnull(row['data_atribuicao']) else None
-                        observacoes = row['observacoes'] if 'observacoes' in row and pd.notnull(row['observacoes']) else None
-                        try:
-                            from datetime import datetime
-                            # Verifica se já existe atribuição para o bloco
-                            resp_check = supabase.table('blocos_rifas').select('id').eq('id', bloco_id).execute()
-                            if resp_check.data:
-                                # Atualiza registro existente
-                                update_data = {
-                                    "escuteiro_id": escuteiro_id,
-                                    "data_atribuicao": str(data_atribuicao) if data_atribuicao else datetime.now().isoformat()
+                    from datetime import datetime
+
+                    # Uma só leitura dos blocos da campanha e dos escuteiros; toda a
+                    # validação é feita localmente
+                    blocos_campanha = {
+                        b['id'] for b in db.select(
+                            'blocos_rifas', 'id',
+                            filters=[('eq', 'campanha_id', selected_campanha['id'])],
+                            use_cache=False
+                        )
+                    }
+                    seccao_escuteiro = {
+                        e['id']: e.get('seccao') for e in db.select('escuteiros', 'id,seccao', use_cache=False)
+                    }
+
+                    relatorio = []
+                    linhas_por_bloco = {}
+                    registos = []
+                    for idx, row in enumerate(df_import.to_dict('records')):
+                        linha = idx + 2
+                        bloco_id = str(row['bloco_id']).strip() if pd.notnull(row['bloco_id']) else ''
+                        escuteiro_id = str(row['escuteiro_id']).strip() if pd.notnull(row['escuteiro_id']) else ''
+                        data_atribuicao = row.get('data_atribuicao')
+                        observacoes = row.get('observacoes')
+
+                        if not bloco_id or not escuteiro_id:
+                            erro = "bloco_id e escuteiro_id são obrigatórios"
+                        elif bloco_id not in blocos_campanha:
+                            erro = f"bloco {bloco_id} não existe na campanha '{selected_campanha['nome']}'"
+                        elif bloco_id in linhas_por_bloco:
+                            erro = f"bloco {bloco_id} repetido (já na linha {linhas_por_bloco[bloco_id]})"
+                        elif escuteiro_id not in seccao_escuteiro:
+                            erro = f"escuteiro {escuteiro_id} não existe"
+                        else:
+                            erro = None
+
+                        relatorio.append({'Linha': linha, 'bloco_id': bloco_id, 'escuteiro_id': escuteiro_id, 'Resultado': f"❌ {erro}" if erro else "✅ Atribuído"})
+                        if erro:
+                            continue
+                        linhas_por_bloco[bloco_id] = linha
+
+                        # Só as colunas da atribuição: o resto do bloco (estado, rifas,
+                        # preços) fica como está na base de dados; seccao/observacoes
+                        # vazias mantêm o valor atual
+                        registos.append((len(relatorio) - 1, {
+                            "id": bloco_id,
+                            "escuteiro_id": escuteiro_id,
+                            "seccao": seccao_escuteiro[escuteiro_id] or None,
+                            "data_atribuicao": str(data_atribuicao) if pd.notnull(data_atribuicao) and data_atribuicao != '' else datetime.now().isoformat(),
+                            "observacoes": observacoes if pd.notnull(observacoes) and observacoes != '' else None,
+                        }))
+
+                    # Gravar as atribuições válidas com um UPDATE por lote
+                    # (scripts/atribuir_blocos.sql)
+                    if registos:
+                        progresso = st.progress(0.0, text="A gravar atribuições...")
+                        for inicio in range(0, len(registos), db.INSERT_CHUNK):
+                            lote = registos[inicio:inicio + db.INSERT_CHUNK]
+                            try:
+                                nao_encontrados = {
+                                    r['bloco_id'] for r in db.rpc('atribuir_blocos', {
+                                        'p_campanha_id': selected_campanha['id'],
+                                        'p_atribuicoes': [registo for _, registo in lote],
+                                    }) or []
                                 }
-                                if observacoes is not None:
-                                    update_data["observacoes"] = observacoes
-                                resp = supabase.table('blocos_rifas').update(update_data).eq('id', bloco_id).execute()
-                                if resp.data:
-                                    sucessos += 1
-                                else:
-                                    erros.append(f"Linha {idx+2}: Falha ao atualizar bloco {bloco_id} para escuteiro {escuteiro_id}")
+                            except Exception as e:
+                                mensagem = getattr(e, 'message', None) or str(e)
+                                for pos, _ in lote:
+                                    relatorio[pos]['Resultado'] = f"❌ {mensagem}"
                             else:
-                                # Insere novo registro (caso deseje permitir criação de blocos novos)
-                                insert_data = {
-                                    "id": bloco_id,
-                                    "escuteiro_id": escuteiro_id,
-                                    "data_atribuicao": str(data_atribuicao) if data_atribuicao else datetime.now().isoformat(),
-                                    "observacoes": observacoes if observacoes is not None else ''
-                                }
-                                resp = supabase.table('blocos_rifas').insert(insert_data).execute()
-                                if resp.data:
-                                    sucessos += 1
-                                else:
-                                    erros.append(f"Linha {idx+2}: Falha ao inserir bloco {bloco_id} para escuteiro {escuteiro_id}")
-                        except Exception as e:
-                            erros.append(f"Linha {idx+2}: {str(e)}")
-                    if sucessos:
-                        st.success(f"✅ {sucessos} atribuições realizadas/atualizadas com sucesso!")
-                        st.info("🔄 Recarregue a página para ver as alterações.")
-                    if erros:
-                        st.error("\n".join(erros))
+                                for pos, registo in lote:
+                                    if registo['id'] in nao_encontrados:
+                                        relatorio[pos]['Resultado'] = f"❌ bloco {registo['id']} já não existe nesta campanha"
+                            feitos = inicio + len(lote)
+                            progresso.progress(feitos / len(registos), text=f"A gravar atribuições... {feitos}/{len(registos)}")
+                        progresso.empty()
+
+                    # Full rerun so the other tabs show the new assignments; the
+                    # report is shown again from session_state
+                    st.session_state['blocos_importacao_relatorio'] = relatorio
+                    st.rerun()
         except Exception as e:
             st.error(f"Erro ao processar arquivo: {str(e)}")
 
+
+with tab4:
+    render_importar()
+
 # Tab 1: List raffle blocks
-with tab1:
+@st.fragment
+def render_lista():
     st.subheader(f"Blocos da Campanha: {selected_campanha['nome']}")
+
+    # Procura rápida: quem tem a rifa nº X (índice por intervalos, em cache por campanha)
+    try:
+        indice = indice_campanha(selected_campanha['id'])
+        if indice.sobreposicoes:
+            st.warning(
+                f"⚠️ {len(indice.sobreposicoes)} sobreposição(ões) de intervalos nesta campanha: " +
+                "; ".join(
+                    f"{a['numero_inicial']}-{a['numero_final']} ∩ {b['numero_inicial']}-{b['numero_final']}"
+                    for a, b in indice.sobreposicoes[:10]
+                )
+            )
+        numero_procurado = st.number_input("🔎 Quem tem a rifa nº", min_value=0, value=None, step=1, key="procurar_rifa")
+        if numero_procurado is not None:
+            encontrados = indice.procurar(int(numero_procurado))
+            if not encontrados:
+                st.info(f"A rifa {int(numero_procurado)} não pertence a nenhum bloco desta campanha.")
+            for bloco in encontrados:
+                escuteiro = 'Sem escuteiro atribuído'
+                if bloco.get('escuteiro_id'):
+                    registo = db.select_one('escuteiros', 'nome', filters=[('eq', 'id', bloco['escuteiro_id'])])
+                    escuteiro = registo['nome'] if registo else bloco['escuteiro_id']
+                st.success(
+                    f"🎟️ Rifa {int(numero_procurado)} → Bloco {bloco['numero_inicial']}-{bloco['numero_final']} · "
+                    f"👤 {escuteiro} · Secção: {bloco.get('seccao') or '-'} · Estado: {bloco.get('estado') or '-'}"
+                )
+    except Exception as e:
+        st.error(f"Erro ao procurar rifa: {str(e)}")
+
+    # Estado de cada rifa (bitmap de 2 bits por rifa em blocos_rifas.estado_rifas)
+    with st.expander("🎫 Estado das rifas individuais"):
+        try:
+            blocos_estado = estado_rifas.blocos_campanha(selected_campanha['id'])
+            contagem = estado_rifas.contar(blocos_estado)
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("⬜ Por vender", contagem['por_vender'])
+            col2.metric("✅ Vendidas", contagem['vendida'])
+            col3.metric("🔄 Devolvidas", contagem['devolvida'])
+            col4.metric("❌ Perdidas", contagem['perdida'])
+
+            with st.form("marcar_rifas_form"):
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    marcar_inicio = st.number_input("Da rifa nº", min_value=0, step=1, value=None)
+                with col2:
+                    marcar_fim = st.number_input("Até à rifa nº", min_value=0, step=1, value=None)
+                with col3:
+                    marcar_estado = st.selectbox(
+                        "Marcar como", options=list(ROTULOS_ESTADO_RIFA), format_func=ROTULOS_ESTADO_RIFA.get
+                    )
+                marcar_submitted = st.form_submit_button("🎫 Marcar Rifas", type="primary")
+
+            if marcar_submitted:
+                if marcar_inicio is None or marcar_fim is None or marcar_inicio > marcar_fim:
+                    st.error("❌ Indique um intervalo válido (nº inicial ≤ nº final).")
+                else:
+                    inicio, fim = int(marcar_inicio), int(marcar_fim)
+                    # One database call for every block of the range (all or nothing)
+                    _, marcadas = estado_rifas.marcar_intervalo(selected_campanha['id'], inicio, fim, marcar_estado)
+                    fora = fim - inicio + 1 - marcadas
+                    if marcadas:
+                        avisos.avisar(f"{marcadas} rifa(s) marcadas como {ROTULOS_ESTADO_RIFA[marcar_estado]}.")
+                        if fora:
+                            avisos.avisar(f"{fora} rifa(s) do intervalo não pertencem a nenhum bloco desta campanha.", 'warning')
+                        st.rerun()
+                    st.warning(f"⚠️ {fora} rifa(s) do intervalo não pertencem a nenhum bloco desta campanha.")
+
+            listar_estado = st.selectbox(
+                "Listar números", options=list(ROTULOS_ESTADO_RIFA), format_func=ROTULOS_ESTADO_RIFA.get,
+                key="listar_estado_rifas"
+            )
+            numeros = estado_rifas.numeros_com_estado(blocos_estado, listar_estado)
+            intervalos = estado_rifas.compactar_intervalos(numeros)
+            if intervalos:
+                texto = ', '.join(f"{a}-{b}" if a != b else str(a) for a, b in intervalos[:200])
+                st.caption(f"{len(numeros)} rifa(s) em {len(intervalos)} intervalo(s): {texto}"
+                           f"{' …' if len(intervalos) > 200 else ''}")
+                st.download_button(
+                    "📥 Descarregar números (CSV)",
+                    data=pd.DataFrame({'numero': numeros}).to_csv(index=False).encode('utf-8'),
+                    file_name=f"rifas_{listar_estado}_{selected_campanha['nome']}.csv",
+                    mime="text/csv"
+                )
+            else:
+                st.caption("Nenhuma rifa neste estado.")
+        except Exception as e:
+            st.error(f"Erro ao carregar estado das rifas: {str(e)}")
     
     try:
-        response = supabase.table('blocos_rifas').select('*').eq('campanha_id', selected_campanha['id']).order('numero_inicial').execute()
+        blocos = db.select('blocos_rifas', '*', filters=[('eq', 'campanha_id', selected_campanha['id'])], order=[('numero_inicial', False)])
         
-        if response.data:
-            df = pd.DataFrame(response.data)
+        if blocos:
+            df = pd.DataFrame(blocos)
             
             # Formatar data (sem hora)
             if 'data_atribuicao' in df.columns:
@@ -196,9 +353,9 @@ with tab1:
                 escuteiros_ids = df['escuteiro_id'].dropna().unique().tolist()
                 if escuteiros_ids:
                     # trazer também a seccao dos escuteiros
-                    esc_response = supabase.table('escuteiros').select('id, nome, seccao').in_('id', escuteiros_ids).execute()
-                    esc_dict = {e['id']: e['nome'] for e in (esc_response.data or [])}
-                    esc_seccao = {e['id']: e.get('seccao') for e in (esc_response.data or [])}
+                    esc_rows = db.select('escuteiros', 'id, nome, seccao', filters=[('in', 'id', escuteiros_ids)])
+                    esc_dict = {e['id']: e['nome'] for e in esc_rows}
+                    esc_seccao = {e['id']: e.get('seccao') for e in esc_rows}
                     df['escuteiro_nome'] = df['escuteiro_id'].map(esc_dict).fillna('')
 
                     # preencher a coluna 'seccao' do bloco com a seccao do escuteiro quando estiver vazia
@@ -289,8 +446,13 @@ with tab1:
     except Exception as e:
         st.error(f"Erro ao carregar blocos de rifas: {str(e)}")
 
+
+with tab1:
+    render_lista()
+
 # Tab 2: Assign section to blocks (individual or batch)
-with tab2:
+@st.fragment
+def render_seccoes():
     st.subheader("🏷️ Atribuição de Secção")
     st.info("""
     Atribua uma secção a um ou mais blocos completos de rifas de uma só vez. Basta escolher o bloco inicial e final para definir o intervalo (ou o mesmo bloco para apenas um).
@@ -298,9 +460,9 @@ with tab2:
     """)
     try:
         # Get blocks from selected campaign
-        blocos_response = supabase.table('blocos_rifas').select('*').eq('campanha_id', selected_campanha['id']).order('numero_inicial').execute()
-        if blocos_response.data:
-            blocos_disponiveis = [b for b in blocos_response.data if not b.get('escuteiro_id')]
+        blocos = db.select('blocos_rifas', '*', filters=[('eq', 'campanha_id', selected_campanha['id'])], order=[('numero_inicial', False)])
+        if blocos:
+            blocos_disponiveis = [b for b in blocos if not b.get('escuteiro_id')]
             if blocos_disponiveis:
                 blocos_opcoes = []
                 for b in blocos_disponiveis:
@@ -372,17 +534,16 @@ with tab2:
                                 else:
                                     nova_seccao = seccao_lote
                                     msg_acao = f"atribuído(s) à secção **{seccao_lote}**"
-                                blocos_atualizados = 0
-                                for bloco in blocos_a_atribuir:
-                                    response = supabase.table('blocos_rifas').update({
-                                        "seccao": nova_seccao
-                                    }).eq('id', bloco['id']).execute()
-                                    if response.data:
-                                        blocos_atualizados += 1
-                                st.success(f"✅ {blocos_atualizados} bloco(s) completo(s) {msg_acao}!")
-                                st.info("🔄 A página será recarregada...")
-                                import time
-                                time.sleep(1.5)
+                                # Um único UPDATE sobre o intervalo (atómico): blocos livres
+                                # da campanha com numero_inicial entre o início e o fim
+                                updated = db.update('blocos_rifas', {"seccao": nova_seccao}, [
+                                    ('eq', 'campanha_id', selected_campanha['id']),
+                                    ('is', 'escuteiro_id', None),
+                                    ('gte', 'numero_inicial', intervalo_inicio),
+                                    ('lte', 'numero_inicial', intervalo_fim),
+                                ])
+                                blocos_atualizados = len(updated)
+                                avisos.avisar(f"{blocos_atualizados} bloco(s) completo(s) {msg_acao}!")
                                 st.rerun()
                             else:
                                 st.warning(f"⚠️ Nenhum bloco disponível no intervalo selecionado")
@@ -395,8 +556,13 @@ with tab2:
     except Exception as e:
         st.error(f"Erro: {str(e)}")
 
+
+with tab2:
+    render_seccoes()
+
 # Tab 3: Assign blocks to escuteiros
-with tab3:
+@st.fragment
+def render_atribuir():
     st.subheader("Atribuir Bloco a Escuteiro")
     
     # Option selector
@@ -408,22 +574,26 @@ with tab3:
     if opcao_atribuicao == "👥 Irmãos (divisão automática)":
         st.info("ℹ️ Se o número de rifas não for divisível igualmente, as rifas extra serão atribuídas ao primeiro irmão da lista.")
         # Seleção de bloco
-        blocos_response = supabase.table('blocos_rifas').select('*').eq('campanha_id', selected_campanha['id']).is_('escuteiro_id', 'null').order('numero_inicial').execute()
-        if not blocos_response.data:
+        blocos = db.select(
+            'blocos_rifas', '*',
+            filters=[('eq', 'campanha_id', selected_campanha['id']), ('is', 'escuteiro_id', None)],
+            order=[('numero_inicial', False)]
+        )
+        if not blocos:
             st.warning("⚠️ Nenhum bloco disponível para divisão.")
         else:
             blocks_dict = {}
-            for block in blocos_response.data:
+            for block in blocos:
                 rifa_range = f"{block['numero_inicial']:03d}-{block['numero_final']:03d}"
                 total_rifas = block['numero_final'] - block['numero_inicial'] + 1
                 display_name = f"Rifas {rifa_range} | {block.get('seccao', 'N/A')} | {total_rifas} rifas"
                 blocks_dict[display_name] = block
             if blocks_dict and len(blocks_dict) > 0:
                 # Use id-based selection to avoid label/index desync
-                id_list = [b['id'] for b in blocos_response.data]
+                id_list = [b['id'] for b in blocos]
                 display_map = {}
                 blocks_map = {}
-                for b in blocos_response.data:
+                for b in blocos:
                     rifa_range = f"{b['numero_inicial']:03d}-{b['numero_final']:03d}"
                     total_rifas = b['numero_final'] - b['numero_inicial'] + 1
                     display_name = f"Rifas {rifa_range} | {b.get('seccao', 'N/A')} | {total_rifas} rifas"
@@ -441,14 +611,14 @@ with tab3:
                 total_rifas_bloco = block['numero_final'] - block['numero_inicial'] + 1
                 st.info(f"Bloco selecionado: Rifas {block['numero_inicial']} - {block['numero_final']} ({total_rifas_bloco} rifas)")
                 # Seleção de irmãos
-                escuteiros_response = supabase.table('escuteiros').select('id, nome, ativo, seccao').eq('ativo', True).order('nome').execute()
-                if not escuteiros_response.data or len(escuteiros_response.data) < 2:
+                escuteiros = db.select('escuteiros', 'id, nome, ativo, seccao', filters=[('eq', 'ativo', True)], order=[('nome', False)])
+                if len(escuteiros) < 2:
                     st.warning("⚠️ É necessário pelo menos 2 escuteiros ativos para divisão entre irmãos.")
                 else:
                     # escuteiros: use id-based multiselect to avoid name->id mapping issues
-                    esc_ids = [e['id'] for e in escuteiros_response.data]
-                    esc_display = {e['id']: e['nome'] for e in escuteiros_response.data}
-                    esc_seccao = {e['id']: e.get('seccao') for e in escuteiros_response.data}
+                    esc_ids = [e['id'] for e in escuteiros]
+                    esc_display = {e['id']: e['nome'] for e in escuteiros}
+                    esc_seccao = {e['id']: e.get('seccao') for e in escuteiros}
                     selected_irmaos = st.multiselect(
                         "2️⃣ Selecione os irmãos",
                         options=esc_ids,
@@ -456,78 +626,26 @@ with tab3:
                         help="Selecione 2 ou mais irmãos para dividir o bloco",
                         key="dividir_irmaos_select"
                     )
-                    if len(selected_irmaos) >= 2:
+                    if len(selected_irmaos) > total_rifas_bloco:
+                        st.warning(f"⚠️ O bloco tem apenas {total_rifas_bloco} rifas; selecione no máximo {total_rifas_bloco} irmãos.")
+                    elif len(selected_irmaos) >= 2:
                         n_irmaos = len(selected_irmaos)
-                        base = total_rifas_bloco // n_irmaos
                         extra = total_rifas_bloco % n_irmaos
-                        partes = [base + (1 if i == 0 and extra > 0 else 0) for i in range(n_irmaos)]
-                        # Calcular intervalos
-                        intervalos = []
-                        inicio = block['numero_inicial']
-                        for p in partes:
-                            fim = inicio + p - 1
-                            intervalos.append((inicio, fim))
-                            inicio = fim + 1
+                        # Mesma regra da função dividir_blocos_irmaos (scripts/dividir_blocos_irmaos.sql)
+                        intervalos = dividir_intervalo(block['numero_inicial'], block['numero_final'], n_irmaos)
+                        partes = [fim - inicio + 1 for inicio, fim in intervalos]
                         # Preview
                         st.markdown("### Pré-visualização da divisão:")
-                        for idx, nome in enumerate(selected_irmaos):
-                            st.write(f"{nome}: Rifas {intervalos[idx][0]} - {intervalos[idx][1]} ({partes[idx]} rifas){' (recebe extra)' if idx == 0 and extra > 0 else ''}")
+                        for idx, eid in enumerate(selected_irmaos):
+                            st.write(f"{esc_display.get(eid, eid)}: Rifas {intervalos[idx][0]} - {intervalos[idx][1]} ({partes[idx]} rifas){' (recebe extra)' if idx == 0 and extra > 0 else ''}")
                         # Botão de confirmação
                         if st.button("➗ Dividir e atribuir bloco aos irmãos", type="primary", use_container_width=True):
                             try:
-                                # 1. Determinar preco_unitario (preferir campo existente, senão derivar)
-                                total_rifas_original = total_rifas_bloco
-                                preco_unitario = block.get('preco_unitario')
-                                try:
-                                    if preco_unitario is None:
-                                        preco_unitario = float(block.get('preco_bloco', 0)) / float(total_rifas_original) if total_rifas_original and total_rifas_original > 0 else 0.0
-                                except Exception:
-                                    preco_unitario = 0.0
-
-                                # 2. Atualizar bloco original para o primeiro irmão com novo intervalo e preços
-                                id_primeiro = selected_irmaos[0]
-                                quantidade_primeiro = intervalos[0][1] - intervalos[0][0] + 1
-                                preco_bloco_primeiro = round(preco_unitario * quantidade_primeiro, 2)
-
-                                # copy seccao from the assigned escuteiro if available
-                                seccao_primeiro = esc_seccao.get(id_primeiro)
-                                update_data = {
-                                    "escuteiro_id": id_primeiro,
-                                    "numero_inicial": intervalos[0][0],
-                                    "numero_final": intervalos[0][1],
-                                    "preco_unitario": preco_unitario,
-                                    "preco_bloco": preco_bloco_primeiro,
-                                    "seccao": seccao_primeiro,
-                                    "observacoes": f"Divisão automática entre irmãos: {', '.join([esc_display[eid] for eid in selected_irmaos])}"
-                                }
-                                supabase.table('blocos_rifas').update(update_data).eq('id', block['id']).execute()
-
-                                # 3. Criar blocos para os outros irmãos com preços recalculados
-                                for idx in range(1, n_irmaos):
-                                    inicio, fim = intervalos[idx]
-                                    quantidade = fim - inicio + 1
-                                    novo_preco_bloco = round(preco_unitario * quantidade, 2)
-
-                                    # assign seccao from the escuteiro when creating the new block
-                                    seccao_novo = esc_seccao.get(selected_irmaos[idx]) or block.get('seccao')
-                                    novo_bloco = {
-                                        "campanha_id": block['campanha_id'],
-                                        "nome": f"Bloco {inicio}-{fim}",
-                                        "numero_inicial": inicio,
-                                        "numero_final": fim,
-                                        "preco_unitario": preco_unitario,
-                                        "preco_bloco": novo_preco_bloco,
-                                        "estado": "atribuido",
-                                        "escuteiro_id": selected_irmaos[idx],
-                                        "seccao": seccao_novo,
-                                        "data_atribuicao": pd.Timestamp.now().isoformat(),
-                                        "observacoes": f"Divisão automática entre irmãos: {', '.join([esc_display[eid] for eid in selected_irmaos])} (original {block['numero_inicial']}-{block['numero_final']})"
-                                    }
-                                    supabase.table('blocos_rifas').insert(novo_bloco).execute()
-                                st.success("✅ Bloco dividido e atribuído aos irmãos com sucesso!")
-                                st.info("🔄 A página será recarregada...")
-                                import time
-                                time.sleep(1.5)
+                                # Divisão e gravação numa única transação na base de dados
+                                db.rpc('dividir_blocos_irmaos', {
+                                    'p_divisoes': [{'bloco_id': block['id'], 'escuteiros': selected_irmaos}]
+                                })
+                                avisos.avisar("Bloco dividido e atribuído aos irmãos com sucesso!")
                                 st.rerun()
                             except Exception as e:
                                 st.error(f"Erro ao dividir bloco: {str(e)}")
@@ -536,27 +654,31 @@ with tab3:
     
     try:
         # Get blocks from selected campaign - ONLY UNASSIGNED
-        blocos_response = supabase.table('blocos_rifas').select('*').eq('campanha_id', selected_campanha['id']).is_('escuteiro_id', 'null').order('numero_inicial').execute()
+        blocos = db.select(
+            'blocos_rifas', '*',
+            filters=[('eq', 'campanha_id', selected_campanha['id']), ('is', 'escuteiro_id', None)],
+            order=[('numero_inicial', False)]
+        )
         blocks_dict = {}  # Garante existência
-        if blocos_response.data:
+        if blocos:
             # Get all escuteiros (including seccao)
-            escuteiros_response = supabase.table('escuteiros').select('id, nome, ativo, seccao').eq('ativo', True).order('nome').execute()
-            if not escuteiros_response.data:
+            escuteiros = db.select('escuteiros', 'id, nome, ativo, seccao', filters=[('eq', 'ativo', True)], order=[('nome', False)])
+            if not escuteiros:
                 st.warning("⚠️ Nenhum escuteiro ativo disponível. Ative escuteiros na página 'Escuteiros'.")
             else:
                 if opcao_atribuicao == "👤 Individual":
                     # ===== ATRIBUIÇÃO INDIVIDUAL =====
                     st.markdown("### Atribuição Individual")
-                    escuteiros_dict = {e['id']: e['nome'] for e in escuteiros_response.data}
-                    esc_seccao = {e['id']: e.get('seccao') for e in escuteiros_response.data}
+                    escuteiros_dict = {e['id']: e['nome'] for e in escuteiros}
+                    esc_seccao = {e['id']: e.get('seccao') for e in escuteiros}
 
                     # Create block selection dropdown (only unassigned)
-                    id_list = [b['id'] for b in blocos_response.data]
+                    id_list = [b['id'] for b in blocos]
                     display_map = {
                         b['id']: f"⬜ Rifas {b['numero_inicial']:03d}-{b['numero_final']:03d} | {b.get('seccao', 'N/A')} | {b['numero_final']-b['numero_inicial']+1} rifas"
-                        for b in blocos_response.data
+                        for b in blocos
                     }
-                    blocks_map = {b['id']: b for b in blocos_response.data}
+                    blocks_map = {b['id']: b for b in blocos}
 
                     if not id_list:
                         st.warning("⚠️ Nenhum bloco disponível para atribuição nesta campanha. Crie ou libere blocos na aba 'Lista de Blocos'.")
@@ -598,8 +720,8 @@ with tab3:
 
                             with st.form("assign_block_form"):
                                 # Escuteiro selection (allow None for unassignment)
-                                esc_ids = [e['id'] for e in escuteiros_response.data]
-                                esc_display = {e['id']: e['nome'] for e in escuteiros_response.data}
+                                esc_ids = [e['id'] for e in escuteiros]
+                                esc_display = {e['id']: e['nome'] for e in escuteiros}
                                 options = [None] + esc_ids
 
                                 # determine default index based on current assignment
@@ -657,17 +779,14 @@ with tab3:
                                             # Clear assignment date if removing assignment
                                             update_data["data_atribuicao"] = None
 
-                                        response = supabase.table('blocos_rifas').update(update_data).eq('id', block['id']).execute()
-                                        if response.data:
+                                        updated = db.update('blocos_rifas', update_data, [('eq', 'id', block['id'])])
+                                        if updated:
                                             # Determine name for success message
                                             if escuteiro_id:
                                                 nome_esc = esc_display.get(escuteiro_id, str(escuteiro_id))
-                                                st.success(f"✅ Bloco (rifas {block['numero_inicial']}-{block['numero_final']}) atribuído a **{nome_esc}** com sucesso!")
+                                                avisos.avisar(f"Bloco (rifas {block['numero_inicial']}-{block['numero_final']}) atribuído a **{nome_esc}** com sucesso!")
                                             else:
-                                                st.success("✅ Atribuição removida com sucesso!")
-                                            st.info("🔄 A página será recarregada...")
-                                            import time
-                                            time.sleep(1.5)
+                                                avisos.avisar("Atribuição removida com sucesso!")
                                             st.rerun()
                                         else:
                                             st.error("Erro ao atualizar atribuição.")
@@ -677,3 +796,9 @@ with tab3:
             st.info("📭 Nenhum bloco disponível nesta campanha. Crie blocos na página 'Campanhas'.")
     except Exception as e:
         st.error(f"Erro ao carregar dados: {str(e)}")
+
+
+with tab3:
+    render_atribuir()
+
+render_query_panel()
@@ -3,13 +3,20 @@ from utils.simple_auth import require_password
 import streamlit as st
 if not require_password("5212025"):
     st.stop()
+import io
 import pandas as pd
 from datetime import datetime
 from utils.supabase_client import get_supabase_client
+from utils import data_access as db
+from utils import reconciliacao
+from utils import pagamentos
+from utils import avisos
+from utils.query_log import render_query_panel
 
 st.set_page_config(page_title="Recebimento", page_icon="📦", layout="wide")
 
 st.title("📦 Recebimento de Canhotos e Dinheiro")
+avisos.mostrar()
 
 st.info("""
 **Como funciona:**
@@ -21,23 +28,23 @@ st.info("""
 
 # Initialize Supabase client
 try:
-    supabase = get_supabase_client()
+    get_supabase_client()
 except ValueError as e:
     st.error(f"Erro ao conectar ao Supabase: {str(e)}")
     st.stop()
 
 # Get campaigns for filtering
 try:
-    campanhas_response = supabase.table('campanhas').select('*').order('created_at', desc='desc').execute()
+    campanhas = db.select('campanhas', '*', order=[('created_at', True)])
     
-    if campanhas_response.data:
+    if campanhas:
         col1, col2 = st.columns([3, 1])
         with col1:
-            campanhas_dict = {c['nome']: c for c in campanhas_response.data}
+            campanhas_dict = {c['nome']: c for c in campanhas}
             
             # Set default to active campaign
             default_idx = 0
-            for idx, c in enumerate(campanhas_response.data):
+            for idx, c in enumerate(campanhas):
                 if c.get('ativa', False):
                     default_idx = idx
                     break
@@ -64,21 +71,29 @@ except Exception as e:
 if 'form_counter' not in st.session_state:
     st.session_state.form_counter = 0
 
-# Tabs for different operations
-tab1, tab2, tab3 = st.tabs(["📋 Lista de Recebimentos", "➕ Registar Recebimento", "✏️ Editar/Eliminar"])
+# Tabs for different operations. Each tab body is a fragment (st.fragment):
+# using a widget reruns only that tab and its queries, while writes call
+# st.rerun() to refresh every tab.
+tab1, tab2, tab3, tab4, tab5 = st.tabs([
+    "📋 Lista de Recebimentos", "➕ Registar Recebimento", "📥 Registo em Lote", "✏️ Editar/Eliminar", "🧮 Reconciliação"
+])
 
 # Tab 1: List receipts
-with tab1:
+@st.fragment
+def render_lista():
     st.subheader(f"Recebimentos da Campanha: {selected_campanha['nome']}")
     
     try:
         # Fetch payments (recebimentos) with related block data filtered by campaign
-        response = supabase.table('pagamentos').select(
-            '*, blocos_rifas!inner(numero_inicial, numero_final, preco_bloco, campanha_id, escuteiros(nome))'
-        ).eq('blocos_rifas.campanha_id', selected_campanha['id']).order('data_pagamento', desc=True).execute()
+        recebimentos = db.select(
+            'pagamentos',
+            '*, blocos_rifas!inner(numero_inicial, numero_final, preco_bloco, campanha_id, escuteiros(nome))',
+            filters=[('eq', 'blocos_rifas.campanha_id', selected_campanha['id'])],
+            order=[('data_pagamento', True)]
+        )
         
-        if response.data:
-            df = pd.DataFrame(response.data)
+        if recebimentos:
+            df = pd.DataFrame(recebimentos)
             
             # Flatten nested data
             if 'blocos_rifas' in df.columns:
@@ -145,46 +160,40 @@ with tab1:
     except Exception as e:
         st.error(f"Erro ao carregar recebimentos: {str(e)}")
 
+
+with tab1:
+    render_lista()
+
 # Tab 2: Add new receipt
-with tab2:
+@st.fragment
+def render_registar():
     st.subheader("Registar Novo Recebimento")
     
     # Load assigned blocks for selection
     try:
-        # Get blocks assigned to scouts (escuteiro_id not null) for this campaign
-        blocks_response = supabase.table('blocos_rifas').select(
-            'id, numero_inicial, numero_final, preco_bloco, escuteiro_id, escuteiros(nome)'
-        ).eq('campanha_id', selected_campanha['id']).not_.is_('escuteiro_id', 'null').order('numero_inicial').execute()
-        
-        if not blocks_response.data:
+        # Blocks of this campaign assigned to scouts that still have a pending
+        # balance, read from the ledger kept up to date by the database
+        # (scripts/saldos.sql)
+        blocos = pagamentos.blocos_pendentes(selected_campanha['id'])
+
+        # Create blocks list with payment status (only blocks with pending payment)
+        blocks_list = []
+        for block in blocos:
+            escuteiro = block.get('escuteiros', {})
+            scout_name = escuteiro.get('nome', 'N/A') if escuteiro else 'N/A'
+            total_rifas = block['numero_final'] - block['numero_inicial'] + 1
+            preco_bloco = float(block.get('preco_bloco') or 0)
+            saldo = float(block['saldo'])
+            status = f"⚠️ Pendente: {saldo:.2f} €"
+            label = f"{scout_name} | Rifas {block['numero_inicial']}-{block['numero_final']} | {preco_bloco:.2f} € ({status})"
+            blocks_list.append((label, block, saldo, total_rifas))
+
+        if not blocos and not db.select_one(
+            'blocos_rifas', 'id',
+            filters=[('eq', 'campanha_id', selected_campanha['id']), ('not_is', 'escuteiro_id', None)]
+        ):
             st.warning("⚠️ Não há blocos atribuídos a escuteiros. Por favor, atribua blocos primeiro.")
         else:
-            # Check which blocks already have full payment
-            payments_response = supabase.table('pagamentos').select('bloco_id, valor_pago').execute()
-            payments_by_block = {}
-            if payments_response.data:
-                for payment in payments_response.data:
-                    block_id = payment['bloco_id']
-                    if block_id not in payments_by_block:
-                        payments_by_block[block_id] = 0
-                    payments_by_block[block_id] += float(payment['valor_pago'])
-            
-            # Create blocks list with payment status (only show blocks with pending payment)
-            blocks_list = []
-            for block in blocks_response.data:
-                escuteiro = block.get('escuteiros', {})
-                scout_name = escuteiro.get('nome', 'N/A') if escuteiro else 'N/A'
-                total_rifas = block['numero_final'] - block['numero_inicial'] + 1
-                preco_bloco = float(block.get('preco_bloco', 0))
-                valor_recebido = payments_by_block.get(block['id'], 0)
-                saldo = preco_bloco - valor_recebido
-                
-                # Only include blocks with pending payment (saldo > 0)
-                if saldo > 0:
-                    status = f"⚠️ Pendente: {saldo:.2f} €"
-                    label = f"{scout_name} | Rifas {block['numero_inicial']}-{block['numero_final']} | {preco_bloco:.2f} € ({status})"
-                    blocks_list.append((label, block, saldo, total_rifas))
-            
             if not blocks_list:
                 st.success("✅ Todos os blocos atribuídos já foram totalmente recebidos!")
                 st.info("💡 Se precisar registar um novo recebimento, atribua mais blocos aos escuteiros.")
@@ -212,6 +221,20 @@ with tab2:
                 
                 with col2:
                     st.info(f"🎟️ Total de Rifas no Bloco: **{total_rifas}**")
+
+                # Saldo do escuteiro na campanha (uma linha do resumo por escuteiro)
+                saldo_escuteiro = db.select_one(
+                    'saldos_escuteiros', 'n_blocos, valor_recebido, valor_devolvido, saldo',
+                    filters=[('eq', 'escuteiro_id', selected_block['escuteiro_id']),
+                             ('eq', 'campanha_id', selected_campanha['id'])]
+                )
+                if saldo_escuteiro:
+                    st.caption(
+                        f"👤 Escuteiro nesta campanha: {saldo_escuteiro['n_blocos']} bloco(s) · "
+                        f"recebido {float(saldo_escuteiro['valor_recebido']):.2f} € · "
+                        f"devolvido {float(saldo_escuteiro['valor_devolvido']):.2f} € · "
+                        f"saldo **{float(saldo_escuteiro['saldo']):.2f} €**"
+                    )
                 
                 # Money received - updates automatically!
                 valor_recebido = st.number_input(
@@ -243,7 +266,7 @@ with tab2:
                 # Payment method
                 metodo_pagamento = st.selectbox(
                     "Método de Pagamento",
-                    options=["Dinheiro", "Transferência Bancária", "MB Way", "Multibanco", "Cheque", "Outro"]
+                    options=pagamentos.METODOS_PAGAMENTO
                 )
                 
                 # General observations
@@ -272,13 +295,10 @@ with tab2:
                             "observacoes": observacoes if observacoes else None
                         }
                         
-                        response = supabase.table('pagamentos').insert(data).execute()
+                        inserted = db.insert('pagamentos', data)
                         
-                        if response.data:
-                            st.success(f"✅ Recebimento de {valor_recebido:.2f} € registado com sucesso!")
-                            st.info("🔄 A página será recarregada...")
-                            import time
-                            time.sleep(1.5)
+                        if inserted:
+                            avisos.avisar(f"Recebimento de {valor_recebido:.2f} € registado com sucesso!")
                             st.rerun()
                         else:
                             st.error("Erro ao registar recebimento.")
@@ -289,19 +309,167 @@ with tab2:
     except Exception as e:
         st.error(f"Erro ao carregar dados: {str(e)}")
 
-# Tab 3: Edit/Delete receipts
+
+with tab2:
+    render_registar()
+
+# Tab 3: Batch entry for receipt nights (grid or uploaded file, one bulk insert)
+LIMITE_GRELHA = 500  # rows shown in the editable grid at once
+
+@st.fragment
+def render_lote():
+    st.subheader("Registo em Lote")
+    st.caption(
+        "Preencha o valor e/ou os canhotos dos blocos recebidos (na grelha ou num ficheiro Excel/CSV) e "
+        "registe tudo de uma vez. As linhas sem valor nem canhotos são ignoradas."
+    )
+
+    # Outcome of the last batch, kept across the rerun that refreshes the balances
+    relatorio_lote = st.session_state.pop('recebimento_lote_relatorio', None)
+    if relatorio_lote:
+        registados = sum(1 for r in relatorio_lote if r['Resultado'] == pagamentos.OK)
+        if registados:
+            st.success(f"✅ {registados} recebimento(s) registado(s).")
+        if registados < len(relatorio_lote):
+            st.error(f"❌ {len(relatorio_lote) - registados} linha(s) não registada(s).")
+        st.dataframe(
+            pd.DataFrame(relatorio_lote),
+            column_config={"Valor": st.column_config.NumberColumn("Valor", format="%.2f €")},
+            hide_index=True,
+            use_container_width=True
+        )
+
+    def registar(linhas, blocos_lote):
+        relatorio, registos = pagamentos.validar_lote(linhas, blocos_lote)
+        if not relatorio:
+            st.warning("⚠️ Nenhuma linha com valor ou canhotos para registar.")
+            return
+        erros = [r for r in relatorio if r['Resultado']]
+        if erros:
+            # Nothing is written while the batch has invalid rows
+            st.error(f"❌ {len(erros)} linha(s) com erros. Corrija-as e volte a registar (nada foi gravado).")
+            st.dataframe(pd.DataFrame(erros), hide_index=True, use_container_width=True)
+            return
+        progresso = st.progress(0.0, text="A registar recebimentos...")
+        pagamentos.registar_lote(
+            relatorio, registos,
+            on_progress=lambda feitos, total: progresso.progress(feitos / total, text=f"A registar... {feitos}/{total}")
+        )
+        st.session_state['recebimento_lote_relatorio'] = relatorio
+        st.session_state.form_counter += 1  # fresh grid for the next batch
+        st.rerun()
+
+    try:
+        blocos_lote = pagamentos.blocos_pendentes(selected_campanha['id'])
+
+        if not blocos_lote:
+            st.success("✅ Todos os blocos atribuídos já foram totalmente recebidos!")
+        else:
+            grelha = pd.DataFrame([{
+                'bloco_id': b['id'],
+                'escuteiro': (b.get('escuteiros') or {}).get('nome', 'N/A'),
+                'seccao': b.get('seccao') or '',
+                'bloco': f"{b['numero_inicial']}-{b['numero_final']}",
+                'saldo': float(b['saldo']),
+                'valor_recebido': None,
+                'rifas_entregues': None,
+                'observacoes_canhotos': None,
+                'metodo_pagamento': pagamentos.METODOS_PAGAMENTO[0],
+                'data_recebimento': datetime.now().date(),
+            } for b in blocos_lote])
+
+            origem = st.radio("Origem", ["Grelha", "Ficheiro Excel/CSV"], horizontal=True)
+
+            if origem == "Grelha":
+                col1, col2 = st.columns(2)
+                with col1:
+                    seccoes = sorted(s for s in grelha['seccao'].unique() if s)
+                    filtro_seccao = st.multiselect("Filtrar por Secção", options=seccoes)
+                with col2:
+                    filtro_escuteiro = st.text_input("Filtrar por Escuteiro", placeholder="Parte do nome")
+                if filtro_seccao:
+                    grelha = grelha[grelha['seccao'].isin(filtro_seccao)]
+                if filtro_escuteiro:
+                    grelha = grelha[grelha['escuteiro'].str.contains(filtro_escuteiro, case=False, regex=False)]
+                if len(grelha) > LIMITE_GRELHA:
+                    st.info(f"ℹ️ A mostrar os primeiros {LIMITE_GRELHA} de {len(grelha)} blocos pendentes; use os filtros para encontrar os restantes.")
+                    grelha = grelha.head(LIMITE_GRELHA)
+
+                # Inside a form: editing cells does not rerun the page
+                with st.form(f"recebimento_lote_{st.session_state.form_counter}"):
+                    editada = st.data_editor(
+                        grelha,
+                        column_config={
+                            "bloco_id": None,
+                            "escuteiro": "Escuteiro",
+                            "seccao": "Secção",
+                            "bloco": "Bloco",
+                            "saldo": st.column_config.NumberColumn("Saldo Pendente", format="%.2f €"),
+                            "valor_recebido": st.column_config.NumberColumn("Valor Recebido (€)", min_value=0.0, step=0.10, format="%.2f"),
+                            "rifas_entregues": st.column_config.NumberColumn("Canhotos", min_value=0, step=1),
+                            "observacoes_canhotos": st.column_config.TextColumn("Obs. Canhotos"),
+                            "metodo_pagamento": st.column_config.SelectboxColumn("Método", options=pagamentos.METODOS_PAGAMENTO),
+                            "data_recebimento": st.column_config.DateColumn("Data", format="DD-MM-YYYY"),
+                        },
+                        disabled=["escuteiro", "seccao", "bloco", "saldo"],
+                        hide_index=True,
+                        use_container_width=True
+                    )
+                    if st.form_submit_button("✅ Registar Lote", type="primary", use_container_width=True):
+                        registar(editada, blocos_lote)
+
+            else:
+                # Template: the pending blocks with the columns to fill in
+                modelo = io.BytesIO()
+                with pd.ExcelWriter(modelo, engine='openpyxl') as writer:
+                    grelha.assign(valor_recebido=None, rifas_entregues=None, data_recebimento=None) \
+                        .to_excel(writer, index=False, sheet_name='Recebimentos')
+                st.download_button(
+                    label="⬇️ Baixar modelo Excel (blocos pendentes)",
+                    data=modelo.getvalue(),
+                    file_name=f"modelo_recebimentos_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+                st.caption(
+                    "Colunas usadas: " + ", ".join(pagamentos.COLUNAS_LOTE) +
+                    ". As restantes (escuteiro, bloco, saldo) são apenas informativas."
+                )
+
+                ficheiro = st.file_uploader(
+                    "Carregar ficheiro de recebimentos", type=['xlsx', 'xls', 'csv'],
+                    key=f"recebimento_lote_ficheiro_{st.session_state.form_counter}"
+                )
+                if ficheiro:
+                    linhas = pagamentos.ler_ficheiro(ficheiro)
+                    if 'bloco_id' not in linhas.columns:
+                        st.error("O ficheiro deve conter a coluna 'bloco_id' (use o modelo).")
+                    else:
+                        st.dataframe(linhas, hide_index=True, use_container_width=True)
+                        if st.button("🚀 Registar Ficheiro", type="primary", use_container_width=True):
+                            registar(linhas, blocos_lote)
+
+    except Exception as e:
+        st.error(f"Erro no registo em lote: {str(e)}")
+
+
 with tab3:
+    render_lote()
+
+# Tab 4: Edit/Delete receipts
+@st.fragment
+def render_editar():
     st.subheader("Editar ou Eliminar Recebimento")
     
     try:
-        response = supabase.table('pagamentos').select(
-            '*, blocos_rifas(numero_inicial, numero_final, preco_bloco, escuteiros(nome))'
-        ).order('data_pagamento', desc=True).execute()
+        recebimentos = db.select(
+            'pagamentos', '*, blocos_rifas(numero_inicial, numero_final, preco_bloco, escuteiros(nome))',
+            order=[('data_pagamento', True)]
+        )
         
-        if response.data:
+        if recebimentos:
             # Create a dictionary for receipt selection
             receipts_list = []
-            for receipt in response.data:
+            for receipt in recebimentos:
                 bloco = receipt.get('blocos_rifas', {})
                 if bloco:
                     escuteiro = bloco.get('escuteiros', {})
@@ -330,15 +498,16 @@ with tab3:
                     st.subheader("Editar Recebimento")
                     
                     # Load blocks for selection
-                    blocks_response = supabase.table('blocos_rifas').select(
-                        'id, numero_inicial, numero_final, preco_bloco, escuteiro_id, escuteiros(nome)'
-                    ).not_.is_('escuteiro_id', 'null').order('numero_inicial').execute()
+                    blocos = db.select(
+                        'blocos_rifas', 'id, numero_inicial, numero_final, preco_bloco, escuteiro_id, escuteiros(nome)',
+                        filters=[('not_is', 'escuteiro_id', None)], order=[('numero_inicial', False)]
+                    )
                     
                     # Create blocks mapping (id-based)
                     blocks_map = {}
                     display_map = {}
                     current_block_id = None
-                    for block in blocks_response.data:
+                    for block in blocos:
                         escuteiro = block.get('escuteiros', {})
                         scout_name = escuteiro.get('nome', 'N/A') if escuteiro else 'N/A'
                         total_rifas = block['numero_final'] - block['numero_inicial'] + 1
@@ -432,13 +601,10 @@ with tab3:
                                 "observacoes": new_observacoes if new_observacoes else None
                             }
                             
-                            response = supabase.table('pagamentos').update(update_data).eq('id', receipt['id']).execute()
+                            updated = db.update('pagamentos', update_data, [('eq', 'id', receipt['id'])])
                             
-                            if response.data:
-                                st.success("✅ Recebimento atualizado com sucesso!")
-                                st.info("🔄 A página será recarregada...")
-                                import time
-                                time.sleep(1.5)
+                            if updated:
+                                avisos.avisar("Recebimento atualizado com sucesso!")
                                 st.rerun()
                             else:
                                 st.error("Erro ao atualizar recebimento.")
@@ -452,14 +618,11 @@ with tab3:
                     
                     if st.button("🗑️ Eliminar", type="secondary", use_container_width=True):
                         try:
-                            response = supabase.table('pagamentos').delete().eq('id', receipt['id']).execute()
+                            deleted = db.delete('pagamentos', [('eq', 'id', receipt['id'])])
                             
-                            if response.data:
-                                st.success("✅ Recebimento eliminado com sucesso!")
-                                st.info("🔄 A página será recarregada...")
+                            if deleted:
+                                avisos.avisar("Recebimento eliminado com sucesso!")
                                 st.session_state.form_counter += 1
-                                import time
-                                time.sleep(1.5)
                                 st.rerun()
                             else:
                                 st.error("Erro ao eliminar recebimento.")
@@ -471,3 +634,92 @@ with tab3:
     
     except Exception as e:
         st.error(f"Erro ao carregar recebimentos: {str(e)}")
+
+
+with tab4:
+    render_editar()
+
+# Tab 5: End-of-campaign reconciliation (utils/reconciliacao.py)
+@st.fragment
+def render_reconciliacao():
+    st.subheader(f"Reconciliação da Campanha: {selected_campanha['nome']}")
+    st.caption(
+        "Compara, para cada bloco atribuído, o valor a pagar (descontando as rifas devolvidas) "
+        "com o dinheiro e os canhotos recebidos."
+    )
+
+    try:
+        reconc = reconciliacao.reconciliar_campanha(selected_campanha['id'])
+
+        if reconc.empty:
+            st.info("Nenhum bloco atribuído nesta campanha.")
+        else:
+            totais = reconciliacao.totais(reconc)
+            col1, col2, col3 = st.columns(3)
+            col1.metric("💶 A Pagar", f"{totais['a_pagar']:.2f} €")
+            col2.metric("💰 Recebido", f"{totais['valor_recebido']:.2f} €")
+            col3.metric("⚖️ Diferença", f"{totais['diferenca']:.2f} €")
+
+            cols = st.columns(len(reconciliacao.ALERTAS))
+            for col, (alerta, rotulo) in zip(cols, reconciliacao.ALERTAS.items()):
+                col.metric(rotulo, totais[alerta])
+
+            vista = st.radio("Ver por", ["Escuteiro", "Secção", "Bloco"], horizontal=True)
+            colunas_dinheiro = {
+                coluna: st.column_config.NumberColumn(rotulo, format="%.2f €")
+                for coluna, rotulo in [('preco_bloco', "Valor Bloco"), ('valor_devolvido', "Devolvido"),
+                                       ('a_pagar', "A Pagar"), ('valor_recebido', "Recebido"),
+                                       ('diferenca', "Diferença")]
+            }
+            rotulos = {
+                "escuteiro": "Escuteiro",
+                "seccao": "Secção",
+                "blocos": "Blocos",
+                "numero_inicial": "Nº Inicial",
+                "numero_final": "Nº Final",
+                "total_rifas": "Rifas",
+                "rifas_devolvidas": "Devolvidas",
+                "rifas_vendidas": "Vendidas",
+                "n_pagamentos": "Recebimentos",
+                "rifas_entregues": "Canhotos",
+                "observacoes_canhotos": "Obs. Canhotos",
+                "situacao": "Situação",
+                **reconciliacao.ALERTAS,
+                **colunas_dinheiro,
+            }
+
+            if vista == "Bloco":
+                situacoes = ['OK', *reconciliacao.ALERTAS.values()]
+                escolhidas = st.multiselect(
+                    "Situação", options=situacoes, default=list(reconciliacao.ALERTAS.values())
+                )
+                tabela = reconc[reconc['situacao'].isin(escolhidas)]
+                tabela = tabela.drop(columns=list(reconciliacao.ALERTAS))
+            else:
+                tabela = reconciliacao.resumo(reconc, 'escuteiro' if vista == "Escuteiro" else 'seccao')
+
+            st.dataframe(tabela, column_config=rotulos, hide_index=True, use_container_width=True)
+
+            # The workbook takes a while for large campaigns: built on request
+            chave_excel = ('reconciliacao_excel', selected_campanha['id'])
+            if st.button("📊 Preparar Excel"):
+                with st.spinner("A preparar o ficheiro..."):
+                    st.session_state['reconciliacao_excel'] = (chave_excel, reconciliacao.exportar_excel(reconc))
+            excel = st.session_state.get('reconciliacao_excel')
+            if excel and excel[0] == chave_excel:
+                st.download_button(
+                    label="📥 Download Reconciliação (Excel)",
+                    data=excel[1],
+                    file_name=f"reconciliacao_{selected_campanha['nome']}_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    type="primary"
+                )
+
+    except Exception as e:
+        st.error(f"Erro ao calcular reconciliação: {str(e)}")
+
+
+with tab5:
+    render_reconciliacao()
+
+render_query_panel()
@@ -3,58 +3,78 @@ from utils.simple_auth import require_password
 import streamlit as st
 if not require_password("5212025"):
     st.stop()
+import io
 import pandas as pd
 from datetime import datetime
 from utils.supabase_client import get_supabase_client
+from utils import data_access as db
+from utils import seletores
+from utils import avisos
+from utils import devolucoes as lote_devolucoes
+from utils.blocos import indice_campanha
+from utils.pagamentos import ler_ficheiro
+from utils.query_log import render_query_panel
 
 st.set_page_config(page_title="Devoluções", page_icon="🔄", layout="wide")
 
 st.title("🔄 Gestão de Devoluções")
+avisos.mostrar()
 
 # Initialize Supabase client
 try:
-    supabase = get_supabase_client()
+    get_supabase_client()
 except ValueError as e:
     st.error(f"Erro ao conectar ao Supabase: {str(e)}")
     st.stop()
 
 # Tabs for different operations
-tab1, tab2, tab3 = st.tabs(["📋 Lista", "➕ Registar Devolução", "✏️ Editar/Eliminar"])
+tab1, tab2, tab3, tab4 = st.tabs(["📋 Lista", "➕ Registar Devolução", "📦 Devolução em Lote", "✏️ Editar/Eliminar"])
 
 # Tab 1: List returns
-with tab1:
+DEVOLUCOES_POR_PAGINA = 50
+
+@st.fragment
+def render_lista():
     st.subheader("Lista de Devoluções")
     
     try:
-        # Check if table exists
-        response = supabase.table('devolucoes').select(
-            '*, escuteiros(nome), blocos_rifas(id, nome, campanha_id)'
-        ).order('data_devolucao', desc=True).execute()
+        campanhas_lista = db.select('campanhas', 'id, nome, ativa', order=[('created_at', True)])
+        campanha_lista = st.selectbox(
+            "🎯 Campanha",
+            options=campanhas_lista,
+            index=next((i for i, c in enumerate(campanhas_lista) if c.get('ativa')), 0),
+            format_func=lambda c: c['nome'],
+            key="devolucoes_lista_campanha"
+        )
+
+        # Keyset pagination on data_devolucao: one cursor per page already
+        # visited (the first page has none), reset when the campaign changes
+        campanha_id = campanha_lista['id'] if campanha_lista else None
+        if st.session_state.get('devolucoes_lista_cursores', (None,))[0] != campanha_id:
+            st.session_state['devolucoes_lista_cursores'] = (campanha_id, [None])
+        cursores = st.session_state['devolucoes_lista_cursores'][1]
+
+        # Filtered by campaign in the database; the campaign name comes from
+        # the same request (campanhas embedded in blocos_rifas)
+        devolucoes, proximo_cursor = db.select_page(
+            'devolucoes', '*, escuteiros(nome), blocos_rifas!inner(id, nome, campanha_id, campanhas(nome))',
+            filters=[('eq', 'blocos_rifas.campanha_id', campanha_id)],
+            column='data_devolucao', after=cursores[-1], size=DEVOLUCOES_POR_PAGINA
+        ) if campanha_id else ([], None)
         
-        if response.data:
-            df = pd.DataFrame(response.data)
+        if devolucoes:
+            df = pd.DataFrame(devolucoes)
 
             # Flatten nested data
-            if 'escuteiros' in df.columns:
-                df['escuteiro_nome'] = df['escuteiros'].apply(lambda x: x['nome'] if x else 'N/A')
-            if 'blocos_rifas' in df.columns:
-                df['bloco_nome'] = df['blocos_rifas'].apply(lambda x: x['nome'] if x else 'N/A')
-
-                # Try to extract campanha_id from nested bloco and fetch campaign names
-                try:
-                    df['campanha_id'] = df['blocos_rifas'].apply(lambda x: x.get('campanha_id') if x and 'campanha_id' in x else None)
-                    campanha_ids = df['campanha_id'].dropna().unique().tolist()
-                    if campanha_ids:
-                        campanhas_resp = supabase.table('campanhas').select('id, nome').in_('id', campanha_ids).execute()
-                        campanhas_map = {c['id']: c['nome'] for c in (campanhas_resp.data or [])}
-                        df['campanha_nome'] = df['campanha_id'].map(campanhas_map).fillna('N/A')
-                    else:
-                        df['campanha_nome'] = 'N/A'
-                except Exception:
-                    df['campanha_nome'] = 'N/A'
+            df['escuteiro_nome'] = df['escuteiros'].apply(lambda x: x['nome'] if x else 'N/A')
+            df['bloco_nome'] = df['blocos_rifas'].apply(lambda x: x['nome'] if x else 'N/A')
+            df['campanha_nome'] = df['blocos_rifas'].apply(
+                lambda x: (x.get('campanhas') or {}).get('nome', 'N/A') if x else 'N/A'
+            )
 
             # Select and reorder columns (include campanha)
-            display_cols = ['data_devolucao', 'escuteiro_nome', 'campanha_nome', 'bloco_nome', 'quantidade', 'motivo', 'id']
+            display_cols = ['data_devolucao', 'escuteiro_nome', 'campanha_nome', 'bloco_nome', 'inicio', 'fim',
+                            'quantidade', 'motivo', 'id']
             df_display = df[[col for col in display_cols if col in df.columns]]
 
             st.dataframe(
@@ -64,6 +84,8 @@ with tab1:
                     "escuteiro_nome": "Escuteiro",
                     "campanha_nome": "Campanha",
                     "bloco_nome": "Bloco de Rifas",
+                    "inicio": st.column_config.NumberColumn("Da Rifa", format="%d"),
+                    "fim": st.column_config.NumberColumn("Até à Rifa", format="%d"),
                     "quantidade": "Quantidade Devolvida",
                     "motivo": "Motivo",
                     "id": "ID"
@@ -72,9 +94,23 @@ with tab1:
                 use_container_width=True
             )
             
-            # Statistics
-            total_devolucoes = len(df)
-            total_rifas_devolvidas = df['quantidade'].sum() if 'quantidade' in df.columns else 0
+            col_anterior, col_pagina, col_seguinte = st.columns([1, 2, 1])
+            col_anterior.button(
+                "⬅️ Mais recentes", disabled=len(cursores) == 1, on_click=cursores.pop, use_container_width=True
+            )
+            col_pagina.caption(f"Página {len(cursores)}")
+            col_seguinte.button(
+                "Mais antigas ➡️", disabled=proximo_cursor is None,
+                on_click=cursores.append, args=(proximo_cursor,), use_container_width=True
+            )
+
+            # Statistics (whole campaign, not just this page)
+            quantidades = db.select(
+                'devolucoes', 'quantidade, blocos_rifas!inner(campanha_id)',
+                filters=[('eq', 'blocos_rifas.campanha_id', campanha_id)]
+            )
+            total_devolucoes = len(quantidades)
+            total_rifas_devolvidas = sum(d.get('quantidade') or 0 for d in quantidades)
             
             col1, col2 = st.columns(2)
             col1.metric("Total de Devoluções", total_devolucoes)
@@ -90,11 +126,11 @@ with tab1:
                     bloco_nome = ld.get('blocos_rifas', {}).get('nome') if ld.get('blocos_rifas') else None
                 except Exception:
                     bloco_nome = None
-                st.success(f"Última devolução registada: {ld.get('quantidade')} rifas | Escuteiro: {esc_nome or 'N/A'} | Bloco: {bloco_nome or 'N/A'} | ID: {ld.get('id')}")
+                st.success(f"Última devolução registada: {ld.get('quantidade')} rifas | Escuteiro: {esc_nome or 'N/A'} | Bloco: {bloco_nome or 'N/A'}" + (f" | ID: {ld['id']}" if ld.get('id') else ""))
                 if st.button("Marcar como lida / Remover destaque"):
                     del st.session_state['last_devolucao']
         else:
-            st.info("Nenhuma devolução registada ainda.")
+            st.info("Nenhuma devolução registada nesta campanha.")
     
     except Exception as e:
         st.warning(f"⚠️ Tabela 'devolucoes' não encontrada ou erro ao carregar: {str(e)}")
@@ -103,23 +139,28 @@ with tab1:
         no Supabase SQL Editor para criar a tabela de devoluções.
         """)
 
+
+with tab1:
+    render_lista()
+
 # Tab 2: Add new return
-with tab2:
+@st.fragment
+def render_registar():
     st.subheader("Registar Nova Devolução")
     
     # Load campaigns, scouts and blocks for selection
     try:
         # Load campaigns to allow filtering by campanha
-        campanhas_response = supabase.table('campanhas').select('*').order('created_at', desc='desc').execute()
+        campanhas = db.select('campanhas', '*', order=[('created_at', True)])
 
         # Default: no campanha selected
         selected_campanha = None
-        if campanhas_response.data:
-            campanhas_dict = {c['nome']: c for c in campanhas_response.data}
+        if campanhas:
+            campanhas_dict = {c['nome']: c for c in campanhas}
 
             # choose default index as active campaign when available
             default_idx = 0
-            for idx, c in enumerate(campanhas_response.data):
+            for idx, c in enumerate(campanhas):
                 if c.get('ativa', False):
                     default_idx = idx
                     break
@@ -139,63 +180,30 @@ with tab2:
             st.warning("⚠️ Nenhuma campanha criada. Crie uma campanha primeiro na página 'Campanhas'.")
             st.stop()
 
-        scouts_response = supabase.table('escuteiros').select('id, nome').order('nome').execute()
+        # Assigned blocks of the campaign with their labels, built once per
+        # version of the data (utils/seletores.py)
+        opcoes_blocos = seletores.blocos_atribuidos(selected_campanha['id'])
 
-        # Fetch blocks only for the selected campaign
-        blocks_response = supabase.table('blocos_rifas').select('id, nome, numero_inicial, numero_final, escuteiro_id, campanha_id').eq('campanha_id', selected_campanha['id']).order('nome').execute()
-
-        if not scouts_response.data:
+        if not db.select_one('escuteiros', 'id'):
             st.warning("⚠️ Não há escuteiros registados. Por favor, adicione escuteiros primeiro.")
-        elif not blocks_response.data:
+        elif not db.select_one('blocos_rifas', 'id', filters=[('eq', 'campanha_id', selected_campanha['id'])]):
             st.warning("⚠️ Não há blocos de rifas criados para a campanha selecionada. Por favor, crie blocos na página de Campanhas.")
         else:
-            # Build selection data outside the form so selection updates immediately
-            blocks_dict = {}
-            display_labels = []
-            id_list = []
-            for block in blocks_response.data:
-                escuteiro_id = block.get('escuteiro_id')
-                if not escuteiro_id:
-                    continue
-                esc = next((s for s in scouts_response.data if s['id'] == escuteiro_id), None)
-                escuteiro_nome = esc['nome'] if esc else 'N/A'
-                display_name = f"{block['nome']} (Rifas {block['numero_inicial']}-{block['numero_final']}) | Escuteiro: {escuteiro_nome}"
-                blocks_dict[block['id']] = block
-                display_labels.append(display_name)
-                id_list.append(block['id'])
-
-            display_map = {bid: lbl for bid, lbl in zip(id_list, display_labels)}
-
-            # Cleanup stale session state value if it doesn't match current options
-            if 'select_bloco_id' in st.session_state and st.session_state.get('select_bloco_id') not in id_list and st.session_state.get('select_bloco_id') is not None:
-                try:
-                    del st.session_state['select_bloco_id']
-                except Exception:
-                    pass
-
-            selected_block_id = None
+            # The picked row comes from memory: no request when a block is selected
+            block = None
             total_rifas = 1
-            if id_list:
+            devolvidas = lote_devolucoes.devolvidas_por_bloco(selected_campanha['id'])
+            if opcoes_blocos:
                 # include a placeholder None option so nothing is selected by default after submit
-                select_options = [None] + id_list
-                selected_block_id = st.selectbox(
-                    "Bloco de Rifas *",
-                    options=select_options,
-                    format_func=lambda bid: "-- Selecione um bloco --" if bid is None else display_map.get(bid, str(bid)),
-                    key="select_bloco_id"
+                block = seletores.seletor(
+                    "Bloco de Rifas *", opcoes_blocos, vazio="-- Selecione um bloco --", key="select_bloco_id"
                 )
+                selected_block_id = block['id'] if block else None
 
-                # Compute block totals immediately so we can sync number_input via session_state
-                if selected_block_id:
-                    block_response = supabase.table('blocos_rifas').select('numero_inicial, numero_final').eq('id', selected_block_id).single().execute()
-                    if block_response.data:
-                        block_tmp = {**blocks_dict[selected_block_id], **block_response.data}
-                    else:
-                        block_tmp = blocks_dict[selected_block_id]
-                    try:
-                        total_rifas = int(block_tmp['numero_final']) - int(block_tmp['numero_inicial']) + 1
-                    except Exception:
-                        total_rifas = 1
+                if block:
+                    # Tickets still to return (partial returns keep the block with the scout)
+                    total_rifas = max(1, int(block['numero_final']) - int(block['numero_inicial']) + 1
+                                      - lote_devolucoes.contar(devolvidas.get(block['id'], [])))
 
                     # If the user changed the selected block, update a stable session_state key for the number input
                     if st.session_state.get('_last_selected_bloco') != selected_block_id:
@@ -203,21 +211,12 @@ with tab2:
                         st.session_state['_last_selected_bloco'] = selected_block_id
 
             with st.form("add_return_form"):
-                # The selection widget is outside the form; read selected id from session_state inside the form
-                # (selected_block_id will still be available from the variable above)
-
-                # Buscar sempre o bloco atualizado do banco (para registrar)
-                block = None
-                if selected_block_id:
-                    block_response = supabase.table('blocos_rifas').select('numero_inicial, numero_final').eq('id', selected_block_id).single().execute()
-                    if block_response.data:
-                        block = {**blocks_dict[selected_block_id], **block_response.data}
-                    else:
-                        block = blocks_dict[selected_block_id]
-
                 # Quantity
                 if block:
-                    st.info(f"📊 Este bloco tem {total_rifas} rifas no total")
+                    ja_devolvidas = lote_devolucoes.contar(devolvidas.get(block['id'], []))
+                    st.info(f"📊 Este bloco tem {total_rifas} rifas por devolver"
+                            + (f" ({ja_devolvidas} já devolvidas)" if ja_devolvidas else "")
+                            + "; são devolvidas as últimas rifas ainda com o escuteiro.")
 
                 # Ensure the initial value never exceeds the computed max (to avoid Streamlit ValueError)
                 initial_qtd = st.session_state.get('qtd_rifas', total_rifas)
@@ -252,85 +251,57 @@ with tab2:
                 submitted = st.form_submit_button("Registar Devolução", type="primary")
 
                 if submitted:
-                    if not selected_block_id:
+                    if not block:
                         st.error("Por favor, selecione um bloco de rifas!")
                     else:
-                        block = blocks_dict[selected_block_id]
                         escuteiro_id = block.get('escuteiro_id')
                         if not escuteiro_id:
                             st.error("Este bloco não está atribuído a nenhum escuteiro. Não é possível registar devolução.")
                         else:
                             try:
-                                block_id = block['id']
+                                # The quantity becomes the ranges of the block's last tickets
+                                # not returned yet (utils/devolucoes.py)
+                                relatorio, registos = lote_devolucoes.validar_lote(
+                                    [{'bloco_id': block['id'], 'quantidade': quantidade}],
+                                    indice_campanha(selected_campanha['id']),
+                                    devolvidas,
+                                    motivo=motivo.strip() if motivo else None,
+                                    data_devolucao=data_devolucao.isoformat()
+                                )
+                                if relatorio[0]['Resultado']:
+                                    raise ValueError(relatorio[0]['Resultado'].removeprefix("❌ "))
                                 payload = {
-                                    "escuteiro_id": escuteiro_id,
-                                    "bloco_id": block_id,
+                                    "bloco_id": block['id'],
+                                    "rifas": ', '.join(f"{r['inicio']}-{r['fim']}" for _, r in registos),
                                     "quantidade": quantidade,
                                     "motivo": motivo.strip() if motivo else None,
                                     "data_devolucao": data_devolucao.isoformat()
                                 }
-                                response = supabase.table('devolucoes').insert(payload).execute()
+                                # Inserts and recomputes the block's state in one transaction
+                                # (scripts/devolucoes_lote.sql)
+                                estados = lote_devolucoes.registar(registos)
                             except Exception as e:
                                 st.error(f"Erro ao registar devolução: {str(e)}")
-                                if "devolucoes" in str(e).lower():
-                                    st.info("Execute o schema SQL completo para criar a tabela 'devolucoes'.")
+                                if "registar_devolucoes" in str(e).lower():
+                                    st.info("Execute o script `scripts/devolucoes_lote.sql` no Supabase.")
                             else:
-                                if response.data:
-                                    # capture the inserted record (supabase returns a list)
-                                    inserted = None
-                                    try:
-                                        if isinstance(response.data, list) and len(response.data) > 0:
-                                            inserted = response.data[0]
-                                        else:
-                                            inserted = response.data
-                                    except Exception:
-                                        inserted = None
-
-                                    st.success(f"✅ Devolução de {quantidade} rifas registada com sucesso!")
-                                    # Optionally update block status
-                                    try:
-                                        supabase.table('blocos_rifas').update({
-                                            'estado': 'devolvido'
-                                        }).eq('id', block_id).execute()
-                                    except Exception:
-                                        pass  # Estado column might not exist
-
-                                    # store the last inserted devolucao in session_state so Lista pode destacar
-                                    if inserted:
-                                        st.session_state['last_devolucao'] = inserted
-
-                                    # Clear form-related session state to avoid leaving old values in the UI
-                                    try:
-                                        st.session_state['qtd_rifas'] = 1
-                                    except Exception:
-                                        pass
-                                    try:
-                                        st.session_state['motivo_devolucao'] = ''
-                                    except Exception:
-                                        pass
-                                    try:
-                                        st.session_state['data_devolucao'] = datetime.now().date()
-                                    except Exception:
-                                        pass
-
-                                    # Remove selection caches so selectbox reinitializes (optional)
-                                    for k in ['_last_selected_bloco']:
-                                        if k in st.session_state:
-                                            try:
-                                                del st.session_state[k]
-                                            except Exception:
-                                                pass
-
-                                    # Also clear the bloco select so dropdown shows no selection
-                                    try:
-                                        st.session_state['select_bloco_id'] = None
-                                    except Exception:
-                                        try:
-                                            del st.session_state['select_bloco_id']
-                                        except Exception:
-                                            pass
-
-                                    # (No immediate rerun here; show summary/actions after the form)
+                                if estados:
+                                    # store the last devolucao in session_state so Lista pode destacar
+                                    st.session_state['last_devolucao'] = {
+                                        **payload,
+                                        **estados[0],
+                                        'escuteiros': db.select_one('escuteiros', 'nome', filters=[('eq', 'id', escuteiro_id)]),
+                                        'blocos_rifas': {'nome': block['nome']},
+                                    }
+
+                                    avisos.avisar(f"Devolução de {quantidade} rifas registada com sucesso!")
+
+                                    # Full rerun so the other tabs show the new return; dropping
+                                    # the widget keys resets the form and the block selection
+                                    for k in ['qtd_rifas', 'motivo_devolucao', 'data_devolucao',
+                                              'select_bloco_id', '_last_selected_bloco']:
+                                        st.session_state.pop(k, None)
+                                    st.rerun()
                                 else:
                                     st.error("Erro ao registar devolução.")
 
@@ -342,6 +313,7 @@ with tab2:
                         'data_devolucao': ld.get('data_devolucao'),
                         'escuteiro': (ld.get('escuteiros') or {}).get('nome') if isinstance(ld.get('escuteiros'), dict) else None,
                         'bloco': (ld.get('blocos_rifas') or {}).get('nome') if isinstance(ld.get('blocos_rifas'), dict) else None,
+                        'rifas': ld.get('rifas'),
                         'quantidade': ld.get('quantidade'),
                         'motivo': ld.get('motivo'),
                         'id': ld.get('id')
@@ -349,36 +321,208 @@ with tab2:
                     st.markdown("---")
                     st.success("Devolução registada — resumo abaixo:")
                     st.dataframe(df_ld, hide_index=True, use_container_width=True)
+                    if ld.get('estado') == 'devolvido':
+                        st.info("📦 Todas as rifas do bloco foram devolvidas: o bloco passou a 'devolvido'.")
+                    elif ld.get('rifas_restantes') is not None:
+                        st.info(f"📦 Devolução parcial: faltam {ld['rifas_restantes']} rifa(s) do bloco.")
                     col_a, col_b = st.columns([1, 1])
                     with col_a:
                         if st.button("Ir para Lista (ver destaque)"):
-                            st.experimental_rerun()
+                            st.rerun()
                     with col_b:
                         if st.button("Limpar resumo"):
-                            try:
-                                del st.session_state['last_devolucao']
-                                st.experimental_rerun()
-                            except Exception:
-                                pass
+                            del st.session_state['last_devolucao']
+                            st.rerun(scope="fragment")
                 except Exception:
                     st.info("Devolução registada com sucesso.")
 
     except Exception as e:
         st.error(f"Erro ao carregar dados: {str(e)}")
 
-# Tab 3: Edit/Delete returns
+
+with tab2:
+    render_registar()
+
+# Tab 3: Bulk returns (ticket ranges, whole blocks or an uploaded file; one batch)
+@st.fragment
+def render_lote():
+    st.subheader("Devolução em Lote")
+    st.caption(
+        "Indique as rifas devolvidas por intervalos, escolha blocos inteiros ou carregue um ficheiro. "
+        "O lote é validado antes de ser gravado e o estado de cada bloco é recalculado: um bloco só "
+        "passa a 'devolvido' quando todas as suas rifas foram devolvidas."
+    )
+
+    # Outcome of the last batch, kept across the rerun that refreshes the lists
+    resultado_lote = st.session_state.pop('devolucoes_lote_resultado', None)
+    if resultado_lote:
+        relatorio_lote, estados_lote = resultado_lote
+        registados = sum(1 for r in relatorio_lote if r['Resultado'] == lote_devolucoes.OK)
+        if registados:
+            completos = sum(1 for e in estados_lote if e['estado'] == 'devolvido')
+            st.success(
+                f"✅ {registados} devolução(ões) registada(s) em {len(estados_lote)} bloco(s); "
+                f"{completos} bloco(s) totalmente devolvido(s)."
+            )
+        if registados < len(relatorio_lote):
+            st.error(f"❌ {len(relatorio_lote) - registados} linha(s) não registada(s).")
+        st.dataframe(pd.DataFrame(relatorio_lote), hide_index=True, use_container_width=True)
+
+    try:
+        campanhas_lote = db.select('campanhas', 'id, nome, ativa', order=[('created_at', True)])
+        campanha_lote = st.selectbox(
+            "🎯 Campanha",
+            options=campanhas_lote,
+            index=next((i for i, c in enumerate(campanhas_lote) if c.get('ativa')), 0),
+            format_func=lambda c: c['nome'],
+            key="devolucoes_lote_campanha"
+        )
+
+        if not campanha_lote:
+            st.warning("⚠️ Nenhuma campanha criada. Crie uma campanha primeiro na página 'Campanhas'.")
+        else:
+            origem = st.radio(
+                "Devolver por", ["Intervalos de rifas", "Blocos inteiros", "Ficheiro Excel/CSV"], horizontal=True
+            )
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                motivo_lote = st.text_input(
+                    "Motivo da Devolução", placeholder="Ex: Rifas não vendidas",
+                    help="Usado nas linhas sem motivo"
+                )
+            with col2:
+                data_lote = st.date_input("Data da Devolução", value=datetime.now().date(), key="data_devolucao_lote")
+
+            pedidos = []
+            if origem == "Intervalos de rifas":
+                texto = st.text_area(
+                    "Rifas devolvidas",
+                    placeholder="Ex: 100-150, 200, 301-310 (separados por vírgula, ponto e vírgula ou linha)",
+                    key="devolucoes_lote_intervalos"
+                )
+                try:
+                    pedidos = [{'inicio': i, 'fim': f} for i, f in lote_devolucoes.interpretar_intervalos(texto)]
+                except ValueError as e:
+                    st.error(f"❌ {e}")
+            elif origem == "Blocos inteiros":
+                opcoes_lote = seletores.blocos_atribuidos(campanha_lote['id'])
+                escolhidos = st.multiselect(
+                    "Blocos (devolve todas as rifas ainda não devolvidas)",
+                    options=opcoes_lote.ids,
+                    format_func=lambda id_: opcoes_lote.rotulos.get(id_, str(id_)),
+                    key="devolucoes_lote_blocos"
+                )
+                pedidos = [{'bloco_id': bloco_id} for bloco_id in escolhidos]
+            else:
+                modelo = io.BytesIO()
+                with pd.ExcelWriter(modelo, engine='openpyxl') as writer:
+                    pd.DataFrame(columns=lote_devolucoes.COLUNAS_LOTE).to_excel(
+                        writer, index=False, sheet_name='Devolucoes'
+                    )
+                st.download_button(
+                    label="⬇️ Baixar modelo Excel",
+                    data=modelo.getvalue(),
+                    file_name="modelo_devolucoes.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+                st.caption(
+                    "Em cada linha indique o bloco_id (e opcionalmente a quantidade: as últimas rifas por "
+                    "devolver; por omissão todas) ou o intervalo inicio-fim. motivo e data_devolucao são opcionais."
+                )
+                ficheiro = st.file_uploader(
+                    "Carregar ficheiro de devoluções", type=['xlsx', 'xls', 'csv'], key="devolucoes_lote_ficheiro"
+                )
+                if ficheiro:
+                    linhas = ler_ficheiro(ficheiro)
+                    if not {'bloco_id', 'inicio'} & set(linhas.columns):
+                        st.error("O ficheiro deve conter a coluna 'bloco_id' ou 'inicio' (use o modelo).")
+                    else:
+                        pedidos = linhas.to_dict('records')
+
+            if pedidos:
+                # Validated in memory: ticket index of the campaign and tickets already returned
+                relatorio, registos = lote_devolucoes.validar_lote(
+                    pedidos,
+                    indice_campanha(campanha_lote['id']),
+                    lote_devolucoes.devolvidas_por_bloco(campanha_lote['id']),
+                    motivo=motivo_lote.strip() or None,
+                    data_devolucao=data_lote.isoformat()
+                )
+                erros = [r for r in relatorio if r['Resultado']]
+                st.dataframe(
+                    pd.DataFrame(relatorio).assign(
+                        Resultado=lambda df: df['Resultado'].fillna("✔️ Válido")
+                    ) if relatorio else pd.DataFrame(),
+                    hide_index=True,
+                    use_container_width=True
+                )
+                st.metric(
+                    "Rifas a devolver",
+                    sum(registo['quantidade'] for _, registo in registos),
+                    help=f"{len({registo['bloco_id'] for _, registo in registos})} bloco(s)"
+                )
+                if erros:
+                    # Nothing is written while the batch has invalid rows
+                    st.error(f"❌ {len(erros)} linha(s) com erros. Corrija-as para poder registar o lote.")
+                if st.button(
+                    "✅ Registar Devoluções", type="primary", use_container_width=True,
+                    disabled=bool(erros) or not registos
+                ):
+                    estados = lote_devolucoes.registar_lote(relatorio, registos)
+                    st.session_state['devolucoes_lote_resultado'] = (relatorio, estados)
+                    for chave in ('devolucoes_lote_intervalos', 'devolucoes_lote_blocos'):
+                        st.session_state.pop(chave, None)
+                    st.rerun()
+
+    except Exception as e:
+        st.error(f"Erro na devolução em lote: {str(e)}")
+
+
 with tab3:
+    render_lote()
+
+# Tab 4: Edit/Delete returns
+@st.fragment
+def render_editar():
     st.subheader("Editar ou Eliminar Devolução")
     
     try:
-        response = supabase.table('devolucoes').select(
-            '*, escuteiros(nome), blocos_rifas(id, nome, campanha_id)'
-        ).order('data_devolucao', desc=True).execute()
-        
-        if response.data:
+        campanhas_editar = db.select('campanhas', 'id, nome, ativa', order=[('created_at', True)])
+        campanha_editar = st.selectbox(
+            "🎯 Campanha",
+            options=campanhas_editar,
+            index=next((i for i, c in enumerate(campanhas_editar) if c.get('ativa')), 0),
+            format_func=lambda c: c['nome'],
+            key="devolucoes_editar_campanha"
+        )
+
+        # Same campaign filter and keyset pages as the Lista tab
+        campanha_id = campanha_editar['id'] if campanha_editar else None
+        if st.session_state.get('devolucoes_editar_cursores', (None,))[0] != campanha_id:
+            st.session_state['devolucoes_editar_cursores'] = (campanha_id, [None])
+        cursores = st.session_state['devolucoes_editar_cursores'][1]
+
+        devolucoes, proximo_cursor = db.select_page(
+            'devolucoes', '*, escuteiros(nome), blocos_rifas!inner(id, nome, campanha_id)',
+            filters=[('eq', 'blocos_rifas.campanha_id', campanha_id)],
+            column='data_devolucao', after=cursores[-1], size=DEVOLUCOES_POR_PAGINA
+        ) if campanha_id else ([], None)
+
+        if devolucoes:
+            col_anterior, col_pagina, col_seguinte = st.columns([1, 2, 1])
+            col_anterior.button(
+                "⬅️ Mais recentes", disabled=len(cursores) == 1, on_click=cursores.pop,
+                use_container_width=True, key="devolucoes_editar_anterior"
+            )
+            col_pagina.caption(f"Página {len(cursores)}")
+            col_seguinte.button(
+                "Mais antigas ➡️", disabled=proximo_cursor is None, on_click=cursores.append,
+                args=(proximo_cursor,), use_container_width=True, key="devolucoes_editar_seguinte"
+            )
+
             # Create a dictionary for return selection
             returns_list = []
-            for ret in response.data:
+            for ret in devolucoes:
                 scout_name = ret.get('escuteiros', {}).get('nome', 'N/A') if ret.get('escuteiros') else 'N/A'
                 block_name = ret.get('blocos_rifas', {}).get('nome', 'N/A') if ret.get('blocos_rifas') else 'N/A'
                 label = f"{ret['data_devolucao'][:10]} - {scout_name} - {block_name} - {ret['quantidade']} rifas ({ret['id'][:8]}...)"
@@ -393,6 +537,7 @@ with tab3:
             
             if selected_return_label:
                 ret = returns_dict[selected_return_label]
+                rifas = f" ({ret['inicio']}-{ret['fim']})" if ret.get('inicio') is not None else ""
                 
                 col1, col2 = st.columns([3, 1])
                 
@@ -401,7 +546,7 @@ with tab3:
                     st.info(f"""
                     **Escuteiro:** {ret.get('escuteiros', {}).get('nome', 'N/A') if ret.get('escuteiros') else 'N/A'}  
                     **Bloco:** {ret.get('blocos_rifas', {}).get('nome', 'N/A') if ret.get('blocos_rifas') else 'N/A'}  
-                    **Quantidade:** {ret['quantidade']} rifas  
+                    **Quantidade:** {ret['quantidade']} rifas{rifas}  
                     **Data:** {ret['data_devolucao'][:10]}  
                     **Motivo:** {ret.get('motivo', 'Não especificado')}
                     """)
@@ -412,13 +557,12 @@ with tab3:
                     
                     if st.button("🗑️ Eliminar Devolução", type="secondary"):
                         try:
-                            response = supabase.table('devolucoes').delete().eq('id', ret['id']).execute()
+                            # Deletes and recomputes the block's state in one transaction
+                            # (the block may no longer be fully returned)
+                            deleted = lote_devolucoes.eliminar([ret['id']])
                             
-                            if response.data:
-                                st.success("✅ Devolução eliminada com sucesso!")
-                                st.info("🔄 A página será recarregada...")
-                                import time
-                                time.sleep(1.5)
+                            if deleted:
+                                avisos.avisar("Devolução eliminada com sucesso!")
                                 st.rerun()
                             else:
                                 st.error("Erro ao eliminar devolução.")
@@ -426,8 +570,14 @@ with tab3:
                         except Exception as e:
                             st.error(f"Erro ao eliminar devolução: {str(e)}")
         else:
-            st.info("Nenhuma devolução disponível para editar.")
+            st.info("Nenhuma devolução disponível para editar nesta campanha.")
     
     except Exception as e:
         st.warning(f"Erro ao carregar devoluções: {str(e)}")
         st.info("Certifique-se de que a tabela 'devolucoes' foi criada na base de dados.")
+
+
+with tab4:
+    render_editar()
+
+render_query_panel()
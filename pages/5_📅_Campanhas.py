@@ -3,20 +3,25 @@ from utils.simple_auth import require_password
 import streamlit as st
 if not require_password("5212025"):
     st.stop()
+import numpy as np
 import pandas as pd
 from datetime import datetime, date
 from utils.supabase_client import get_supabase_client
+from utils import data_access as db
+from utils import avisos
+from utils.query_log import render_query_panel
 
 st.set_page_config(page_title="Campanhas", page_icon="📅", layout="wide")
 
 # Inicializar cliente Supabase
 try:
-    supabase = get_supabase_client()
+    get_supabase_client()
 except Exception as e:
     st.error(f"❌ Erro ao conectar à base de dados: {e}")
     st.stop()
 
 st.title("📅 Gestão de Campanhas")
+avisos.mostrar()
 
 # Tabs para diferentes ações
 tab_list, tab_add, tab_create_blocos, tab_edit = st.tabs(["📋 Lista", "➕ Adicionar Campanha", "🎟️ Criar Blocos de Rifas", "✏️ Editar/Eliminar"])
@@ -24,36 +29,32 @@ tab_list, tab_add, tab_create_blocos, tab_edit = st.tabs(["📋 Lista", "➕ Adi
 # ============================================
 # TAB: LISTA DE CAMPANHAS
 # ============================================
-with tab_list:
+@st.fragment
+def render_lista():
     st.subheader("Lista de Campanhas")
     
     # Buscar campanhas
-    response = supabase.table('campanhas').select('*').order('created_at', desc=True).execute()
+    campanhas = db.select('campanhas', '*', order=[('created_at', True)])
     
-    if response.data:
-        campanhas_df = pd.DataFrame(response.data)
+    if campanhas:
+        campanhas_df = pd.DataFrame(campanhas)
         
-        # Buscar estatísticas de cada campanha
+        # Estatísticas de todas as campanhas numa só consulta agrupada
+        # (scripts/vw_campanhas_stats.sql; em cache até um bloco ser alterado)
+        stats_por_campanha = {s['campanha_id']: s for s in db.select('vw_campanhas_stats', '*')}
+
         stats_list = []
-        for _, campanha in campanhas_df.iterrows():
-            campanha_id = campanha['id']
-            
-            # Contar blocos
-            blocos_response = supabase.table('blocos_rifas').select('id, numero_inicial, numero_final, estado').eq('campanha_id', campanha_id).execute()
-            
-            total_blocos = len(blocos_response.data) if blocos_response.data else 0
-            total_rifas = sum(b['numero_final'] - b['numero_inicial'] + 1 for b in blocos_response.data) if blocos_response.data else 0
-            blocos_vendidos = sum(1 for b in blocos_response.data if b['estado'] == 'vendido') if blocos_response.data else 0
-            
+        for campanha in campanhas:
+            stats = stats_por_campanha.get(campanha['id'], {})
             stats_list.append({
                 'Campanha': campanha['nome'],
                 'Descrição': campanha['descricao'] or '-',
                 'Data Início': campanha['data_inicio'],
                 'Data Fim': campanha['data_fim'],
                 'Ativa': '✅ Sim' if campanha['ativa'] else '❌ Não',
-                'Total Blocos': total_blocos,
-                'Total Rifas': total_rifas,
-                'Blocos Vendidos': blocos_vendidos
+                'Total Blocos': int(stats.get('total_blocos') or 0),
+                'Total Rifas': int(stats.get('total_rifas') or 0),
+                'Blocos Vendidos': int(stats.get('blocos_vendidos') or 0)
             })
         
         stats_df = pd.DataFrame(stats_list)
@@ -80,17 +81,17 @@ with tab_list:
     else:
         st.info("ℹ️ Nenhuma campanha cadastrada ainda")
 
+
+with tab_list:
+    render_lista()
+
 # ============================================
 # TAB: ADICIONAR CAMPANHA
 # ============================================
-with tab_add:
+@st.fragment
+def render_adicionar():
     st.subheader("➕ Adicionar Nova Campanha")
     
-    # Mostrar mensagem de sucesso se houver
-    if 'campanha_criada' in st.session_state:
-        st.success(f"✅ Campanha '{st.session_state.campanha_criada}' criada com sucesso!")
-        del st.session_state['campanha_criada']
-    
     with st.form("form_adicionar_campanha", clear_on_submit=True):
         col1, col2 = st.columns(2)
         
@@ -121,11 +122,11 @@ with tab_add:
                         'ativa': ativa
                     }
                     
-                    response = supabase.table('campanhas').insert(campanha_data).execute()
+                    inserted = db.insert('campanhas', campanha_data)
                     
-                    if response.data:
+                    if inserted:
                         # Guardar mensagem de sucesso e fazer rerun para limpar formulário
-                        st.session_state['campanha_criada'] = nome
+                        avisos.avisar(f"Campanha '{nome}' criada com sucesso!")
                         st.rerun()
                     else:
                         st.error("❌ Erro ao criar campanha")
@@ -135,21 +136,26 @@ with tab_add:
                     else:
                         st.error(f"❌ Erro ao criar campanha: {e}")
 
+
+with tab_add:
+    render_adicionar()
+
 # ============================================
 # TAB: CRIAR BLOCOS DE RIFAS
 # ============================================
-with tab_create_blocos:
+@st.fragment
+def render_criar_blocos():
     st.subheader("🎟️ Criar Blocos de Rifas Automaticamente")
     
     # Buscar campanhas
-    campanhas_response = supabase.table('campanhas').select('*').order('created_at', desc=True).execute()
+    campanhas = db.select('campanhas', '*', order=[('created_at', True)])
     
-    if campanhas_response.data:
+    if campanhas:
         st.info("💡 **Dica:** Crie blocos de rifas automaticamente para uma campanha. Os blocos ficarão disponíveis para atribuição posterior aos escuteiros.")
         
         with st.form("form_criar_blocos"):
             # Selecionar campanha
-            campanhas_dict = {c['nome']: c['id'] for c in campanhas_response.data}
+            campanhas_dict = {c['nome']: c['id'] for c in campanhas}
             campanha_selecionada = st.selectbox(
                 "Campanha *",
                 options=list(campanhas_dict.keys()),
@@ -205,63 +211,67 @@ with tab_create_blocos:
                     try:
                         campanha_id = campanhas_dict[campanha_selecionada]
                         
-                        # Criar blocos
-                        blocos_criados = 0
-                        numero_atual = 1
-                        
-                        with st.spinner(f"Criando {num_blocos} blocos..."):
-                            for i in range(num_blocos):
-                                numero_inicial = numero_atual
-                                numero_final = numero_atual + rifas_por_bloco - 1
-
-                                # Calcular preco_unitario (preço por rifa) e gravar ambos
-                                try:
-                                    preco_unitario = float(preco_bloco) / float(rifas_por_bloco) if rifas_por_bloco and rifas_por_bloco > 0 else 0.0
-                                except Exception:
-                                    preco_unitario = 0.0
-
-                                bloco_data = {
-                                    "campanha_id": campanha_id,
-                                    "nome": f"Bloco {numero_inicial}-{numero_final}",
-                                    "numero_inicial": numero_inicial,
-                                    "numero_final": numero_final,
-                                    "preco_bloco": preco_bloco,
-                                    "preco_unitario": preco_unitario,
-                                    "estado": "disponivel",
-                                    "escuteiro_id": None,
-                                    "seccao": None
-                                }
-
-                                response = supabase.table('blocos_rifas').insert(bloco_data).execute()
+                        # Gerar todos os blocos em memória (numeração vetorizada)
+                        numeros_iniciais = np.arange(num_blocos, dtype=np.int64) * rifas_por_bloco + 1
+                        numeros_finais = numeros_iniciais + rifas_por_bloco - 1
+                        preco_unitario = float(preco_bloco) / float(rifas_por_bloco)
+                        blocos_novos = [
+                            {
+                                "campanha_id": campanha_id,
+                                "nome": f"Bloco {inicio}-{fim}",
+                                "numero_inicial": inicio,
+                                "numero_final": fim,
+                                "preco_bloco": preco_bloco,
+                                "preco_unitario": preco_unitario,
+                                "estado": "disponivel",
+                                "escuteiro_id": None,
+                                "seccao": None
+                            }
+                            for inicio, fim in zip(numeros_iniciais.tolist(), numeros_finais.tolist())
+                        ]
 
-                                if response.data:
-                                    blocos_criados += 1
+                        # Inserção em lotes; se um lote falhar, os já inseridos são removidos (tudo ou nada)
+                        progresso = st.progress(0.0, text=f"A criar {num_blocos} blocos...")
+                        db.insert_many(
+                            'blocos_rifas', blocos_novos,
+                            on_progress=lambda feitos, total: progresso.progress(
+                                feitos / total, text=f"A criar blocos... {feitos}/{total}"
+                            )
+                        )
+                        progresso.empty()
 
-                                numero_atual = numero_final + 1
-                        
-                        if blocos_criados == num_blocos:
-                            st.success(f"✅ {blocos_criados} blocos criados com sucesso para a campanha '{campanha_selecionada}'!")
-                            st.info("💡 Agora pode atribuir os blocos aos escuteiros na página 'Blocos de Rifas'.")
-                            st.rerun()
-                        else:
-                            st.warning(f"⚠️ Apenas {blocos_criados} de {num_blocos} blocos foram criados.")
+                        avisos.avisar(f"{num_blocos} blocos criados com sucesso para a campanha '{campanha_selecionada}'!")
+                        avisos.avisar("Agora pode atribuir os blocos aos escuteiros na página 'Blocos de Rifas'.", 'info')
+                        st.rerun()
                     
                     except Exception as e:
-                        st.error(f"❌ Erro ao criar blocos: {e}")
+                        por_remover = getattr(e, 'leftover_ids', [])
+                        if por_remover:
+                            st.error(
+                                f"❌ Erro ao criar blocos: {e}. {len(por_remover)} bloco(s) já criados não "
+                                f"puderam ser removidos; elimine-os na página 'Blocos de Rifas'."
+                            )
+                        else:
+                            st.error(f"❌ Erro ao criar blocos (nenhum bloco foi criado): {e}")
     else:
         st.warning("⚠️ Crie primeiro uma campanha antes de criar blocos de rifas!")
 
+
+with tab_create_blocos:
+    render_criar_blocos()
+
 # ============================================
 # TAB: EDITAR/ELIMINAR CAMPANHA
 # ============================================
-with tab_edit:
+@st.fragment
+def render_editar():
     st.subheader("✏️ Editar ou Eliminar Campanha")
     
     # Buscar campanhas
-    response = supabase.table('campanhas').select('*').order('created_at', desc=True).execute()
+    campanhas = db.select('campanhas', '*', order=[('created_at', True)])
     
-    if response.data:
-        campanhas_list = [(c['nome'], c['id']) for c in response.data]
+    if campanhas:
+        campanhas_list = [(c['nome'], c['id']) for c in campanhas]
         campanha_selecionada = st.selectbox(
             "Selecione a Campanha",
             options=campanhas_list,
@@ -270,7 +280,7 @@ with tab_edit:
         
         if campanha_selecionada:
             campanha_id = campanha_selecionada[1]
-            campanha_data = next(c for c in response.data if c['id'] == campanha_id)
+            campanha_data = next(c for c in campanhas if c['id'] == campanha_id)
             
             col1, col2 = st.columns([3, 1])
             
@@ -302,13 +312,9 @@ with tab_edit:
                                 'ativa': nova_ativa
                             }
                             
-                            supabase.table('campanhas').update(update_data).eq('id', campanha_id).execute()
+                            db.update('campanhas', update_data, [('eq', 'id', campanha_id)])
                             
-                            st.success(f"✅ Campanha '{novo_nome}' atualizada com sucesso!")
-                            st.info("🔄 A página será recarregada...")
-                            
-                            import time
-                            time.sleep(1.5)
+                            avisos.avisar(f"Campanha '{novo_nome}' atualizada com sucesso!")
                             st.rerun()
                         except Exception as e:
                             st.error(f"❌ Erro ao atualizar: {e}")
@@ -334,13 +340,11 @@ with tab_edit:
                         with col_sim:
                             if st.button("✅ Sim", use_container_width=True, key=f"confirm_sim_{campanha_id}"):
                                 try:
-                                    supabase.table('campanhas').delete().eq('id', campanha_id).execute()
-                                    msg_placeholder.success(f"✅ Campanha '{campanha_data['nome']}' eliminada com sucesso!")
-                                    msg_placeholder.info("🔄 A página será recarregada...")
+                                    db.delete('campanhas', [('eq', 'id', campanha_id)])
+                                    # ON DELETE CASCADE also removed the campaign's blocks and payments
+                                    db.invalidate()
+                                    avisos.avisar(f"Campanha '{campanha_data['nome']}' eliminada com sucesso!")
                                     del st.session_state['confirmar_eliminacao']
-
-                                    import time
-                                    time.sleep(1.2)
                                     st.rerun()
                                 except Exception as e:
                                     msg_placeholder.error(f"❌ Erro: {e}")
@@ -348,6 +352,12 @@ with tab_edit:
                         with col_nao:
                             if st.button("❌ Não", use_container_width=True, key=f"confirm_nao_{campanha_id}"):
                                 del st.session_state['confirmar_eliminacao']
-                                st.experimental_rerun()
+                                st.rerun(scope="fragment")
     else:
         st.info("ℹ️ Nenhuma campanha disponível para editar")
+
+
+with tab_edit:
+    render_editar()
+
+render_query_panel()
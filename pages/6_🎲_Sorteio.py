@@ -0,0 +1,181 @@
+from utils.simple_auth import require_password
+import streamlit as st
+if not require_password("5212025"):
+    st.stop()
+import pandas as pd
+from utils.supabase_client import get_supabase_client
+from utils import data_access as db
+from utils import sorteio
+from utils.blocos import indice_campanha
+from utils.query_log import render_query_panel
+
+st.set_page_config(page_title="Sorteio", page_icon="🎲", layout="wide")
+
+st.title("🎲 Sorteio")
+
+# Initialize Supabase client
+try:
+    get_supabase_client()
+except ValueError as e:
+    st.error(f"Erro ao conectar ao Supabase: {str(e)}")
+    st.stop()
+
+
+def tabela_vencedores(campanha_id, vencedores):
+    """Prémio, número, bloco, escuteiro e secção de cada rifa vencedora."""
+    indice = indice_campanha(campanha_id)
+    linhas = []
+    for premio, numero in enumerate(vencedores, start=1):
+        blocos = indice.procurar(numero)
+        bloco = blocos[0] if blocos else {}
+        linhas.append({
+            'premio': premio,
+            'numero': numero,
+            'bloco': f"{bloco['numero_inicial']}-{bloco['numero_final']}" if bloco else '',
+            'escuteiro_id': bloco.get('escuteiro_id'),
+            'seccao': bloco.get('seccao') or '',
+        })
+    df = pd.DataFrame(linhas)
+    ids = df['escuteiro_id'].dropna().unique().tolist()
+    nomes = {e['id']: e['nome'] for e in db.select('escuteiros', 'id, nome', filters=[('in', 'id', ids)])} if ids else {}
+    df['escuteiro'] = df['escuteiro_id'].map(nomes).fillna('')
+    return df[['premio', 'numero', 'escuteiro', 'seccao', 'bloco']]
+
+
+COLUNAS_VENCEDORES = {
+    "premio": "Prémio",
+    "numero": "Nº da Rifa",
+    "escuteiro": "Escuteiro",
+    "seccao": "Secção",
+    "bloco": "Bloco",
+}
+
+# Campaign selector
+try:
+    campanhas = db.select('campanhas', '*', order=[('created_at', True)])
+    if not campanhas:
+        st.warning("⚠️ Nenhuma campanha criada. Crie uma campanha primeiro na página 'Campanhas'.")
+        st.stop()
+    campanhas_dict = {c['nome']: c for c in campanhas}
+    default_idx = next((i for i, c in enumerate(campanhas) if c.get('ativa')), 0)
+    selected_campanha = campanhas_dict[st.selectbox(
+        "🎯 Campanha", options=list(campanhas_dict.keys()), index=default_idx
+    )]
+except Exception as e:
+    st.error(f"Erro ao carregar campanhas: {str(e)}")
+    st.stop()
+
+tab1, tab2 = st.tabs(["🎲 Novo Sorteio", "📜 Sorteios Realizados"])
+
+# Tab 1: New draw
+@st.fragment
+def render_novo_sorteio():
+    st.info("""
+    O sorteio escolhe os vencedores entre as rifas atribuídas a escuteiros, excluindo as devolvidas
+    (as rifas de cada devolução; as devoluções antigas, registadas só com a quantidade, retiram as
+    últimas rifas do bloco) e as marcadas como devolvidas/perdidas.
+    O resultado depende apenas da semente: fica registado e pode ser verificado mais tarde.
+    """)
+
+    # Semente sugerida (renovada depois de cada sorteio)
+    if 'sorteio_semente_sugerida' not in st.session_state:
+        st.session_state['sorteio_semente_sugerida'] = sorteio.gerar_semente()
+
+    with st.form("sorteio_form"):
+        criterio = st.radio(
+            "Rifas elegíveis", options=list(sorteio.CRITERIOS), format_func=sorteio.CRITERIOS.get, horizontal=True
+        )
+        n_premios = st.number_input("Número de prémios", min_value=1, value=3, step=1)
+        semente = st.text_input(
+            "Semente",
+            value=st.session_state['sorteio_semente_sugerida'],
+            help="Pode usar um valor anunciado antes do sorteio (ex.: números de um sorteio público)."
+        )
+        observacoes = st.text_input("Observações (opcional)")
+        submitted = st.form_submit_button("🎲 Realizar Sorteio", type="primary")
+
+    if submitted:
+        if not semente.strip():
+            st.error("❌ Indique uma semente.")
+        else:
+            try:
+                registo = sorteio.registar_sorteio(
+                    selected_campanha['id'], criterio, int(n_premios), semente.strip(), observacoes or None
+                )
+                st.session_state['sorteio_semente_sugerida'] = sorteio.gerar_semente()
+                # Full rerun so "Sorteios Realizados" lists the new draw; the
+                # result is shown again from session_state
+                st.session_state['sorteio_resultado'] = registo
+                st.rerun()
+            except ValueError as e:
+                st.error(f"❌ {str(e)}")
+            except Exception as e:
+                st.error(f"Erro ao realizar sorteio: {str(e)}")
+
+    registo = st.session_state.pop('sorteio_resultado', None)
+    if registo:
+        st.success(f"✅ Sorteio realizado entre {registo['total_rifas']} rifas elegíveis.")
+        st.dataframe(
+            tabela_vencedores(registo['campanha_id'], registo['vencedores']),
+            column_config=COLUNAS_VENCEDORES,
+            hide_index=True,
+            use_container_width=True
+        )
+        st.caption(f"Semente: `{registo['semente']}` · Impressão digital: `{registo['impressao_digital']}`")
+
+
+with tab1:
+    render_novo_sorteio()
+
+# Tab 2: Recorded draws
+@st.fragment
+def render_sorteios():
+    try:
+        sorteios = db.select(
+            'sorteios', '*', filters=[('eq', 'campanha_id', selected_campanha['id'])], order=[('created_at', True)]
+        )
+        if not sorteios:
+            st.info("Nenhum sorteio realizado nesta campanha.")
+        else:
+            opcoes = {
+                f"{pd.to_datetime(s['created_at'], format='ISO8601').strftime('%d-%m-%Y %H:%M')} · "
+                f"{s['n_premios']} prémio(s) · {sorteio.CRITERIOS.get(s['criterio'], s['criterio'])}": s
+                for s in sorteios
+            }
+            escolhido = opcoes[st.selectbox("Sorteio", options=list(opcoes.keys()))]
+
+            st.dataframe(
+                tabela_vencedores(selected_campanha['id'], escolhido['vencedores']),
+                column_config=COLUNAS_VENCEDORES,
+                hide_index=True,
+                use_container_width=True
+            )
+            st.caption(
+                f"Semente: `{escolhido['semente']}` · {escolhido['total_rifas']} rifas elegíveis · "
+                f"Impressão digital: `{escolhido['impressao_digital']}`"
+            )
+            if escolhido.get('observacoes'):
+                st.caption(f"Observações: {escolhido['observacoes']}")
+
+            if st.button("🔍 Verificar Sorteio"):
+                confere, populacao_igual, vencedores = sorteio.verificar_sorteio(escolhido)
+                if confere and populacao_igual:
+                    st.success("✅ Verificado: a mesma semente sobre as mesmas rifas dá os mesmos vencedores.")
+                elif confere:
+                    st.warning("⚠️ Os vencedores conferem, mas as rifas elegíveis mudaram desde o sorteio.")
+                elif populacao_igual:
+                    st.error("❌ As rifas elegíveis são as mesmas mas os vencedores não conferem!")
+                else:
+                    st.warning(
+                        "⚠️ As rifas elegíveis mudaram desde o sorteio (novas atribuições ou devoluções), "
+                        "por isso não é possível repetir o resultado com os dados atuais."
+                    )
+                    st.caption(f"Vencedores com os dados atuais: {', '.join(map(str, vencedores))}")
+    except Exception as e:
+        st.error(f"Erro ao carregar sorteios: {str(e)}")
+
+
+with tab2:
+    render_sorteios()
+
+render_query_panel()
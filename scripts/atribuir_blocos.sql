@@ -0,0 +1,54 @@
+-- scripts/atribuir_blocos.sql
+--
+-- Função RPC usada na importação de atribuições a partir de Excel
+-- (pages/2_🎟️_Blocos_de_Rifas.py, tab "Importar Atribuições").
+--
+-- Recebe uma lista de atribuições ({id, escuteiro_id, seccao,
+-- data_atribuicao, observacoes}) e atualiza os blocos da campanha numa única
+-- instrução (UPDATE ... FROM jsonb_populate_recordset). Só são escritas estas
+-- colunas: o estado, o estado das rifas, os preços e o resto do bloco ficam
+-- como estão na base de dados, mesmo que tenham mudado depois de a página
+-- ler os blocos. seccao e observacoes vazias mantêm o valor atual.
+-- Devolve os ids pedidos que não foram encontrados na campanha.
+--
+-- Execução: copie este conteúdo para o SQL Editor do Supabase e execute.
+-- O script é idempotente (pode ser executado várias vezes).
+--
+-- Uso (PostgREST / supabase-py):
+--   supabase.rpc('atribuir_blocos', {'p_campanha_id': '<uuid>', 'p_atribuicoes': [
+--       {'id': '<uuid bloco>', 'escuteiro_id': '<uuid>', 'seccao': 'Lobitos',
+--        'data_atribuicao': '2025-05-01', 'observacoes': null},
+--       ...
+--   ]}).execute()
+
+BEGIN;
+
+SET search_path = public;
+
+CREATE OR REPLACE FUNCTION public.atribuir_blocos(p_campanha_id uuid, p_atribuicoes jsonb)
+RETURNS TABLE (bloco_id uuid)
+LANGUAGE sql
+AS $$
+  WITH a AS (
+    -- Cada campo convertido para o tipo da coluna de blocos_rifas
+    SELECT * FROM jsonb_populate_recordset(NULL::blocos_rifas, p_atribuicoes)
+  ),
+  atualizados AS (
+    UPDATE blocos_rifas b
+       SET escuteiro_id = a.escuteiro_id,
+           seccao = coalesce(a.seccao, b.seccao),
+           data_atribuicao = coalesce(a.data_atribuicao, b.data_atribuicao),
+           observacoes = coalesce(a.observacoes, b.observacoes)
+      FROM a
+     WHERE b.id = a.id
+       AND b.campanha_id = p_campanha_id
+    RETURNING b.id
+  )
+  SELECT a.id FROM a WHERE a.id NOT IN (SELECT u.id FROM atualizados u);
+$$;
+
+GRANT EXECUTE ON FUNCTION public.atribuir_blocos(uuid, jsonb) TO anon, authenticated;
+
+COMMIT;
+
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,33 @@
+-- scripts/backfill_seccao_escuteiros.sql
+--
+-- Migração única: guarda a secção de cada escuteiro em escuteiros.seccao.
+--
+-- Em bases de dados antigas a secção só existia nos blocos atribuídos
+-- (blocos_rifas.seccao) e a lista de escuteiros tinha de a procurar bloco a
+-- bloco. Este script cria a coluna (se faltar) e preenche-a numa única
+-- instrução, com a secção do bloco atribuído mais recentemente a cada
+-- escuteiro. Secções já preenchidas não são alteradas.
+--
+-- Execução: copie este conteúdo para o SQL Editor do Supabase e execute.
+-- O script é idempotente (pode ser executado várias vezes).
+
+BEGIN;
+
+SET search_path = public;
+
+ALTER TABLE escuteiros ADD COLUMN IF NOT EXISTS seccao TEXT;
+
+UPDATE escuteiros e
+SET seccao = b.seccao
+FROM (
+  SELECT DISTINCT ON (escuteiro_id) escuteiro_id, seccao
+  FROM blocos_rifas
+  WHERE escuteiro_id IS NOT NULL AND seccao IS NOT NULL AND seccao <> ''
+  ORDER BY escuteiro_id, data_atribuicao DESC NULLS LAST, created_at DESC
+) b
+WHERE e.id = b.escuteiro_id
+  AND (e.seccao IS NULL OR e.seccao = '');
+
+COMMIT;
+
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Benchmark das páginas da aplicação contra o backend SQLite local (sem rede).
+
+Executa cada página com o ``streamlit.testing`` (AppTest) duas vezes — a
+primeira com a cache de leituras vazia (fria) e a segunda já com a cache
+preenchida (quente) — e mostra o tempo de cada execução.
+
+Uso:
+    python scripts/seed_local_db.py --blocos 100000 --path bench.db
+    python scripts/benchmark.py --path bench.db
+"""
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def run_page(script, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(script, default_timeout=timeout)
+    at.session_state['authenticated'] = True
+    inicio = time.perf_counter()
+    at.run()
+    duracao = time.perf_counter() - inicio
+    erros = [e.value for e in at.exception] + [e.value for e in at.error]
+    return duracao, erros
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--path', default='bench.db', help='base de dados SQLite (criada com seed_local_db.py)')
+    parser.add_argument('--blocos', type=int, default=100_000, help='blocos a gerar se a base não existir')
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--pagina', action='append', help='limitar a páginas cujo nome contém este texto')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        from seed_local_db import seed
+        print(f"A gerar {args.blocos} blocos em {args.path}...")
+        seed(args.path, args.blocos, 10, 300, 0.8, 0.6, 0.05, 42)
+
+    os.environ['RIFAS_BACKEND'] = 'sqlite'
+    os.environ['RIFAS_SQLITE_PATH'] = os.path.abspath(args.path)
+    os.chdir(ROOT)
+
+    # Avisos de depreciação/contexto do Streamlit não interessam aqui
+    logging.disable(logging.CRITICAL)
+    from utils import data_access as db
+
+    paginas = sorted(glob.glob(os.path.join(ROOT, 'pages', '*.py')))
+    if args.pagina:
+        paginas = [p for p in paginas if any(f in p for f in args.pagina)]
+
+    print(f"{'Página':<40} {'fria (s)':>10} {'quente (s)':>11}")
+    for pagina in paginas:
+        db.invalidate()
+        fria, erros = run_page(pagina, args.timeout)
+        quente, erros_quente = run_page(pagina, args.timeout)
+        print(f"{os.path.basename(pagina):<40} {fria:>10.3f} {quente:>11.3f}")
+        for erro in (erros + erros_quente)[:3]:
+            print(f"   ⚠️ {str(erro)[:200]}")
+
+
+if __name__ == '__main__':
+    main()
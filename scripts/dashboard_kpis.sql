@@ -0,0 +1,80 @@
+-- scripts/dashboard_kpis.sql
+--
+-- Função RPC usada pelo Dashboard (src/dashboard.py).
+--
+-- Calcula no servidor todos os indicadores da página (contagens por estado,
+-- rifas atribuídas, valor recebido, saldo pendente, série diária de
+-- recebimentos e top escuteiros) e devolve um único objeto JSON com poucas
+-- centenas de bytes, em vez de o Streamlit descarregar todas as linhas de
+-- blocos_rifas e pagamentos.
+--
+-- O saldo pendente vem da tabela saldos_blocos: execute primeiro
+-- scripts/saldos.sql.
+--
+-- Execução: copie este conteúdo para o SQL Editor do Supabase e execute.
+-- O script é idempotente (pode ser executado várias vezes).
+--
+-- Uso (PostgREST / supabase-py):
+--   supabase.rpc('dashboard_kpis', {'p_campanha_id': '<uuid>' | None}).execute()
+
+BEGIN;
+
+SET search_path = public;
+
+-- Índices usados pelos filtros/joins da função
+CREATE INDEX IF NOT EXISTS idx_blocos_rifas_campanha ON blocos_rifas(campanha_id);
+CREATE INDEX IF NOT EXISTS idx_pagamentos_bloco ON pagamentos(bloco_id);
+
+CREATE OR REPLACE FUNCTION public.dashboard_kpis(p_campanha_id uuid DEFAULT NULL)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+AS $$
+  WITH b AS (
+    SELECT id, escuteiro_id, estado, numero_inicial, numero_final
+    FROM blocos_rifas
+    WHERE p_campanha_id IS NULL OR campanha_id = p_campanha_id
+  ),
+  p AS (
+    SELECT pg.bloco_id, pg.valor_pago, pg.quantidade_rifas, pg.canhotos_entregues,
+           pg.data_pagamento, b.escuteiro_id
+    FROM pagamentos pg
+    JOIN b ON b.id = pg.bloco_id
+  )
+  SELECT jsonb_build_object(
+    'total_escuteiros', (SELECT count(*) FROM escuteiros),
+    'total_blocos', (SELECT count(*) FROM b),
+    'estados', COALESCE((
+        SELECT jsonb_object_agg(estado, n)
+        FROM (SELECT COALESCE(estado, 'desconhecido') AS estado, count(*) AS n FROM b GROUP BY 1) s
+      ), '{}'::jsonb),
+    'blocos_atribuidos', (SELECT count(*) FROM b WHERE estado = 'atribuido'),
+    'rifas_atribuidas', (SELECT COALESCE(sum(numero_final - numero_inicial + 1), 0) FROM b WHERE estado = 'atribuido'),
+    'blocos_com_pagamento', (SELECT count(DISTINCT bloco_id) FROM p),
+    'rifas_confirmadas', (SELECT COALESCE(sum(COALESCE(quantidade_rifas, canhotos_entregues, 0)), 0) FROM p),
+    'valor_recebido', (SELECT COALESCE(sum(valor_pago), 0) FROM p),
+    'saldo_pendente', (SELECT COALESCE(sum(s.saldo), 0) FROM saldos_blocos s
+                       WHERE s.escuteiro_id IS NOT NULL
+                         AND (p_campanha_id IS NULL OR s.campanha_id = p_campanha_id)),
+    'recebimentos_diarios', COALESCE((
+        SELECT jsonb_agg(jsonb_build_object('data', d, 'valor', v) ORDER BY d)
+        FROM (SELECT data_pagamento::date AS d, sum(valor_pago) AS v
+              FROM p WHERE data_pagamento IS NOT NULL GROUP BY 1) s
+      ), '[]'::jsonb),
+    'top_escuteiros', COALESCE((
+        SELECT jsonb_agg(jsonb_build_object('nome', nome, 'valor_pago', v, 'quantidade_rifas', q) ORDER BY v DESC)
+        FROM (SELECT COALESCE(e.nome, 'Desconhecido') AS nome,
+                     sum(p.valor_pago) AS v,
+                     COALESCE(sum(p.quantidade_rifas), 0) AS q
+              FROM p LEFT JOIN escuteiros e ON e.id = p.escuteiro_id
+              GROUP BY 1 ORDER BY 2 DESC LIMIT 10) s
+      ), '[]'::jsonb)
+  );
+$$;
+
+GRANT EXECUTE ON FUNCTION public.dashboard_kpis(uuid) TO anon, authenticated;
+
+COMMIT;
+
+-- Pede ao PostgREST para recarregar o schema (a função fica logo disponível)
+NOTIFY pgrst, 'reload schema';
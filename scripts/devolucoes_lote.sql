@@ -0,0 +1,215 @@
+-- scripts/devolucoes_lote.sql
+--
+-- Devoluções em lote (pages/4_🔄_Devoluções.py, tab "Devolução em Lote") e
+-- estado automático dos blocos com devoluções parciais.
+--
+-- Cada devolução guarda as rifas devolvidas (colunas inicio/fim, um
+-- intervalo dentro do bloco; quantidade = fim - inicio + 1), para que a
+-- mesma rifa não possa ser devolvida duas vezes e o sorteio
+-- (utils/sorteio.py) exclua exatamente as rifas devolvidas. As devoluções
+-- antigas, só com a quantidade, recebem as últimas rifas do bloco (a regra
+-- usada até aqui).
+--
+-- registar_devolucoes(p_devolucoes) recebe uma lista de devoluções
+-- ({bloco_id, inicio, fim, motivo, data_devolucao}), bloqueia os blocos
+-- envolvidos, valida-as todas de uma vez (bloco atribuído, intervalo dentro
+-- do bloco, rifas ainda não devolvidas nem repetidas no lote) e insere-as
+-- numa única instrução. Na mesma transação recalcula o estado dos blocos.
+--
+-- eliminar_devolucoes(p_ids) elimina devoluções e recalcula o estado dos
+-- respetivos blocos na mesma transação.
+--
+-- recalcular_estado_blocos(p_blocos) recalcula o estado de um conjunto de
+-- blocos numa única instrução:
+--   - todas as rifas devolvidas       -> 'devolvido'
+--   - devolução parcial               -> o estado não muda (o bloco continua
+--                                        com o escuteiro)
+--   - 'devolvido' que deixou de o ser -> 'atribuido' (ou 'disponivel' sem
+--                                        escuteiro)
+-- As três devolvem, por bloco, o estado, as rifas devolvidas e as restantes.
+--
+-- A validação em memória feita antes do envio está em utils/devolucoes.py;
+-- manter as regras em sincronia. Os saldos (scripts/saldos.sql) são
+-- atualizados pelos respetivos triggers na mesma transação.
+--
+-- Execução: copie este conteúdo para o SQL Editor do Supabase e execute.
+-- O script é idempotente (pode ser executado várias vezes).
+--
+-- Uso (PostgREST / supabase-py):
+--   supabase.rpc('registar_devolucoes', {'p_devolucoes': [
+--       {'bloco_id': '<uuid>', 'inicio': 101, 'fim': 105, 'motivo': 'Não vendidas', 'data_devolucao': '2025-05-31'},
+--       ...
+--   ]}).execute()
+--   supabase.rpc('eliminar_devolucoes', {'p_ids': ['<uuid>', ...]}).execute()
+--   supabase.rpc('recalcular_estado_blocos', {'p_blocos': ['<uuid>', ...]}).execute()
+
+BEGIN;
+
+SET search_path = public;
+
+ALTER TABLE devolucoes ADD COLUMN IF NOT EXISTS inicio int;
+ALTER TABLE devolucoes ADD COLUMN IF NOT EXISTS fim int;
+
+CREATE INDEX IF NOT EXISTS idx_devolucoes_bloco ON devolucoes(bloco_id);
+
+-- Devoluções antigas: as últimas rifas do bloco, por ordem de registo (as
+-- que não cabem no bloco ficam sem intervalo e contam só pela quantidade).
+-- Só blocos sem nenhuma devolução com intervalo, para poder repetir o script
+WITH legado AS (
+  SELECT d.id, b.numero_inicial,
+         b.numero_final - sum(d.quantidade) OVER w + 1 AS inicio,
+         b.numero_final - sum(d.quantidade) OVER w + d.quantidade AS fim
+    FROM devolucoes d
+    JOIN blocos_rifas b ON b.id = d.bloco_id
+   WHERE d.inicio IS NULL AND d.quantidade > 0
+     AND NOT EXISTS (SELECT 1 FROM devolucoes x WHERE x.bloco_id = d.bloco_id AND x.inicio IS NOT NULL)
+  WINDOW w AS (PARTITION BY d.bloco_id ORDER BY d.created_at, d.id)
+)
+UPDATE devolucoes d
+   SET inicio = l.inicio, fim = l.fim
+  FROM legado l
+ WHERE d.id = l.id AND l.inicio >= l.numero_inicial;
+
+CREATE OR REPLACE FUNCTION public.recalcular_estado_blocos(p_blocos uuid[])
+RETURNS TABLE (bloco_id uuid, estado text, rifas_devolvidas int, rifas_restantes int)
+LANGUAGE sql
+AS $$
+  WITH devolvidas AS (
+    SELECT b.id, least(coalesce(sum(d.quantidade), 0), b.numero_final - b.numero_inicial + 1)::int AS n
+      FROM blocos_rifas b
+      LEFT JOIN devolucoes d ON d.bloco_id = b.id
+     WHERE b.id = ANY (p_blocos)
+     GROUP BY b.id
+  )
+  UPDATE blocos_rifas b
+     SET estado = CASE
+           WHEN dv.n >= b.numero_final - b.numero_inicial + 1 THEN 'devolvido'
+           WHEN b.estado = 'devolvido' THEN CASE WHEN b.escuteiro_id IS NULL THEN 'disponivel' ELSE 'atribuido' END
+           ELSE b.estado
+         END
+    FROM devolvidas dv
+   WHERE b.id = dv.id
+  RETURNING b.id, b.estado::text, dv.n, b.numero_final - b.numero_inicial + 1 - dv.n;
+$$;
+
+CREATE OR REPLACE FUNCTION public.registar_devolucoes(p_devolucoes jsonb)
+RETURNS TABLE (bloco_id uuid, estado text, rifas_devolvidas int, rifas_restantes int)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+  blocos uuid[];
+  erro record;
+BEGIN
+  blocos := ARRAY(SELECT DISTINCT (e->>'bloco_id')::uuid FROM jsonb_array_elements(p_devolucoes) e);
+  IF coalesce(array_length(blocos, 1), 0) = 0 THEN
+    RETURN;
+  END IF;
+
+  -- Bloqueia os blocos (por ordem, para não haver deadlocks entre lotes)
+  PERFORM 1 FROM blocos_rifas b WHERE b.id = ANY (blocos) ORDER BY b.id FOR UPDATE;
+
+  -- Intervalos: dentro do bloco, não devolvidos antes e não repetidos no lote
+  WITH pedidos AS (
+    SELECT t.ordem, (t.e->>'bloco_id')::uuid AS bloco_id, (t.e->>'inicio')::int AS inicio,
+           (t.e->>'fim')::int AS fim
+      FROM jsonb_array_elements(p_devolucoes) WITH ORDINALITY AS t(e, ordem)
+  )
+  SELECT p.bloco_id, p.inicio, p.fim, b.id AS existe, b.escuteiro_id, b.numero_inicial, b.numero_final,
+         d.inicio AS devolvida_inicio, d.fim AS devolvida_fim, q.inicio AS repetida_inicio, q.fim AS repetida_fim
+    INTO erro
+    FROM pedidos p
+    LEFT JOIN blocos_rifas b ON b.id = p.bloco_id
+    LEFT JOIN LATERAL (SELECT dd.inicio, dd.fim FROM devolucoes dd
+                        WHERE dd.bloco_id = p.bloco_id AND dd.inicio <= p.fim AND p.inicio <= dd.fim
+                        LIMIT 1) d ON true
+    LEFT JOIN LATERAL (SELECT pp.inicio, pp.fim FROM pedidos pp
+                        WHERE pp.bloco_id = p.bloco_id AND pp.ordem < p.ordem
+                          AND pp.inicio <= p.fim AND p.inicio <= pp.fim
+                        LIMIT 1) q ON true
+   WHERE b.id IS NULL
+      OR b.escuteiro_id IS NULL
+      OR p.inicio IS NULL OR p.fim IS NULL OR p.fim < p.inicio
+      OR p.inicio < b.numero_inicial OR p.fim > b.numero_final
+      OR d.inicio IS NOT NULL
+      OR q.inicio IS NOT NULL
+   ORDER BY p.ordem
+   LIMIT 1;
+  IF FOUND THEN
+    IF erro.existe IS NULL THEN
+      RAISE EXCEPTION 'Bloco % não encontrado', erro.bloco_id;
+    ELSIF erro.escuteiro_id IS NULL THEN
+      RAISE EXCEPTION 'O bloco % (rifas %-%) não está atribuído a nenhum escuteiro',
+        erro.bloco_id, erro.numero_inicial, erro.numero_final;
+    ELSIF erro.inicio IS NULL OR erro.fim IS NULL OR erro.fim < erro.inicio
+       OR erro.inicio < erro.numero_inicial OR erro.fim > erro.numero_final THEN
+      RAISE EXCEPTION 'As rifas %-% não pertencem ao bloco % (rifas %-%)',
+        erro.inicio, erro.fim, erro.bloco_id, erro.numero_inicial, erro.numero_final;
+    ELSIF erro.devolvida_inicio IS NOT NULL THEN
+      RAISE EXCEPTION 'As rifas %-% do bloco % já foram devolvidas',
+        greatest(erro.inicio, erro.devolvida_inicio), least(erro.fim, erro.devolvida_fim), erro.bloco_id;
+    ELSE
+      RAISE EXCEPTION 'As rifas %-% do bloco % estão repetidas no lote',
+        greatest(erro.inicio, erro.repetida_inicio), least(erro.fim, erro.repetida_fim), erro.bloco_id;
+    END IF;
+  END IF;
+
+  -- Devoluções antigas sem intervalo contam só pela quantidade
+  SELECT p.bloco_id, p.quantidade, b.numero_inicial, b.numero_final, coalesce(d.n, 0) AS ja_devolvidas
+    INTO erro
+    FROM (SELECT (e->>'bloco_id')::uuid AS bloco_id, sum((e->>'fim')::int - (e->>'inicio')::int + 1) AS quantidade
+            FROM jsonb_array_elements(p_devolucoes) e
+           GROUP BY 1) p
+    JOIN blocos_rifas b ON b.id = p.bloco_id
+    LEFT JOIN (SELECT dd.bloco_id, sum(dd.quantidade) AS n
+                 FROM devolucoes dd
+                WHERE dd.bloco_id = ANY (blocos)
+                GROUP BY dd.bloco_id) d ON d.bloco_id = p.bloco_id
+   WHERE p.quantidade + coalesce(d.n, 0) > b.numero_final - b.numero_inicial + 1
+   LIMIT 1;
+  IF FOUND THEN
+    RAISE EXCEPTION 'O bloco % (rifas %-%) só tem % rifa(s) por devolver, pedidas %',
+      erro.bloco_id, erro.numero_inicial, erro.numero_final,
+      erro.numero_final - erro.numero_inicial + 1 - erro.ja_devolvidas, erro.quantidade;
+  END IF;
+
+  INSERT INTO devolucoes (escuteiro_id, bloco_id, inicio, fim, quantidade, motivo, data_devolucao)
+  SELECT b.escuteiro_id, b.id, (e->>'inicio')::int, (e->>'fim')::int,
+         (e->>'fim')::int - (e->>'inicio')::int + 1, nullif(e->>'motivo', ''),
+         coalesce((e->>'data_devolucao')::timestamptz, now())
+    FROM jsonb_array_elements(p_devolucoes) e
+    JOIN blocos_rifas b ON b.id = (e->>'bloco_id')::uuid;
+
+  RETURN QUERY SELECT * FROM public.recalcular_estado_blocos(blocos);
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.eliminar_devolucoes(p_ids uuid[])
+RETURNS TABLE (bloco_id uuid, estado text, rifas_devolvidas int, rifas_restantes int)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+  blocos uuid[];
+BEGIN
+  PERFORM 1 FROM blocos_rifas b
+   WHERE b.id IN (SELECT d.bloco_id FROM devolucoes d WHERE d.id = ANY (p_ids))
+   ORDER BY b.id
+     FOR UPDATE;
+
+  WITH eliminadas AS (
+    DELETE FROM devolucoes d WHERE d.id = ANY (p_ids) RETURNING d.bloco_id
+  )
+  SELECT ARRAY(SELECT DISTINCT el.bloco_id FROM eliminadas el) INTO blocos;
+
+  RETURN QUERY SELECT * FROM public.recalcular_estado_blocos(blocos);
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.recalcular_estado_blocos(uuid[]) TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.registar_devolucoes(jsonb) TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.eliminar_devolucoes(uuid[]) TO anon, authenticated;
+
+COMMIT;
+
+NOTIFY pgrst, 'reload schema';
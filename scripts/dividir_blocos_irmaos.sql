@@ -0,0 +1,116 @@
+-- scripts/dividir_blocos_irmaos.sql
+--
+-- Função RPC usada na divisão de blocos entre irmãos
+-- (pages/2_🎟️_Blocos_de_Rifas.py, tab "Atribuir a Escuteiro").
+--
+-- Recebe uma lista de divisões e, para cada uma, divide o bloco em partes
+-- consecutivas (uma por irmão, as rifas extra ficam com o primeiro), atualiza
+-- o bloco original para o primeiro irmão e cria os blocos dos restantes.
+-- Tudo corre numa única transação: ou todas as divisões ficam gravadas, ou
+-- nenhuma. Devolve os blocos resultantes.
+--
+-- A mesma regra de divisão está em utils/blocos.py (dividir_intervalo).
+-- O estado de cada rifa (estado_rifas) acompanha-a: o bloco original guarda
+-- o início do bitmap e cada bloco novo recebe a sua parte
+-- (estado_rifas_fatia); execute primeiro scripts/estado_rifas.sql.
+--
+-- Execução: copie este conteúdo para o SQL Editor do Supabase e execute.
+-- O script é idempotente (pode ser executado várias vezes).
+--
+-- Uso (PostgREST / supabase-py):
+--   supabase.rpc('dividir_blocos_irmaos', {'p_divisoes': [
+--       {'bloco_id': '<uuid>', 'escuteiros': ['<uuid irmão 1>', '<uuid irmão 2>', ...]},
+--       ...
+--   ]}).execute()
+
+BEGIN;
+
+SET search_path = public;
+
+CREATE OR REPLACE FUNCTION public.dividir_blocos_irmaos(p_divisoes jsonb)
+RETURNS SETOF blocos_rifas
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  d jsonb;
+  b blocos_rifas%ROWTYPE;
+  resultado blocos_rifas%ROWTYPE;
+  irmaos uuid[];
+  nomes text;
+  n int;
+  total int;
+  base int;
+  extra int;
+  parte int;
+  inicio int;
+  fim int;
+  preco numeric;
+BEGIN
+  FOR d IN SELECT * FROM jsonb_array_elements(p_divisoes) LOOP
+    irmaos := ARRAY(SELECT jsonb_array_elements_text(d->'escuteiros')::uuid);
+    n := coalesce(array_length(irmaos, 1), 0);
+    IF n < 2 THEN
+      RAISE EXCEPTION 'A divisão do bloco % precisa de pelo menos 2 irmãos', d->>'bloco_id';
+    END IF;
+
+    SELECT * INTO b FROM blocos_rifas WHERE id = (d->>'bloco_id')::uuid FOR UPDATE;
+    IF NOT FOUND THEN
+      RAISE EXCEPTION 'Bloco % não encontrado', d->>'bloco_id';
+    END IF;
+    IF b.escuteiro_id IS NOT NULL THEN
+      RAISE EXCEPTION 'O bloco % (rifas %-%) já está atribuído', b.id, b.numero_inicial, b.numero_final;
+    END IF;
+
+    total := b.numero_final - b.numero_inicial + 1;
+    IF total < n THEN
+      RAISE EXCEPTION 'Não é possível dividir % rifas em % partes', total, n;
+    END IF;
+    base := total / n;
+    extra := total % n;
+    preco := coalesce(b.preco_unitario::numeric, coalesce(b.preco_bloco, 0)::numeric / total);
+
+    SELECT string_agg(e.nome, ', ' ORDER BY array_position(irmaos, e.id))
+      INTO nomes
+      FROM escuteiros e
+     WHERE e.id = ANY (irmaos);
+
+    inicio := b.numero_inicial;
+    FOR i IN 1..n LOOP
+      parte := base + CASE WHEN i = 1 THEN extra ELSE 0 END;
+      fim := inicio + parte - 1;
+      IF i = 1 THEN
+        UPDATE blocos_rifas
+           SET escuteiro_id = irmaos[1],
+               numero_inicial = inicio,
+               numero_final = fim,
+               preco_unitario = preco,
+               preco_bloco = round(preco * parte, 2),
+               seccao = (SELECT seccao FROM escuteiros WHERE id = irmaos[1]),
+               observacoes = 'Divisão automática entre irmãos: ' || nomes
+         WHERE id = b.id
+        RETURNING * INTO resultado;
+      ELSE
+        INSERT INTO blocos_rifas (campanha_id, nome, numero_inicial, numero_final, preco_unitario,
+                                  preco_bloco, estado, escuteiro_id, seccao, data_atribuicao, observacoes,
+                                  estado_rifas)
+        VALUES (b.campanha_id, 'Bloco ' || inicio || '-' || fim, inicio, fim, preco,
+                round(preco * parte, 2), 'atribuido', irmaos[i],
+                coalesce((SELECT seccao FROM escuteiros WHERE id = irmaos[i]), b.seccao), now(),
+                'Divisão automática entre irmãos: ' || nomes
+                  || ' (original ' || b.numero_inicial || '-' || b.numero_final || ')',
+                replace(encode(estado_rifas_fatia(decode(b.estado_rifas, 'base64'),
+                                                  inicio - b.numero_inicial, parte), 'base64'), E'\n', ''))
+        RETURNING * INTO resultado;
+      END IF;
+      RETURN NEXT resultado;
+      inicio := fim + 1;
+    END LOOP;
+  END LOOP;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.dividir_blocos_irmaos(jsonb) TO anon, authenticated;
+
+COMMIT;
+
+NOTIFY pgrst, 'reload schema';
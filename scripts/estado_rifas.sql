@@ -0,0 +1,161 @@
+-- scripts/estado_rifas.sql
+--
+-- Estado de cada rifa individual (por vender / vendida / devolvida / perdida),
+-- guardado como um bitmap compacto por bloco em vez de uma linha por rifa.
+--
+-- Cada rifa ocupa 2 bits na coluna blocos_rifas.estado_rifas (texto base64,
+-- 4 rifas por byte): a rifa numero_inicial + k fica no byte k / 4, nos bits
+-- 2 * (k % 4). Códigos: 0 = por vender, 1 = vendida, 2 = devolvida,
+-- 3 = perdida. NULL (ou um bitmap mais curto) significa que as rifas em falta
+-- estão por vender. Uma campanha de 100 000 rifas ocupa ~25 KB.
+--
+-- A função marcar_intervalo_rifas marca um intervalo de rifas de uma
+-- campanha numa única instrução: bloqueia os blocos abrangidos (FOR UPDATE,
+-- por ordem, para que duas marcações simultâneas não se percam nem entrem
+-- em deadlock) e reescreve o bitmap de cada um com operações sobre bytes
+-- inteiros (estado_rifas_marcar: os bytes completos do intervalo de uma só
+-- vez, rifa a rifa só as até 3 de cada ponta que partilham um byte com o
+-- resto). Tudo ou nada: se falhar, nenhum bloco fica marcado.
+-- marcar_rifas faz o mesmo num único bloco. As contagens e listagens são
+-- feitas em Python (utils/estado_rifas.py, mesma disposição dos bits;
+-- manter em sincronia).
+--
+-- Execução: copie este conteúdo para o SQL Editor do Supabase e execute.
+-- O script é idempotente (pode ser executado várias vezes).
+--
+-- Uso (PostgREST / supabase-py):
+--   supabase.rpc('marcar_intervalo_rifas', {'p_campanha_id': '<uuid>', 'p_inicio': 1,
+--                                           'p_fim': 100000, 'p_estado': 1}).execute()
+--   supabase.rpc('marcar_rifas', {'p_bloco_id': '<uuid>', 'p_inicio': 101,
+--                                 'p_fim': 110, 'p_estado': 1}).execute()
+
+BEGIN;
+
+SET search_path = public;
+
+ALTER TABLE blocos_rifas ADD COLUMN IF NOT EXISTS estado_rifas text;
+
+-- Bitmap de um bloco (normalizado para ceil(total / 4) bytes) com as rifas
+-- de índice k0..k1 (0 = numero_inicial) no estado p_estado
+CREATE OR REPLACE FUNCTION public.estado_rifas_marcar(dados bytea, total int, k0 int, k1 int, p_estado int)
+RETURNS bytea
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+DECLARE
+  tamanho int := (total + 3) / 4;
+  primeiro int := (k0 + 3) / 4;     -- primeiro byte inteiro do intervalo
+  ultimo int := (k1 + 1) / 4 - 1;   -- último byte inteiro do intervalo
+  k int;
+BEGIN
+  dados := substring(coalesce(dados, ''::bytea) || decode(repeat('00', tamanho), 'hex') FROM 1 FOR tamanho);
+
+  -- Bytes inteiros: 4 rifas com o mesmo código (p_estado * 0x55)
+  IF ultimo >= primeiro THEN
+    dados := overlay(dados PLACING decode(repeat(lpad(to_hex(p_estado * 85), 2, '0'), ultimo - primeiro + 1), 'hex')
+                     FROM primeiro + 1 FOR ultimo - primeiro + 1);
+  END IF;
+
+  -- Pontas que partilham um byte com rifas fora do intervalo
+  FOR k IN SELECT g FROM generate_series(k0, least(k1, primeiro * 4 - 1)) g
+           UNION
+           SELECT g FROM generate_series(greatest(k0, (ultimo + 1) * 4), k1) g LOOP
+    dados := set_byte(dados, k / 4, (get_byte(dados, k / 4) & ~(3 << (2 * (k % 4)))) | (p_estado << (2 * (k % 4))));
+  END LOOP;
+  RETURN dados;
+END;
+$$;
+
+-- Bitmap das total rifas de um bloco a partir do índice k0 (as rifas que
+-- passam para outro bloco, por exemplo na divisão entre irmãos,
+-- scripts/dividir_blocos_irmaos.sql); NULL se o bloco não tem bitmap
+CREATE OR REPLACE FUNCTION public.estado_rifas_fatia(dados bytea, k0 int, total int)
+RETURNS bytea
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT decode(string_agg(lpad(to_hex(
+           (((CASE WHEN a < length(dados) THEN get_byte(dados, a) ELSE 0 END) >> s)
+            | (((CASE WHEN a + 1 < length(dados) THEN get_byte(dados, a + 1) ELSE 0 END) << (8 - s)) & 255))
+           -- bits do último byte para lá das total rifas a zero
+           & CASE WHEN i = (total + 3) / 4 - 1 AND total % 4 > 0 THEN (1 << (2 * (total % 4))) - 1 ELSE 255 END
+         ), 2, '0'), '' ORDER BY i), 'hex')
+    FROM generate_series(0, (total + 3) / 4 - 1) i,
+         LATERAL (SELECT k0 / 4 + i AS a, 2 * (k0 % 4) AS s) p
+   WHERE dados IS NOT NULL
+$$;
+
+CREATE OR REPLACE FUNCTION public.marcar_intervalo_rifas(p_campanha_id uuid, p_inicio int, p_fim int, p_estado int)
+RETURNS TABLE (blocos int, rifas_marcadas int)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF p_estado IS NULL OR p_estado NOT BETWEEN 0 AND 3 THEN
+    RAISE EXCEPTION 'Estado de rifa inválido: %', p_estado;
+  END IF;
+  IF p_inicio IS NULL OR p_fim IS NULL OR p_inicio > p_fim THEN
+    RAISE EXCEPTION 'Intervalo de rifas inválido: %-%', p_inicio, p_fim;
+  END IF;
+
+  RETURN QUERY
+  WITH alvo AS (
+    SELECT b.id, b.numero_inicial, b.numero_final - b.numero_inicial + 1 AS total,
+           greatest(p_inicio, b.numero_inicial) AS de, least(p_fim, b.numero_final) AS ate
+      FROM blocos_rifas b
+     WHERE b.campanha_id = p_campanha_id
+       AND b.numero_inicial <= p_fim
+       AND b.numero_final >= p_inicio
+     ORDER BY b.id
+       FOR UPDATE
+  ),
+  marcados AS (
+    UPDATE blocos_rifas b
+       SET estado_rifas = replace(encode(
+             estado_rifas_marcar(decode(b.estado_rifas, 'base64'), a.total,
+                                 a.de - a.numero_inicial, a.ate - a.numero_inicial, p_estado),
+             'base64'), E'\n', '')
+      FROM alvo a
+     WHERE b.id = a.id
+    RETURNING a.ate - a.de + 1 AS n
+  )
+  SELECT count(*)::int, coalesce(sum(m.n), 0)::int FROM marcados m;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.marcar_rifas(p_bloco_id uuid, p_inicio int, p_fim int, p_estado int)
+RETURNS blocos_rifas
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  b blocos_rifas%ROWTYPE;
+  resultado blocos_rifas%ROWTYPE;
+BEGIN
+  IF p_estado IS NULL OR p_estado NOT BETWEEN 0 AND 3 THEN
+    RAISE EXCEPTION 'Estado de rifa inválido: %', p_estado;
+  END IF;
+
+  SELECT * INTO b FROM blocos_rifas WHERE id = p_bloco_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'Bloco % não encontrado', p_bloco_id;
+  END IF;
+  IF p_inicio > p_fim OR p_inicio < b.numero_inicial OR p_fim > b.numero_final THEN
+    RAISE EXCEPTION 'As rifas %-% não pertencem ao bloco %-%', p_inicio, p_fim, b.numero_inicial, b.numero_final;
+  END IF;
+
+  UPDATE blocos_rifas
+     SET estado_rifas = replace(encode(
+           estado_rifas_marcar(decode(b.estado_rifas, 'base64'), b.numero_final - b.numero_inicial + 1,
+                               p_inicio - b.numero_inicial, p_fim - b.numero_inicial, p_estado),
+           'base64'), E'\n', '')
+   WHERE id = b.id
+  RETURNING * INTO resultado;
+  RETURN resultado;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.marcar_rifas(uuid, int, int, int) TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.marcar_intervalo_rifas(uuid, int, int, int) TO anon, authenticated;
+
+COMMIT;
+
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Verifica (ou reconstrói) os saldos mantidos pelos triggers de scripts/saldos.sql.
+
+As tabelas ``saldos_blocos`` e ``saldos_escuteiros`` são atualizadas pela
+base de dados a cada pagamento, devolução ou alteração de bloco. Este script
+compara-as com o cálculo feito de raiz a partir dos pagamentos e devoluções
+(``verificar_saldos``) e termina com código 1 se houver diferenças.
+
+Uso:
+    python scripts/saldos.py                 # verificar
+    python scripts/saldos.py --reconstruir   # apagar e voltar a calcular
+
+Usa o mesmo backend da aplicação (Supabase, ou SQLite local com
+RIFAS_BACKEND=sqlite RIFAS_SQLITE_PATH=rifas_local.db).
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import data_access as db  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reconstruir', action='store_true',
+                        help='apagar os saldos guardados e voltar a calculá-los')
+    parser.add_argument('--limite', type=int, default=20, help='diferenças a mostrar (0 = todas)')
+    args = parser.parse_args()
+
+    if args.reconstruir:
+        linhas = db.rpc('reconstruir_saldos')
+        print(f"Saldos reconstruídos ({linhas[0] if isinstance(linhas, list) and linhas else linhas} blocos).")
+
+    diferencas = db.rpc('verificar_saldos') or []
+    if not diferencas:
+        print("✅ Os saldos guardados conferem com os pagamentos e devoluções.")
+        return 0
+
+    print(f"❌ {len(diferencas)} saldo(s) diferem do cálculo:")
+    for d in diferencas[:args.limite or None]:
+        print(f"  {d['tabela']} {d['chave']}")
+        print(f"    guardado:  {json.dumps(d.get('guardado'), ensure_ascii=False, default=str)}")
+        print(f"    calculado: {json.dumps(d.get('calculado'), ensure_ascii=False, default=str)}")
+    print("Execute com --reconstruir para corrigir.")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
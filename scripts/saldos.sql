@@ -0,0 +1,304 @@
+-- scripts/saldos.sql
+--
+-- Saldos (valor esperado vs. recebido) mantidos incrementalmente, por bloco
+-- (saldos_blocos) e por escuteiro em cada campanha (saldos_escuteiros).
+--
+-- Em vez de cada página recalcular preco_bloco - sum(valor_pago), os
+-- triggers abaixo atualizam só as linhas afetadas em cada inserção,
+-- alteração ou eliminação de pagamentos, devoluções e blocos (valor,
+-- intervalo, escuteiro ou campanha). Mostrar um saldo passa a ser a leitura
+-- de uma única linha.
+--
+--   valor_esperado  = preco_bloco
+--   valor_devolvido = rifas devolvidas × preço unitário (as rifas devolvidas
+--                     não têm de ser pagas)
+--   saldo           = valor_esperado - valor_devolvido - valor_recebido
+--
+-- A view vw_saldos_calculados faz o mesmo cálculo a partir das tabelas de
+-- origem e serve de referência para:
+--   reconstruir_saldos()  - apaga e volta a calcular os dois resumos
+--   verificar_saldos()    - lista as linhas guardadas que diferem do cálculo
+-- (ver também scripts/saldos.py). Substitui a view vw_saldos_blocos.
+--
+-- Execução: copie este conteúdo para o SQL Editor do Supabase e execute.
+-- O script é idempotente (pode ser executado várias vezes) e no fim
+-- reconstrói os saldos a partir dos dados existentes.
+
+BEGIN;
+
+SET search_path = public;
+
+CREATE INDEX IF NOT EXISTS idx_pagamentos_bloco ON pagamentos(bloco_id);
+CREATE INDEX IF NOT EXISTS idx_devolucoes_bloco ON devolucoes(bloco_id);
+
+DROP VIEW IF EXISTS public.vw_saldos_blocos;
+
+CREATE TABLE IF NOT EXISTS saldos_blocos (
+  bloco_id uuid PRIMARY KEY REFERENCES blocos_rifas(id) ON DELETE CASCADE,
+  campanha_id uuid REFERENCES campanhas(id) ON DELETE CASCADE,
+  escuteiro_id uuid REFERENCES escuteiros(id),
+  valor_esperado numeric NOT NULL DEFAULT 0,
+  valor_recebido numeric NOT NULL DEFAULT 0,
+  n_pagamentos int NOT NULL DEFAULT 0,
+  rifas_devolvidas int NOT NULL DEFAULT 0,
+  valor_devolvido numeric NOT NULL DEFAULT 0,
+  saldo numeric NOT NULL DEFAULT 0,
+  atualizado_em timestamptz DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_saldos_blocos_campanha ON saldos_blocos(campanha_id, escuteiro_id);
+
+CREATE TABLE IF NOT EXISTS saldos_escuteiros (
+  escuteiro_id uuid REFERENCES escuteiros(id) ON DELETE CASCADE,
+  campanha_id uuid REFERENCES campanhas(id) ON DELETE CASCADE,
+  n_blocos int NOT NULL DEFAULT 0,
+  valor_esperado numeric NOT NULL DEFAULT 0,
+  valor_recebido numeric NOT NULL DEFAULT 0,
+  n_pagamentos int NOT NULL DEFAULT 0,
+  rifas_devolvidas int NOT NULL DEFAULT 0,
+  valor_devolvido numeric NOT NULL DEFAULT 0,
+  saldo numeric NOT NULL DEFAULT 0,
+  atualizado_em timestamptz DEFAULT now(),
+  PRIMARY KEY (escuteiro_id, campanha_id)
+);
+
+CREATE OR REPLACE VIEW public.vw_saldos_calculados AS
+SELECT
+  b.id AS bloco_id,
+  b.campanha_id,
+  b.escuteiro_id,
+  COALESCE(b.preco_bloco, 0)::numeric AS valor_esperado,
+  p.valor_recebido,
+  p.n_pagamentos,
+  LEAST(d.rifas, b.numero_final - b.numero_inicial + 1)::int AS rifas_devolvidas,
+  round(LEAST(d.rifas, b.numero_final - b.numero_inicial + 1) * u.preco, 2) AS valor_devolvido,
+  COALESCE(b.preco_bloco, 0)
+    - round(LEAST(d.rifas, b.numero_final - b.numero_inicial + 1) * u.preco, 2)
+    - p.valor_recebido AS saldo
+FROM blocos_rifas b
+CROSS JOIN LATERAL (
+  SELECT COALESCE(sum(valor_pago), 0)::numeric AS valor_recebido, count(*)::int AS n_pagamentos
+  FROM pagamentos WHERE bloco_id = b.id
+) p
+CROSS JOIN LATERAL (
+  SELECT COALESCE(sum(quantidade), 0) AS rifas FROM devolucoes WHERE bloco_id = b.id
+) d
+CROSS JOIN LATERAL (
+  SELECT COALESCE(b.preco_unitario::numeric,
+                  COALESCE(b.preco_bloco, 0)::numeric / (b.numero_final - b.numero_inicial + 1)) AS preco
+) u;
+
+GRANT SELECT ON public.vw_saldos_calculados TO anon, authenticated;
+GRANT SELECT ON saldos_blocos, saldos_escuteiros TO anon, authenticated;
+
+-- Recalcula o resumo de um escuteiro numa campanha a partir de saldos_blocos.
+-- Bloqueia primeiro o escuteiro: duas transações com blocos diferentes do
+-- mesmo escuteiro (ex.: dois pagamentos numa noite de receção) somam uma
+-- de cada vez, e a segunda já vê o bloco da primeira. A linha é escrita
+-- com INSERT ... ON CONFLICT (também no primeiro pagamento, sem linha).
+CREATE OR REPLACE FUNCTION public.atualizar_saldo_escuteiro(p_escuteiro_id uuid, p_campanha_id uuid)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF p_escuteiro_id IS NULL OR p_campanha_id IS NULL THEN
+    RETURN;
+  END IF;
+  PERFORM 1 FROM escuteiros WHERE id = p_escuteiro_id FOR NO KEY UPDATE;
+
+  INSERT INTO saldos_escuteiros (escuteiro_id, campanha_id, n_blocos, valor_esperado, valor_recebido,
+                                 n_pagamentos, rifas_devolvidas, valor_devolvido, saldo)
+  SELECT p_escuteiro_id, p_campanha_id, count(*), sum(valor_esperado), sum(valor_recebido),
+         sum(n_pagamentos), sum(rifas_devolvidas), sum(valor_devolvido), sum(saldo)
+  FROM saldos_blocos
+  WHERE escuteiro_id = p_escuteiro_id AND campanha_id = p_campanha_id
+  HAVING count(*) > 0
+  ON CONFLICT (escuteiro_id, campanha_id) DO UPDATE
+     SET n_blocos = EXCLUDED.n_blocos,
+         valor_esperado = EXCLUDED.valor_esperado,
+         valor_recebido = EXCLUDED.valor_recebido,
+         n_pagamentos = EXCLUDED.n_pagamentos,
+         rifas_devolvidas = EXCLUDED.rifas_devolvidas,
+         valor_devolvido = EXCLUDED.valor_devolvido,
+         saldo = EXCLUDED.saldo,
+         atualizado_em = now();
+
+  -- Sem blocos nesta campanha: o resumo deixa de existir
+  IF NOT FOUND THEN
+    DELETE FROM saldos_escuteiros WHERE escuteiro_id = p_escuteiro_id AND campanha_id = p_campanha_id;
+  END IF;
+END;
+$$;
+
+-- Recalcula a linha de um bloco e os resumos do escuteiro anterior e atual.
+-- O bloco é bloqueado primeiro, para que dois pagamentos simultâneos do
+-- mesmo bloco sejam somados um de cada vez (ON CONFLICT em vez de
+-- DELETE + INSERT, que falhava com unique_violation).
+CREATE OR REPLACE FUNCTION public.atualizar_saldo_bloco(p_bloco_id uuid)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  anterior saldos_blocos%ROWTYPE;
+  atual saldos_blocos%ROWTYPE;
+BEGIN
+  IF p_bloco_id IS NULL THEN
+    RETURN;
+  END IF;
+  PERFORM 1 FROM blocos_rifas WHERE id = p_bloco_id FOR NO KEY UPDATE;
+
+  SELECT * INTO anterior FROM saldos_blocos WHERE bloco_id = p_bloco_id;
+  INSERT INTO saldos_blocos (bloco_id, campanha_id, escuteiro_id, valor_esperado, valor_recebido,
+                             n_pagamentos, rifas_devolvidas, valor_devolvido, saldo)
+  SELECT bloco_id, campanha_id, escuteiro_id, valor_esperado, valor_recebido,
+         n_pagamentos, rifas_devolvidas, valor_devolvido, saldo
+  FROM vw_saldos_calculados
+  WHERE bloco_id = p_bloco_id
+  ON CONFLICT (bloco_id) DO UPDATE
+     SET campanha_id = EXCLUDED.campanha_id,
+         escuteiro_id = EXCLUDED.escuteiro_id,
+         valor_esperado = EXCLUDED.valor_esperado,
+         valor_recebido = EXCLUDED.valor_recebido,
+         n_pagamentos = EXCLUDED.n_pagamentos,
+         rifas_devolvidas = EXCLUDED.rifas_devolvidas,
+         valor_devolvido = EXCLUDED.valor_devolvido,
+         saldo = EXCLUDED.saldo,
+         atualizado_em = now()
+  RETURNING * INTO atual;
+
+  -- Bloco eliminado entretanto
+  IF NOT FOUND THEN
+    DELETE FROM saldos_blocos WHERE bloco_id = p_bloco_id;
+  END IF;
+
+  PERFORM atualizar_saldo_escuteiro(anterior.escuteiro_id, anterior.campanha_id);
+  IF atual.escuteiro_id IS DISTINCT FROM anterior.escuteiro_id
+     OR atual.campanha_id IS DISTINCT FROM anterior.campanha_id THEN
+    PERFORM atualizar_saldo_escuteiro(atual.escuteiro_id, atual.campanha_id);
+  END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.trg_saldos_por_bloco_id()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM atualizar_saldo_bloco(OLD.bloco_id);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') AND (TG_OP = 'INSERT' OR NEW.bloco_id IS DISTINCT FROM OLD.bloco_id) THEN
+    PERFORM atualizar_saldo_bloco(NEW.bloco_id);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.trg_saldos_blocos_rifas()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    DELETE FROM saldos_blocos WHERE bloco_id = OLD.id;
+    PERFORM atualizar_saldo_escuteiro(OLD.escuteiro_id, OLD.campanha_id);
+  ELSE
+    PERFORM atualizar_saldo_bloco(NEW.id);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_saldos_pagamentos ON pagamentos;
+CREATE TRIGGER trg_saldos_pagamentos
+AFTER INSERT OR UPDATE OF bloco_id, valor_pago OR DELETE ON pagamentos
+FOR EACH ROW EXECUTE FUNCTION trg_saldos_por_bloco_id();
+
+DROP TRIGGER IF EXISTS trg_saldos_devolucoes ON devolucoes;
+CREATE TRIGGER trg_saldos_devolucoes
+AFTER INSERT OR UPDATE OF bloco_id, quantidade OR DELETE ON devolucoes
+FOR EACH ROW EXECUTE FUNCTION trg_saldos_por_bloco_id();
+
+DROP TRIGGER IF EXISTS trg_saldos_blocos_rifas ON blocos_rifas;
+CREATE TRIGGER trg_saldos_blocos_rifas
+AFTER INSERT OR UPDATE OF campanha_id, escuteiro_id, preco_bloco, preco_unitario, numero_inicial, numero_final
+      OR DELETE ON blocos_rifas
+FOR EACH ROW EXECUTE FUNCTION trg_saldos_blocos_rifas();
+
+-- Reconstrução completa (também usada no fim deste script)
+CREATE OR REPLACE FUNCTION public.reconstruir_saldos()
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  n int;
+BEGIN
+  -- WHERE true: chamada pelo PostgREST, onde o safeupdate recusa DELETE sem WHERE
+  DELETE FROM saldos_escuteiros WHERE true;
+  DELETE FROM saldos_blocos WHERE true;
+  INSERT INTO saldos_blocos (bloco_id, campanha_id, escuteiro_id, valor_esperado, valor_recebido,
+                             n_pagamentos, rifas_devolvidas, valor_devolvido, saldo)
+  SELECT bloco_id, campanha_id, escuteiro_id, valor_esperado, valor_recebido,
+         n_pagamentos, rifas_devolvidas, valor_devolvido, saldo
+  FROM vw_saldos_calculados;
+  GET DIAGNOSTICS n = ROW_COUNT;
+  INSERT INTO saldos_escuteiros (escuteiro_id, campanha_id, n_blocos, valor_esperado, valor_recebido,
+                                 n_pagamentos, rifas_devolvidas, valor_devolvido, saldo)
+  SELECT escuteiro_id, campanha_id, count(*), sum(valor_esperado), sum(valor_recebido),
+         sum(n_pagamentos), sum(rifas_devolvidas), sum(valor_devolvido), sum(saldo)
+  FROM saldos_blocos
+  WHERE escuteiro_id IS NOT NULL AND campanha_id IS NOT NULL
+  GROUP BY escuteiro_id, campanha_id;
+  RETURN n;
+END;
+$$;
+
+-- Verificação: linhas guardadas que diferem do cálculo a partir das tabelas de origem
+CREATE OR REPLACE FUNCTION public.verificar_saldos()
+RETURNS TABLE (tabela text, chave text, guardado jsonb, calculado jsonb)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH c AS (
+    SELECT bloco_id, campanha_id, escuteiro_id, valor_esperado, valor_recebido,
+           n_pagamentos, rifas_devolvidas, valor_devolvido, saldo
+    FROM vw_saldos_calculados
+  ),
+  g AS (
+    SELECT bloco_id, campanha_id, escuteiro_id, valor_esperado, valor_recebido,
+           n_pagamentos, rifas_devolvidas, valor_devolvido, saldo
+    FROM saldos_blocos
+  ),
+  ce AS (
+    SELECT escuteiro_id, campanha_id, count(*) AS n_blocos, sum(valor_esperado) AS valor_esperado,
+           sum(valor_recebido) AS valor_recebido, sum(n_pagamentos) AS n_pagamentos,
+           sum(rifas_devolvidas) AS rifas_devolvidas, sum(valor_devolvido) AS valor_devolvido,
+           sum(saldo) AS saldo
+    FROM c
+    WHERE escuteiro_id IS NOT NULL AND campanha_id IS NOT NULL
+    GROUP BY escuteiro_id, campanha_id
+  ),
+  ge AS (
+    SELECT escuteiro_id, campanha_id, n_blocos, valor_esperado, valor_recebido,
+           n_pagamentos, rifas_devolvidas, valor_devolvido, saldo
+    FROM saldos_escuteiros
+  )
+  SELECT 'saldos_blocos', COALESCE(g.bloco_id, c.bloco_id)::text, to_jsonb(g), to_jsonb(c)
+  FROM g FULL JOIN c ON c.bloco_id = g.bloco_id
+  WHERE to_jsonb(g) IS DISTINCT FROM to_jsonb(c)
+  UNION ALL
+  SELECT 'saldos_escuteiros', COALESCE(ge.escuteiro_id, ce.escuteiro_id)::text || '/' ||
+                              COALESCE(ge.campanha_id, ce.campanha_id)::text,
+         to_jsonb(ge), to_jsonb(ce)
+  FROM ge FULL JOIN ce ON ce.escuteiro_id = ge.escuteiro_id AND ce.campanha_id = ge.campanha_id
+  WHERE to_jsonb(ge) IS DISTINCT FROM to_jsonb(ce);
+$$;
+
+GRANT EXECUTE ON FUNCTION public.reconstruir_saldos() TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.verificar_saldos() TO anon, authenticated;
+
+SELECT public.reconstruir_saldos();
+
+COMMIT;
+
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Cria uma base de dados SQLite local com dados fictícios para testes de carga.
+
+Uso:
+    python scripts/seed_local_db.py --blocos 100000 --path rifas_local.db
+
+Depois execute a aplicação (ou o benchmark) sem rede:
+    RIFAS_BACKEND=sqlite RIFAS_SQLITE_PATH=rifas_local.db streamlit run app.py
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.local_backend import LocalClient  # noqa: E402
+
+SECCOES = ['Lobitos', 'Exploradores', 'Pioneiros', 'Caminheiros', 'CPP']
+CHUNK = 5000
+
+
+def _insert_chunked(client, table, rows):
+    inserted = []
+    for start in range(0, len(rows), CHUNK):
+        inserted.extend(client.table(table).insert(rows[start:start + CHUNK]).execute().data)
+    return inserted
+
+
+def seed(path, num_blocos, rifas_por_bloco, num_escuteiros, frac_atribuidos, frac_pagos, frac_devolvidos, seed_value):
+    rng = random.Random(seed_value)
+    if os.path.exists(path):
+        os.remove(path)
+    client = LocalClient(path)
+
+    campanha = client.table('campanhas').insert({
+        'nome': f'Campanha Teste {num_blocos}',
+        'descricao': 'Dados gerados por scripts/seed_local_db.py',
+        'data_inicio': date.today().isoformat(),
+        'data_fim': (date.today() + timedelta(days=90)).isoformat(),
+        'ativa': True,
+    }).execute().data[0]
+
+    escuteiros = _insert_chunked(client, 'escuteiros', [
+        {'nome': f'Escuteiro {i:05d}', 'seccao': rng.choice(SECCOES), 'ativo': True}
+        for i in range(num_escuteiros)
+    ])
+
+    preco_bloco = float(rifas_por_bloco)
+    blocos = []
+    for i in range(num_blocos):
+        inicio = i * rifas_por_bloco + 1
+        fim = inicio + rifas_por_bloco - 1
+        atribuido = rng.random() < frac_atribuidos
+        esc = rng.choice(escuteiros) if atribuido else None
+        blocos.append({
+            'campanha_id': campanha['id'],
+            'nome': f'Bloco {inicio}-{fim}',
+            'numero_inicial': inicio,
+            'numero_final': fim,
+            'preco_bloco': preco_bloco,
+            'preco_unitario': preco_bloco / rifas_por_bloco,
+            'estado': 'atribuido' if atribuido else 'disponivel',
+            'escuteiro_id': esc['id'] if esc else None,
+            'seccao': esc['seccao'] if esc else None,
+            'data_atribuicao': date.today().isoformat() if atribuido else None,
+        })
+    blocos = _insert_chunked(client, 'blocos_rifas', blocos)
+
+    atribuidos = [b for b in blocos if b['escuteiro_id']]
+    pagamentos, devolucoes = [], []
+    for b in atribuidos:
+        r = rng.random()
+        if r < frac_pagos:
+            pagamentos.append({
+                'bloco_id': b['id'],
+                'valor_pago': b['preco_bloco'] if rng.random() < 0.8 else round(b['preco_bloco'] / 2, 2),
+                'rifas_entregues': rifas_por_bloco,
+                'metodo_pagamento': 'Dinheiro',
+                'data_pagamento': (date.today() - timedelta(days=rng.randint(0, 60))).isoformat(),
+            })
+        elif r < frac_pagos + frac_devolvidos:
+            quantidade = rng.randint(1, rifas_por_bloco)
+            devolucoes.append({
+                'bloco_id': b['id'],
+                'escuteiro_id': b['escuteiro_id'],
+                'inicio': b['numero_final'] - quantidade + 1,
+                'fim': b['numero_final'],
+                'quantidade': quantidade,
+                'motivo': 'Rifas não vendidas',
+                'data_devolucao': (date.today() - timedelta(days=rng.randint(0, 60))).isoformat(),
+            })
+    _insert_chunked(client, 'pagamentos', pagamentos)
+    _insert_chunked(client, 'devolucoes', devolucoes)
+    client.close()
+    return {
+        'campanha': campanha['nome'],
+        'escuteiros': len(escuteiros),
+        'blocos': len(blocos),
+        'pagamentos': len(pagamentos),
+        'devolucoes': len(devolucoes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--path', default=os.getenv('RIFAS_SQLITE_PATH', 'rifas_local.db'))
+    parser.add_argument('--blocos', type=int, default=100_000)
+    parser.add_argument('--rifas-por-bloco', type=int, default=10)
+    parser.add_argument('--escuteiros', type=int, default=300)
+    parser.add_argument('--atribuidos', type=float, default=0.8, help='fração de blocos atribuídos')
+    parser.add_argument('--pagos', type=float, default=0.6, help='fração de blocos atribuídos com pagamento')
+    parser.add_argument('--devolvidos', type=float, default=0.05, help='fração de blocos atribuídos com devolução')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    resumo = seed(args.path, args.blocos, args.rifas_por_bloco, args.escuteiros,
+                  args.atribuidos, args.pagos, args.devolvidos, args.seed)
+    print(f"✅ Base de dados criada em {args.path}")
+    for chave, valor in resumo.items():
+        print(f"   {chave}: {valor}")
+
+
+if __name__ == '__main__':
+    main()
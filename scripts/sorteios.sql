@@ -0,0 +1,36 @@
+-- scripts/sorteios.sql
+--
+-- Tabela com o registo dos sorteios (pages/6_🎲_Sorteio.py).
+--
+-- Cada sorteio guarda a semente usada, o critério de elegibilidade, o total
+-- de rifas elegíveis, a impressão digital (SHA-256) dos intervalos elegíveis
+-- e os números vencedores por ordem de prémio. Com estes dados qualquer
+-- pessoa pode repetir o sorteio e confirmar o resultado (utils/sorteio.py,
+-- função verificar_sorteio).
+--
+-- Execução: copie este conteúdo para o SQL Editor do Supabase e execute.
+-- O script é idempotente (pode ser executado várias vezes).
+
+BEGIN;
+
+SET search_path = public;
+
+CREATE TABLE IF NOT EXISTS sorteios (
+  id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+  campanha_id uuid REFERENCES campanhas(id) ON DELETE CASCADE,
+  semente text NOT NULL,
+  criterio text NOT NULL,
+  n_premios int NOT NULL CHECK (n_premios > 0),
+  total_rifas bigint NOT NULL,
+  impressao_digital text NOT NULL,
+  vencedores jsonb NOT NULL,
+  observacoes text,
+  created_at timestamptz DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_sorteios_campanha ON sorteios(campanha_id);
+CREATE INDEX IF NOT EXISTS idx_devolucoes_bloco ON devolucoes(bloco_id);
+
+COMMIT;
+
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,31 @@
+-- scripts/vw_campanhas_stats.sql
+--
+-- View usada pela lista de campanhas (pages/5_📅_Campanhas.py).
+--
+-- Uma linha por campanha com o total de blocos, total de rifas e blocos
+-- vendidos, calculada num único GROUP BY em vez de uma consulta a
+-- blocos_rifas por campanha.
+--
+-- Execução: copie este conteúdo para o SQL Editor do Supabase e execute.
+-- O script é idempotente (pode ser executado várias vezes).
+
+BEGIN;
+
+SET search_path = public;
+
+CREATE INDEX IF NOT EXISTS idx_blocos_rifas_campanha ON blocos_rifas(campanha_id);
+
+CREATE OR REPLACE VIEW public.vw_campanhas_stats AS
+SELECT
+  campanha_id,
+  count(*) AS total_blocos,
+  COALESCE(sum(numero_final - numero_inicial + 1), 0) AS total_rifas,
+  count(*) FILTER (WHERE estado = 'vendido') AS blocos_vendidos
+FROM blocos_rifas
+GROUP BY campanha_id;
+
+GRANT SELECT ON public.vw_campanhas_stats TO anon, authenticated;
+
+COMMIT;
+
+NOTIFY pgrst, 'reload schema';
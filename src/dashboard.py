@@ -4,6 +4,7 @@ import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 from utils.supabase_client import get_supabase_client
+from utils import data_access as db
 
 
 def safe_sum(iterable):
@@ -32,14 +33,13 @@ def render_dashboard(campanha_id=None, show_instructions=True, set_page_config=T
     pass
 
     try:
-        supabase = get_supabase_client()
+        get_supabase_client()
     except Exception as e:
         st.error(f"❌ Erro ao conectar à base de dados: {e}")
         st.stop()
 
     # Campaign selector: Todas + campanhas
-    campanhas_resp = supabase.table('campanhas').select('*').order('created_at', desc=True).execute()
-    campanhas = campanhas_resp.data or []
+    campanhas = db.select('campanhas', '*', order=[('created_at', True)])
 
     campanha_options = [("Todas", None)] + [(c['nome'], c['id']) for c in campanhas]
 
@@ -59,57 +59,22 @@ def render_dashboard(campanha_id=None, show_instructions=True, set_page_config=T
     st.markdown("---")
 
     with st.spinner("A carregar métricas..."):
-        # Fetch base data depending on selection
-        esc_resp = supabase.table('escuteiros').select('*').execute()
-        escuteiros = esc_resp.data or []
+        # KPIs calculados na base de dados (scripts/dashboard_kpis.sql): só o
+        # resultado agregado é transferido, não as linhas de blocos/pagamentos
+        kpis = db.rpc('dashboard_kpis', {'p_campanha_id': campanha_id}) or {}
 
         total_campanhas = len(campanhas)
-
-        # Blocos
-        if campanha_id:
-            blocos_resp = supabase.table('blocos_rifas').select('*').eq('campanha_id', campanha_id).execute()
-        else:
-            blocos_resp = supabase.table('blocos_rifas').select('*').execute()
-        blocos = blocos_resp.data or []
-        bloco_ids = [b['id'] for b in blocos]
-
-        # Pagamentos relacionados
-        pagamentos = []
-        if bloco_ids:
-            pag_resp = supabase.table('pagamentos').select('*').in_('bloco_id', bloco_ids).execute()
-            pagamentos = pag_resp.data or []
-
-        # Devoluções
-        dev_resp = supabase.table('devolucoes').select('*').execute()
-        devolucoes = dev_resp.data or []
-
-        # KPIs
-        total_escuteiros = len(escuteiros)
-        total_blocos = len(blocos)
-        estados = {}
-        for b in blocos:
-            est = b.get('estado') or 'desconhecido'
-            estados[est] = estados.get(est, 0) + 1
-
-        assigned_blocos = [b for b in blocos if (b.get('estado') or '') == 'atribuido']
-        assigned_count = len(assigned_blocos)
-
-        rifas_atribuidas = sum(rifas_count(b) for b in assigned_blocos)
-
-        blocks_with_payments = set([p.get('bloco_id') for p in pagamentos if p.get('bloco_id')])
-        confirmed_sold_blocks = len(blocks_with_payments)
-
-        rifas_vendidas_confirmadas = 0
-        for p in pagamentos:
-            q = p.get('quantidade_rifas') or p.get('canhotos_entregues') or p.get('quantidade')
-            try:
-                rifas_vendidas_confirmadas += int(q or 0)
-            except Exception:
-                pass
-
-        valor_total_recebido = safe_sum([p.get('valor_pago', 0) for p in pagamentos])
-        receita_esperada_atribuidos = safe_sum([b.get('preco_bloco', 0) for b in assigned_blocos])
-        saldo_pendente = receita_esperada_atribuidos - valor_total_recebido
+        total_escuteiros = int(kpis.get('total_escuteiros') or 0)
+        total_blocos = int(kpis.get('total_blocos') or 0)
+        estados = kpis.get('estados') or {}
+        assigned_count = int(kpis.get('blocos_atribuidos') or 0)
+        rifas_atribuidas = int(kpis.get('rifas_atribuidas') or 0)
+        confirmed_sold_blocks = int(kpis.get('blocos_com_pagamento') or 0)
+        rifas_vendidas_confirmadas = int(kpis.get('rifas_confirmadas') or 0)
+
+        valor_total_recebido = float(kpis.get('valor_recebido') or 0)
+        # Saldo dos blocos atribuídos, mantido pela base de dados (scripts/saldos.sql)
+        saldo_pendente = float(kpis.get('saldo_pendente') or 0)
 
         conversao_blocks = (confirmed_sold_blocks / assigned_count * 100) if assigned_count > 0 else 0
 
@@ -142,16 +107,13 @@ def render_dashboard(campanha_id=None, show_instructions=True, set_page_config=T
 
     with chart_col2:
         st.subheader("Recebimentos ao Longo do Tempo")
-        if pagamentos:
-            df_pag = pd.DataFrame(pagamentos)
-            if 'data_pagamento' in df_pag.columns:
-                df_pag['data_pagamento'] = pd.to_datetime(df_pag['data_pagamento']).dt.date
-                daily = df_pag.groupby('data_pagamento').agg({'valor_pago': lambda s: safe_sum(s)}).reset_index()
-                fig = px.line(daily, x='data_pagamento', y='valor_pago', markers=True, title='Recebimentos diários')
-                fig.update_layout(yaxis_title='Valor (€)')
-                st.plotly_chart(fig)
-            else:
-                st.info("Coluna 'data_pagamento' não encontrada nos pagamentos")
+        diarios = kpis.get('recebimentos_diarios') or []
+        if diarios:
+            daily = pd.DataFrame(diarios).rename(columns={'data': 'data_pagamento', 'valor': 'valor_pago'})
+            daily['data_pagamento'] = pd.to_datetime(daily['data_pagamento']).dt.date
+            fig = px.line(daily, x='data_pagamento', y='valor_pago', markers=True, title='Recebimentos diários')
+            fig.update_layout(yaxis_title='Valor (€)')
+            st.plotly_chart(fig)
         else:
             st.info("Sem pagamentos registados ainda")
 
@@ -159,51 +121,52 @@ def render_dashboard(campanha_id=None, show_instructions=True, set_page_config=T
 
     # Top escuteiros by received
     st.subheader("Top Escuteiros — Recebimentos")
-    if pagamentos:
-        df_pag = pd.DataFrame(pagamentos)
-        df_blocos = pd.DataFrame(blocos)
-        if 'bloco_id' in df_pag.columns and not df_blocos.empty:
-            df_merged = df_pag.merge(df_blocos[['id', 'escuteiro_id']], left_on='bloco_id', right_on='id', how='left')
-            esc_df = pd.DataFrame(escuteiros)
-            if not esc_df.empty:
-                df_merged = df_merged.merge(esc_df[['id', 'nome']], left_on='escuteiro_id', right_on='id', how='left', suffixes=('', '_esc'))
-                df_merged['nome'] = df_merged['nome'].fillna('Desconhecido')
-            else:
-                df_merged['nome'] = 'Desconhecido'
-
-            top = df_merged.groupby('nome').agg({'valor_pago': lambda s: safe_sum(s), 'quantidade_rifas': lambda s: safe_sum(s)}).reset_index()
-            top = top.sort_values('valor_pago', ascending=False).head(10)
-            if not top.empty:
-                fig = px.bar(top, x='nome', y='valor_pago', title='Top Escuteiros por Valor Recebido', labels={'nome':'Escuteiro','valor_pago':'Valor (€)'})
-                st.plotly_chart(fig)
-                st.dataframe(top.rename(columns={'nome':'Escuteiro','valor_pago':'Valor Recebido (€)','quantidade_rifas':'Rifas Confirmadas'}), hide_index=True)
-            else:
-                st.info('Sem dados agregados por escuteiro')
-        else:
-            st.info('Dados insuficientes para agregar top escuteiros')
+    top_escuteiros = kpis.get('top_escuteiros') or []
+    if top_escuteiros:
+        top = pd.DataFrame(top_escuteiros)
+        fig = px.bar(top, x='nome', y='valor_pago', title='Top Escuteiros por Valor Recebido', labels={'nome':'Escuteiro','valor_pago':'Valor (€)'})
+        st.plotly_chart(fig)
+        st.dataframe(top.rename(columns={'nome':'Escuteiro','valor_pago':'Valor Recebido (€)','quantidade_rifas':'Rifas Confirmadas'}), hide_index=True)
     else:
         st.info('Ainda não há pagamentos para calcular top escuteiros')
 
     st.markdown('---')
 
     st.subheader('Tabelas e detalhes')
+    # As tabelas detalhadas só são descarregadas quando pedidas
+    campanha_filter = [('eq', 'campanha_id', campanha_id)] if campanha_id else []
     with st.expander('Lista de Blocos (detalhada)', expanded=False):
-        if blocos:
-            df_blocos = pd.DataFrame(blocos)
-            df_blocos['rifas_total'] = df_blocos.apply(rifas_count, axis=1)
-            df_blocos['preco_bloco'] = df_blocos['preco_bloco'].fillna(0)
-            st.dataframe(df_blocos[['id','nome','numero_inicial','numero_final','rifas_total','escuteiro_id','seccao','estado','preco_bloco']])
-        else:
-            st.info('Sem blocos para listar')
+        if st.toggle('Carregar lista de blocos', key='dashboard_carregar_blocos'):
+            blocos = db.select(
+                'blocos_rifas',
+                'id, nome, numero_inicial, numero_final, escuteiro_id, seccao, estado, preco_bloco',
+                filters=campanha_filter,
+                order=[('numero_inicial', False)]
+            )
+            if blocos:
+                df_blocos = pd.DataFrame(blocos)
+                df_blocos['rifas_total'] = df_blocos.apply(rifas_count, axis=1)
+                df_blocos['preco_bloco'] = df_blocos['preco_bloco'].fillna(0)
+                st.dataframe(df_blocos[['id','nome','numero_inicial','numero_final','rifas_total','escuteiro_id','seccao','estado','preco_bloco']])
+            else:
+                st.info('Sem blocos para listar')
 
     with st.expander('Pagamentos recentes', expanded=False):
-        if pagamentos:
-            df_pag = pd.DataFrame(pagamentos)
-            if 'data_pagamento' in df_pag.columns:
-                df_pag['data_pagamento'] = pd.to_datetime(df_pag['data_pagamento']).dt.strftime('%Y-%m-%d')
-            st.dataframe(df_pag.sort_values('data_pagamento', ascending=False).head(50))
-        else:
-            st.info('Sem pagamentos registados')
+        if st.toggle('Carregar pagamentos recentes', key='dashboard_carregar_pagamentos'):
+            pagamentos = db.select(
+                'pagamentos',
+                '*, blocos_rifas!inner(campanha_id)',
+                filters=[('eq', 'blocos_rifas.campanha_id', campanha_id)] if campanha_id else [],
+                order=[('data_pagamento', True)],
+                limit=50
+            )
+            if pagamentos:
+                df_pag = pd.DataFrame(pagamentos).drop(columns=['blocos_rifas'])
+                if 'data_pagamento' in df_pag.columns:
+                    df_pag['data_pagamento'] = pd.to_datetime(df_pag['data_pagamento']).dt.strftime('%Y-%m-%d')
+                st.dataframe(df_pag)
+            else:
+                st.info('Sem pagamentos registados')
 
     st.markdown('---')
     st.caption('Dashboard provisório — se concordares eu refino visual e métricas, adiciono export CSV e alertas configuráveis.')
@@ -0,0 +1,24 @@
+"""
+Flash messages that survive ``st.rerun()``
+
+A write path records its outcome with ``avisar`` and reruns straight away
+(no ``time.sleep`` to let the user read a message that the rerun would
+wipe). ``mostrar``, called by the pages right after their title, shows the
+pending messages of the session as toasts on the next run and clears them.
+"""
+import streamlit as st
+
+_CHAVE = '_avisos'
+
+ICONES = {'success': '✅', 'info': 'ℹ️', 'warning': '⚠️', 'error': '❌'}
+
+
+def avisar(mensagem, tipo='success'):
+    """Queue ``mensagem`` (``tipo`` is a key of ``ICONES``) for the next run."""
+    st.session_state.setdefault(_CHAVE, []).append((tipo, mensagem))
+
+
+def mostrar():
+    """Show and clear the queued messages."""
+    for tipo, mensagem in st.session_state.pop(_CHAVE, []):
+        st.toast(mensagem, icon=ICONES.get(tipo))
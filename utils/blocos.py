@@ -0,0 +1,92 @@
+"""
+Ticket-range helpers shared by the pages and the local backend
+
+The same rules are implemented in SQL by the database functions in
+``scripts/`` (e.g. ``dividir_blocos_irmaos.sql``); keep both in sync.
+"""
+from bisect import bisect_right
+
+
+def dividir_intervalo(numero_inicial, numero_final, n_partes):
+    """Split ``numero_inicial..numero_final`` into ``n_partes`` consecutive ranges.
+
+    Every part gets the same number of tickets; the remainder goes to the
+    first part. Returns a list of ``(inicio, fim)`` tuples.
+    """
+    total = numero_final - numero_inicial + 1
+    if n_partes < 1 or total < n_partes:
+        raise ValueError(f"Não é possível dividir {total} rifas em {n_partes} partes")
+    base, extra = divmod(total, n_partes)
+    intervalos = []
+    inicio = numero_inicial
+    for i in range(n_partes):
+        fim = inicio + base + (extra if i == 0 else 0) - 1
+        intervalos.append((inicio, fim))
+        inicio = fim + 1
+    return intervalos
+
+
+class IndiceRifas:
+    """Sorted interval index over the blocks of one campaign.
+
+    ``procurar(numero)`` finds the block(s) holding a ticket with a bisect
+    over ``numero_inicial`` (O(log n)); ``intersetar(inicio, fim)`` the
+    blocks covering part of a range. Overlapping ranges found while
+    building are listed in ``sobreposicoes`` as ``(bloco_a, bloco_b)`` pairs.
+    """
+
+    def __init__(self, blocos):
+        self._blocos = sorted(blocos, key=lambda b: (b['numero_inicial'], b['numero_final']))
+        self._inicios = [b['numero_inicial'] for b in self._blocos]
+        self._por_id = {b['id']: b for b in self._blocos}
+        # _max_fim[i]: highest numero_final among blocks 0..i (lets overlapping
+        # blocks that start earlier still be found)
+        self._max_fim = []
+        self.sobreposicoes = []
+        anterior = None
+        for bloco in self._blocos:
+            if anterior is not None and bloco['numero_inicial'] <= anterior['numero_final']:
+                self.sobreposicoes.append((anterior, bloco))
+            if anterior is None or bloco['numero_final'] > anterior['numero_final']:
+                anterior = bloco
+            self._max_fim.append(anterior['numero_final'])
+
+    def __len__(self):
+        return len(self._blocos)
+
+    def bloco(self, bloco_id):
+        """Return the block with id ``bloco_id`` (or None)."""
+        return self._por_id.get(bloco_id)
+
+    def procurar(self, numero):
+        """Return the blocks whose range contains ``numero`` (normally 0 or 1)."""
+        return self.intersetar(numero, numero)
+
+    def intersetar(self, inicio, fim):
+        """Return the blocks with at least one ticket in ``inicio..fim``, in order."""
+        i = bisect_right(self._inicios, fim) - 1
+        encontrados = []
+        while i >= 0 and self._max_fim[i] >= inicio:
+            if self._blocos[i]['numero_final'] >= inicio:
+                encontrados.append(self._blocos[i])
+            i -= 1
+        encontrados.reverse()
+        return encontrados
+
+
+def indice_campanha(campanha_id):
+    """Ticket index of a campaign, cached until one of its blocks is written."""
+    from utils import data_access as db
+
+    def construir():
+        return IndiceRifas(db.select(
+            'blocos_rifas',
+            'id, nome, numero_inicial, numero_final, escuteiro_id, seccao, estado',
+            filters=[('eq', 'campanha_id', campanha_id)],
+            use_cache=False
+        ))
+
+    return db.memoize(
+        ('indice_rifas', campanha_id), 'blocos_rifas', construir,
+        filters=[('eq', 'campanha_id', campanha_id)]
+    )
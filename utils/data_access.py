@@ -0,0 +1,620 @@
+"""
+Data-access layer over the Supabase tables
+
+Every page (and ``render_dashboard``) reads and writes through this module
+instead of calling ``supabase.table(...)`` directly:
+
+- Reads are served from a process-wide read-through cache keyed by
+  (table, projection, filters, order, limit). Entries expire after a TTL and
+  the cache is bounded both in number of entries and in total cached rows.
+- Inserts/updates/deletes made through this module invalidate only the cache
+  entries that can be affected by the write, so a page never shows stale data
+  after one of our own writes. Where the rows returned by the write are
+  enough (``insert``, ``update`` and ``delete`` of single-table reads), the
+  cached rows are patched in place instead, so the rerun after a write does
+  not fetch the lists again.
+
+Filters are given as ``(op, column, value)`` tuples, e.g.::
+
+    db.select('blocos_rifas', '*',
+              filters=[('eq', 'campanha_id', cid), ('is', 'escuteiro_id', None)],
+              order=[('numero_inicial', False)])
+
+Supported ops: eq, neq, gt, gte, lt, lte, like, ilike, in, is, not_is.
+
+Reads are paged with ``range()`` so results are never silently truncated at
+PostgREST's max-rows cap (1000 on Supabase); ``iter_rows()`` streams the pages
+as a generator, fetching the next page in the background while the current
+one is consumed. Lists shown a page at a time use ``select_page()``, which
+reads only the requested page with a keyset cursor.
+
+Database functions (see ``scripts/*.sql``) are called with
+``rpc(name, params)``. Read-only ones are cached the same way;
+``RPC_DEPENDENCIES`` lists the tables each one reads so writes to those
+tables invalidate its results. ``RPC_WRITES`` lists the tables written by
+functions that modify data, which are invalidated after every call.
+"""
+import copy
+import os
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from postgrest.types import ReturnMethod
+
+from utils.query_log import bound_run, current_run
+from utils.supabase_client import get_supabase_client
+
+DEFAULT_TTL = float(os.getenv('RIFAS_CACHE_TTL', '120'))
+MAX_ENTRIES = int(os.getenv('RIFAS_CACHE_MAX_ENTRIES', '256'))
+MAX_ROWS = int(os.getenv('RIFAS_CACHE_MAX_ROWS', '250000'))
+# Rows per request; must not exceed the server's max-rows (Supabase: 1000)
+PAGE_SIZE = int(os.getenv('RIFAS_PAGE_SIZE', '1000'))
+# Rows per bulk insert request
+INSERT_CHUNK = int(os.getenv('RIFAS_INSERT_CHUNK', '1000'))
+# ids per ``in`` filter (keeps request URLs well under proxy limits)
+ID_CHUNK = 200
+
+# Views are invalidated whenever one of the tables they read from is written.
+VIEW_DEPENDENCIES = {
+    'vw_blocos_status': ('blocos_rifas',),
+    'vw_pagamentos_por_bloco': ('blocos_rifas', 'pagamentos'),
+    'vw_campanhas_stats': ('blocos_rifas',),
+}
+
+# Tables maintained by database triggers (scripts/saldos.sql) -> tables whose
+# writes change them; cached reads are invalidated like those of a view.
+TRIGGER_DEPENDENCIES = {
+    'saldos_blocos': ('blocos_rifas', 'pagamentos', 'devolucoes'),
+    'saldos_escuteiros': ('blocos_rifas', 'pagamentos', 'devolucoes'),
+}
+
+# Tables -> tables their database triggers write to (utils/database_schema.py:
+# a payment moves its block's ``estado``); invalidated after every write.
+WRITE_SIDE_EFFECTS = {
+    'pagamentos': ('blocos_rifas',),
+}
+
+# Tables whose primary key is not ``id``, and views -> columns used as the
+# paging tie-breaker (views not listed get none).
+ORDER_KEYS = {
+    'saldos_blocos': ('bloco_id',),
+    'saldos_escuteiros': ('escuteiro_id', 'campanha_id'),
+    'vw_blocos_status': ('campanha_id', 'estado'),
+    'vw_pagamentos_por_bloco': ('bloco_id',),
+    'vw_campanhas_stats': ('campanha_id',),
+}
+
+# Read-only RPC functions -> tables they aggregate.
+RPC_DEPENDENCIES = {
+    'dashboard_kpis': ('escuteiros', 'blocos_rifas', 'pagamentos', 'devolucoes'),
+}
+
+# RPC functions that write -> tables they modify.
+RPC_WRITES = {
+    'atribuir_blocos': ('blocos_rifas',),
+    'dividir_blocos_irmaos': ('blocos_rifas',),
+    'marcar_rifas': ('blocos_rifas',),
+    'marcar_intervalo_rifas': ('blocos_rifas',),
+    'reconstruir_saldos': ('saldos_blocos', 'saldos_escuteiros'),
+    'registar_devolucoes': ('devolucoes', 'blocos_rifas'),
+    'eliminar_devolucoes': ('devolucoes', 'blocos_rifas'),
+    'recalcular_estado_blocos': ('blocos_rifas',),
+}
+
+# Write RPCs that return the rows they changed and only modify these columns,
+# so cached reads filtered on other rows (e.g. other campaigns) are kept.
+RPC_CHANGED_COLUMNS = {
+    'marcar_rifas': ('estado_rifas',),
+}
+
+_EMBED_RE = re.compile(r'(\w+)(?:!\w+)?\s*\(')
+
+
+class _Entry:
+    __slots__ = ('table', 'tables', 'filters', 'rows', 'expires_at', 'columns', 'order', 'limit')
+
+    def __init__(self, table, tables, filters, rows, expires_at, columns=None, order=(), limit=None):
+        self.table = table
+        self.tables = tables
+        self.filters = filters
+        self.rows = rows
+        self.expires_at = expires_at
+        # Projection, order and limit of a select (columns is None for other entries)
+        self.columns = columns
+        self.order = order
+        self.limit = limit
+
+
+class QueryCache:
+    """Bounded LRU cache with TTL and table-aware invalidation."""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=MAX_ENTRIES, max_rows=MAX_ROWS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at < time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.rows
+
+    def put(self, key, table, tables, filters, rows, ttl=None, columns=None, order=(), limit=None):
+        if len(rows) > self.max_rows:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = _Entry(table, tables, filters, rows, expires_at, columns, order, limit)
+            self._rows += len(rows)
+            while self._entries and (len(self._entries) > self.max_entries or self._rows > self.max_rows):
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, table, rows=None, changed_columns=()):
+        """Drop entries that may be affected by a write to ``table``.
+
+        ``rows`` are the rows returned by the write (None when unknown) and
+        ``changed_columns`` the columns an update modified. An entry with an
+        ``eq`` filter on an unchanged column that none of the written rows
+        match cannot have been affected and is kept.
+        """
+        with self._lock:
+            stale = [key for key, entry in self._entries.items()
+                     if _is_affected(entry, table, rows, changed_columns)]
+            for key in stale:
+                self._drop(key)
+            return len(stale)
+
+    def apply(self, table, operation, rows, changed_columns=()):
+        """Bring the cache up to date after a write to ``table``.
+
+        ``operation`` is ``'insert'``, ``'update'`` or ``'delete'`` and ``rows``
+        the complete rows the write returned. Entries the write cannot have
+        affected are kept; selects that can be patched with ``rows`` (see
+        ``_patched``) are updated in place, keeping their expiry; the others
+        are dropped as by ``invalidate``.
+        """
+        with self._lock:
+            patched = stale = 0
+            for key, entry in list(self._entries.items()):
+                if not _is_affected(entry, table, rows, changed_columns):
+                    continue
+                novas = _patched(entry, table, operation, rows, changed_columns)
+                if novas is None:
+                    self._drop(key)
+                    stale += 1
+                elif novas is not entry.rows:
+                    self._rows += len(novas) - len(entry.rows)
+                    entry.rows = novas
+                    patched += 1
+            return patched, stale
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._rows = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'rows': self._rows, 'hits': self.hits, 'misses': self.misses}
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._rows -= len(entry.rows)
+
+
+def _is_affected(entry, table, rows, changed_columns):
+    if table not in entry.tables:
+        return False
+    if entry.table != table or not rows:
+        return True
+    for op, column, value in entry.filters:
+        if op == 'eq' and '.' not in column and column not in changed_columns:
+            if not any(row.get(column) == value for row in rows):
+                return False
+    return True
+
+
+_MATCHERS = {
+    'eq': lambda a, b: a == b,
+    'neq': lambda a, b: a is not None and a != b,
+    'in': lambda a, b: a in b,
+    'is': lambda a, b: a is b,
+    'not_is': lambda a, b: a is not b,
+}
+
+
+def _matches(row, filters):
+    """Whether ``row`` passes ``filters`` (None when it cannot be told locally)."""
+    for op, column, value in filters:
+        if op not in _MATCHERS or '.' in column or column not in row:
+            return None
+        if not _MATCHERS[op](row[column], value):
+            return False
+    return True
+
+
+def _plain_columns(columns):
+    """Top-level columns of a projection (None for ``*``) and whether it embeds."""
+    top_level = columns or '*'
+    embeds = '(' in top_level
+    while '(' in top_level:
+        top_level = re.sub(r'[\w!]*\([^()]*\)', '', top_level)
+    names = [part.strip() for part in top_level.split(',') if part.strip()]
+    return (None if '*' in names else set(names)), embeds
+
+
+def _patched(entry, table, operation, rows, changed_columns):
+    """Rows of a cached select after a write that returned ``rows``, or None
+    when the entry cannot be brought up to date locally.
+
+    - update: the rows with the same ``id`` get the new values, unless a
+      column the entry filters or sorts on changed (rows could move in or
+      out) or, for an entry with embedded tables, a foreign key changed
+    - delete: the rows are removed (an entry with a ``limit`` is refetched,
+      the next row would move in)
+    - insert: rows that do not pass the entry's filters leave it unchanged;
+      matching rows are added to unsorted, unlimited single-table selects
+      (kept in ``id`` order, the tie-breaker ``iter_rows`` uses)
+    """
+    if entry.columns is None or entry.table != table or not rows:
+        return None
+    plain, embeds = _plain_columns(entry.columns)
+    if plain is not None and 'id' not in plain:
+        return None
+    if any(row.get('id') is None for row in rows):
+        return None
+
+    if operation == 'update':
+        filtered = {column for _, column, _ in entry.filters} | {column for column, _ in entry.order}
+        if filtered.intersection(changed_columns):
+            return None
+        if embeds and any(column.endswith('_id') for column in changed_columns):
+            return None
+        novos = {row['id']: row for row in rows}
+        if not any(row['id'] in novos for row in entry.rows):
+            return entry.rows
+        return [
+            {**row, **{k: v for k, v in novos[row['id']].items() if plain is None or k in plain}}
+            if row['id'] in novos else row
+            for row in entry.rows
+        ]
+
+    if operation == 'delete':
+        ids = {row['id'] for row in rows}
+        restantes = [row for row in entry.rows if row['id'] not in ids]
+        if len(restantes) == len(entry.rows):
+            return entry.rows
+        return None if entry.limit is not None else restantes
+
+    if operation == 'insert':
+        resultados = [_matches(row, entry.filters) for row in rows]
+        if None in resultados:
+            return None
+        novos = [row for row, passa in zip(rows, resultados) if passa]
+        if not novos:
+            return entry.rows
+        if entry.limit is not None or entry.order or embeds:
+            return None
+        if plain is not None and any(not plain.issubset(row) for row in novos):
+            return None
+        linhas = list(entry.rows)
+        for row in novos:
+            novo = dict(row) if plain is None else {k: row[k] for k in plain}
+            posicao = bisect_left([linha['id'] for linha in linhas], novo['id'])
+            linhas.insert(posicao, novo)
+        return linhas
+
+    return None
+
+
+cache = QueryCache()
+
+
+def _tables_for(table, columns):
+    tables = {table, *_EMBED_RE.findall(columns or '')}
+    for name in list(tables):
+        tables.update(VIEW_DEPENDENCIES.get(name, ()))
+        tables.update(TRIGGER_DEPENDENCIES.get(name, ()))
+    return frozenset(tables)
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(value)
+    return value
+
+
+def _normalize_filters(filters):
+    return tuple((op, column, _freeze(value)) for op, column, value in (filters or ()))
+
+
+def _apply_filters(builder, filters):
+    for op, column, value in filters:
+        if op == 'in':
+            builder = builder.in_(column, list(value))
+        elif op == 'is':
+            builder = builder.is_(column, 'null' if value is None else value)
+        elif op == 'not_is':
+            builder = builder.not_.is_(column, 'null' if value is None else value)
+        else:
+            builder = getattr(builder, op)(column, value)
+    return builder
+
+
+def _fetch_page(table, columns, filters, order, start, end):
+    builder = _apply_filters(get_supabase_client().table(table).select(columns), filters)
+    for column, desc in order:
+        builder = builder.order(column, desc=desc)
+    return builder.range(start, end).execute().data or []
+
+
+def _selects(columns, column):
+    top_level = columns or '*'
+    while '(' in top_level:
+        top_level = re.sub(r'[\w!]*\([^()]*\)', '', top_level)
+    return any(part.strip() in ('*', column) for part in top_level.split(','))
+
+
+_prefetch_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='rifas-prefetch')
+
+
+def _in_background(fn, *args):
+    run = current_run()
+
+    def task():
+        with bound_run(run):
+            return fn(*args)
+    return _prefetch_pool.submit(task)
+
+
+def iter_rows(table, columns='*', filters=None, order=None, limit=None, page_size=None, prefetch=True):
+    """Yield the rows of ``table`` page by page (not cached).
+
+    Pages are requested with ``range()`` and a stable ordering (``id``, or the
+    key in ``ORDER_KEYS``, is appended as a tie-breaker), until a short page comes back or ``limit``
+    rows were produced. With ``prefetch`` the next page is requested while
+    the caller consumes the current one.
+    """
+    filters = _normalize_filters(filters)
+    order = tuple((column, bool(desc)) for column, desc in (order or ()))
+    page_size = page_size or PAGE_SIZE
+    keys = ORDER_KEYS.get(table, () if table in VIEW_DEPENDENCIES else ('id',))
+    if limit is None or limit > page_size:
+        ordered = {column for column, _ in order}
+        order += tuple((key, False) for key in keys if key not in ordered)
+
+    # Ordered by the (single-column) key only: keyset pagination (key > last
+    # key) keeps every page an index range scan; otherwise fall back to offsets.
+    key = keys[0] if len(keys) == 1 else None
+    keyset = key is not None and order == ((key, False),) and _selects(columns, key)
+
+    def request(start, after):
+        size = page_size if limit is None else min(page_size, limit - start)
+        if keyset:
+            page_filters = filters + ((('gt', key, after),) if after is not None else ())
+            return size, _fetch_page(table, columns, page_filters, order, 0, size - 1)
+        return size, _fetch_page(table, columns, filters, order, start, start + size - 1)
+
+    if limit is not None and limit <= 0:
+        return
+    start = 0
+    size, page = request(start, None)
+    while True:
+        start += len(page)
+        more = len(page) == size and (limit is None or start < limit)
+        after = page[-1][key] if keyset and page else None
+        pending = _in_background(request, start, after) if more and prefetch else None
+        yield from page
+        if not more:
+            break
+        size, page = pending.result() if pending else request(start, after)
+
+
+def select(table, columns='*', filters=None, order=None, limit=None, ttl=None, use_cache=True):
+    """Read rows from ``table`` through the cache.
+
+    Returns a new list of (shallow-copied) row dicts, so callers may modify
+    the rows without corrupting the cached copy.
+    """
+    filters = _normalize_filters(filters)
+    order = tuple((column, bool(desc)) for column, desc in (order or ()))
+    key = ('select', table, columns, filters, order, limit)
+
+    rows = cache.get(key) if use_cache else None
+    if rows is None:
+        rows = list(iter_rows(table, columns, filters, order, limit))
+        if use_cache:
+            cache.put(key, table, _tables_for(table, columns), filters, rows, ttl=ttl,
+                      columns=columns, order=order, limit=limit)
+    return [dict(row) for row in rows]
+
+
+def select_one(table, columns='*', filters=None, **kwargs):
+    """Return the first matching row or None."""
+    rows = select(table, columns, filters=filters, limit=1, **kwargs)
+    return rows[0] if rows else None
+
+
+def select_page(table, columns='*', filters=None, column='created_at', desc=True, after=None, size=50, **kwargs):
+    """One page of a list ordered by ``column``, with a keyset cursor.
+
+    ``after`` is the cursor returned for the previous page (``None`` for the
+    first one); the page is read with ``column < after`` (``>`` when
+    ascending), so every page costs the same however far the user goes.
+    Rows sharing the boundary value all go in the same page (which may then
+    be a little longer than ``size``), so a single column is enough for the
+    cursor. Returns ``(rows, cursor)``; ``cursor`` is ``None`` on the last
+    page. Rows without a value in ``column`` are not listed.
+    """
+    filters = _normalize_filters(filters) + (('not_is', column, None),)
+    if after is not None:
+        filters += (('lt' if desc else 'gt', column, after),)
+    rows = select(table, columns, filters=filters, order=[(column, desc)], limit=size + 1, **kwargs)
+    if len(rows) <= size:
+        return rows, None
+    last = rows[size - 1][column]
+    ties = select(table, columns, filters=filters + (('eq', column, last),), **kwargs)
+    return [row for row in rows[:size] if row[column] != last] + ties, last
+
+
+def rpc(name, params=None, ttl=None, use_cache=True):
+    """Call a database function.
+
+    Functions listed in ``RPC_DEPENDENCIES`` are cached until one of their
+    tables is written (or the TTL expires); others are always executed.
+    After a function listed in ``RPC_WRITES`` the tables it modifies are
+    invalidated.
+    """
+    params = dict(params or {})
+    key = ('rpc', name, tuple(sorted((k, _freeze(v)) for k, v in params.items())))
+    cacheable = use_cache and name in RPC_DEPENDENCIES
+
+    entry = cache.get(key) if cacheable else None
+    if entry is not None:
+        return copy.deepcopy(entry[0])
+    data = get_supabase_client().rpc(name, params).execute().data
+    for table in RPC_WRITES.get(name, ()):
+        if name in RPC_CHANGED_COLUMNS and data:
+            cache.invalidate(table, data if isinstance(data, list) else [data],
+                             changed_columns=RPC_CHANGED_COLUMNS[name])
+        else:
+            cache.invalidate(table)
+    if cacheable:
+        cache.put(key, f'rpc:{name}', frozenset(RPC_DEPENDENCIES[name]), (), [data], ttl=ttl)
+    return copy.deepcopy(data)
+
+
+def memoize(key, table, build, filters=None, tables=None, ttl=None):
+    """Cache a value derived from ``table`` (e.g. an index) like a select.
+
+    ``build()`` runs on a miss. The value is shared, not copied, so it must
+    not be modified; it is invalidated by the same writes that would
+    invalidate ``select(table, filters=filters)``.
+    """
+    filters = _normalize_filters(filters)
+    key = ('memoize', key)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry[0]
+    value = build()
+    cache.put(key, table, frozenset(tables or (table,)), filters, [value], ttl=ttl)
+    return value
+
+
+def _invalidate_side_effects(table):
+    for other in WRITE_SIDE_EFFECTS.get(table, ()):
+        cache.invalidate(other)
+
+
+def insert(table, rows):
+    """Insert one row (dict) or many rows (list of dicts) and update the cache
+    with the inserted rows."""
+    data = get_supabase_client().table(table).insert(rows).execute().data or []
+    if data:
+        cache.apply(table, 'insert', data)
+    else:
+        cache.invalidate(table)
+    _invalidate_side_effects(table)
+    return data
+
+
+def insert_many(table, rows, chunk_size=None, on_progress=None):
+    """Insert many rows with one request per chunk, all-or-nothing.
+
+    Rows get a client-side uuid ``id`` (unless given) and are sent with
+    ``returning=minimal``. PostgREST commits each request separately, so if a
+    chunk fails the chunks already inserted are deleted again before the error
+    is re-raised. If some of them cannot be deleted either, the original error
+    is still the one raised, with the ids left in the table in its
+    ``leftover_ids`` attribute. ``on_progress(done, total)`` is called after
+    every chunk. Returns the inserted rows (as sent, with their ids).
+    """
+    rows = [dict(row) for row in rows]
+    for row in rows:
+        row.setdefault('id', str(uuid.uuid4()))
+    chunk_size = chunk_size or INSERT_CHUNK
+
+    done = 0
+    try:
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            get_supabase_client().table(table).insert(chunk, returning=ReturnMethod.minimal).execute()
+            done += len(chunk)
+            if on_progress is not None:
+                on_progress(done, len(rows))
+    except Exception as exc:
+        exc.leftover_ids = _delete_ids(table, [row['id'] for row in rows[:done]])
+        raise
+    finally:
+        if done:
+            cache.invalidate(table, rows[:done])
+            _invalidate_side_effects(table)
+    return rows
+
+
+def _delete_ids(table, ids):
+    """Delete rows by id, one request per chunk; returns the ids of the
+    chunks that failed (a failing chunk does not stop the others)."""
+    failed = []
+    for start in range(0, len(ids), ID_CHUNK):
+        chunk = ids[start:start + ID_CHUNK]
+        try:
+            get_supabase_client().table(table).delete(returning=ReturnMethod.minimal) \
+                .in_('id', chunk).execute()
+        except Exception:
+            failed.extend(chunk)
+    return failed
+
+
+def update(table, values, filters):
+    """Update rows matching ``filters`` and update the cache with the new rows."""
+    filters = _normalize_filters(filters)
+    builder = _apply_filters(get_supabase_client().table(table).update(values), filters)
+    data = builder.execute().data or []
+    if data:
+        cache.apply(table, 'update', data, changed_columns=tuple(values))
+    else:
+        cache.invalidate(table, None, changed_columns=tuple(values))
+    _invalidate_side_effects(table)
+    return data
+
+
+def delete(table, filters):
+    """Delete rows matching ``filters`` and remove them from the cache."""
+    filters = _normalize_filters(filters)
+    builder = _apply_filters(get_supabase_client().table(table).delete(), filters)
+    data = builder.execute().data or []
+    if data:
+        cache.apply(table, 'delete', data)
+    else:
+        cache.invalidate(table)
+    _invalidate_side_effects(table)
+    return data
+
+
+def invalidate(table=None):
+    """Explicitly drop cached reads of ``table`` (or everything)."""
+    if table is None:
+        cache.clear()
+    else:
+        cache.invalidate(table)
@@ -30,7 +30,9 @@ ESTRUTURA DO BANCO DE DADOS
    - Armazena blocos de rifas atribuídos a escuteiros
    - Campos: id, campanha_id, nome, numero_inicial, numero_final, 
             preco_unitario, escuteiro_id, seccao, data_atribuicao, 
-            estado, created_at
+            estado, estado_rifas, created_at
+   - estado_rifas: estado de cada rifa (2 bits por rifa, base64), ver
+     scripts/estado_rifas.sql e utils/estado_rifas.py
    - Estados possíveis: disponivel, atribuido, vendido, devolvido
    - Secções: Lobitos, Exploradores, Pioneiros, Caminheiros
 
@@ -53,8 +55,10 @@ ESTRUTURA DO BANCO DE DADOS
 
 6. devolucoes
    - Armazena devoluções de rifas não vendidas
-   - Campos: id, escuteiro_id, bloco_id, quantidade, motivo,
+   - Campos: id, escuteiro_id, bloco_id, inicio, fim, quantidade, motivo,
             data_devolucao, created_at
+   - inicio/fim: rifas devolvidas (intervalo dentro do bloco), ver
+     scripts/devolucoes_lote.sql e utils/devolucoes.py
 
 ==============================================
 VIEWS DISPONÍVEIS (relatórios automáticos)
@@ -72,6 +76,16 @@ VIEWS DISPONÍVEIS (relatórios automáticos)
 4. vw_canhotos_pendentes
    - Lista de escuteiros com canhotos pendentes de entrega
 
+5. vw_campanhas_stats (scripts/vw_campanhas_stats.sql)
+   - Total de blocos, rifas e blocos vendidos por campanha
+
+6. saldos_blocos / saldos_escuteiros (scripts/saldos.sql)
+   - Tabelas (não views) com o valor esperado, recebido, devolvido e o saldo
+     pendente por bloco e por escuteiro/campanha, atualizadas por triggers
+     em pagamentos, devolucoes e blocos_rifas
+   - vw_saldos_calculados: o mesmo cálculo feito de raiz, usado por
+     reconstruir_saldos() e verificar_saldos()
+
 ==============================================
 FUNCIONALIDADES AUTOMÁTICAS
 ==============================================
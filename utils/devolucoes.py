@@ -0,0 +1,292 @@
+"""
+Bulk returns (``devolucoes``) for the Devoluções page
+
+Every return records the tickets that came back as a range (``inicio`` /
+``fim``) inside one block, so a ticket cannot be returned twice and the draw
+(``utils/sorteio.py``) leaves out exactly those tickets. Returns recorded
+before, with a quantity only, stand for the last tickets of the block.
+
+A batch is a list of requests, each either a ticket range (``inicio`` /
+``fim``) or a block id (optionally with a ``quantidade``: the last tickets
+of the block not returned yet; by default all of them). ``validar_lote``
+resolves and checks them in memory against the campaign's ticket index
+(``utils/blocos.py``) and the ranges already returned: a range is split over
+the blocks it covers, and ranges outside every block, unassigned blocks and
+tickets already returned (or twice in the batch) are reported per row.
+
+``registar_lote`` (or ``registar``, which raises instead of filling in the
+report) sends the resulting ranges in one call to the
+``registar_devolucoes`` database function (``scripts/devolucoes_lote.sql``),
+which inserts them and recomputes the state of every block involved in
+the same transaction: a block is ``devolvido`` only once all its tickets
+have come back. ``eliminar`` deletes returns the same way.
+"""
+import re
+from datetime import date
+
+from utils.pagamentos import _data, _vazio
+
+# Columns of an uploaded batch; each row needs bloco_id or inicio (and fim)
+COLUNAS_LOTE = ['bloco_id', 'inicio', 'fim', 'quantidade', 'motivo', 'data_devolucao']
+
+OK = "✅ Registado"
+
+_INTERVALO_RE = re.compile(r'^(\d+)\s*(?:-\s*(\d+))?$')
+
+
+def interpretar_intervalos(texto):
+    """Parse ``"100-150, 200; 301-310"`` (also one per line) into ``(inicio, fim)`` tuples."""
+    intervalos = []
+    for parte in re.split(r'[,;\n]+', texto or ''):
+        parte = parte.strip()
+        if not parte:
+            continue
+        encontrado = _INTERVALO_RE.match(parte)
+        if not encontrado:
+            raise ValueError(f"Intervalo inválido: '{parte}' (use por exemplo 100-150)")
+        inicio = int(encontrado.group(1))
+        fim = int(encontrado.group(2) or inicio)
+        if fim < inicio:
+            raise ValueError(f"Intervalo inválido: '{parte}' (o fim é menor que o início)")
+        intervalos.append((inicio, fim))
+    return intervalos
+
+
+def juntar_intervalos(intervalos):
+    """Sorted ``(inicio, fim)`` ranges with the overlapping/adjacent ones merged."""
+    juntos = []
+    for de, ate in sorted(intervalos):
+        if juntos and de <= juntos[-1][1] + 1:
+            juntos[-1] = (juntos[-1][0], max(juntos[-1][1], ate))
+        else:
+            juntos.append((de, ate))
+    return juntos
+
+
+def contar(intervalos):
+    """Number of tickets in merged ranges."""
+    return sum(ate - de + 1 for de, ate in intervalos)
+
+
+def intervalos_devolvidos(devolucoes):
+    """Returned ranges per block of ``devolucoes`` rows.
+
+    Each row needs ``bloco_id``, ``quantidade``, ``inicio``, ``fim`` and the
+    block's ``numero_inicial``/``numero_final`` (embedded as
+    ``blocos_rifas``). Rows without a range (recorded before ranges were
+    kept) take the last tickets of the block. Returns ``{bloco_id: ranges}``
+    with the ranges merged.
+    """
+    intervalos, legado, limites = {}, {}, {}
+    for d in devolucoes:
+        if d.get('inicio') is not None and d.get('fim') is not None:
+            intervalos.setdefault(d['bloco_id'], []).append((d['inicio'], d['fim']))
+        elif d.get('quantidade'):
+            legado[d['bloco_id']] = legado.get(d['bloco_id'], 0) + d['quantidade']
+            limites[d['bloco_id']] = d['blocos_rifas']
+    for bloco_id, n in legado.items():
+        bloco = limites[bloco_id]
+        inicio = max(bloco['numero_inicial'], bloco['numero_final'] - n + 1)
+        intervalos.setdefault(bloco_id, []).append((inicio, bloco['numero_final']))
+    return {bloco_id: juntar_intervalos(faixas) for bloco_id, faixas in intervalos.items()}
+
+
+def devolvidas_por_bloco(campanha_id, use_cache=True):
+    """Returned ranges per block of a campaign (see ``intervalos_devolvidos``)."""
+    from utils import data_access as db
+
+    return intervalos_devolvidos(db.select(
+        'devolucoes',
+        'bloco_id, quantidade, inicio, fim, blocos_rifas!inner(campanha_id, numero_inicial, numero_final)',
+        filters=[('eq', 'blocos_rifas.campanha_id', campanha_id)],
+        use_cache=use_cache
+    ))
+
+
+def _total(bloco):
+    return bloco['numero_final'] - bloco['numero_inicial'] + 1
+
+
+def _rotulo(bloco):
+    return f"{bloco['numero_inicial']}-{bloco['numero_final']}"
+
+
+def _livres(bloco, devolvidos):
+    """Ranges of a block not in ``devolvidos`` (merged ranges)."""
+    livres, proximo = [], bloco['numero_inicial']
+    for de, ate in devolvidos:
+        if de > proximo:
+            livres.append((proximo, min(de - 1, bloco['numero_final'])))
+        proximo = max(proximo, ate + 1)
+    if proximo <= bloco['numero_final']:
+        livres.append((proximo, bloco['numero_final']))
+    return livres
+
+
+def _ultimas(livres, n):
+    """The last ``n`` tickets of ``livres``, as ranges in ticket order."""
+    escolhidos = []
+    for de, ate in reversed(livres):
+        if n <= 0:
+            break
+        de = max(de, ate - n + 1)
+        escolhidos.append((de, ate))
+        n -= ate - de + 1
+    return escolhidos[::-1]
+
+
+def validar_lote(pedidos, indice, devolvidas, motivo=None, data_devolucao=None):
+    """Validate a batch of return requests against a campaign.
+
+    ``pedidos`` is a DataFrame or list of dicts with ``COLUNAS_LOTE``;
+    ``indice`` the campaign's ``IndiceRifas`` and ``devolvidas`` the result of
+    ``devolvidas_por_bloco``. ``motivo`` and ``data_devolucao`` are used for
+    rows that leave them empty. Returns ``(relatorio, registos)``: one report
+    dict per request (its ``Resultado`` is an error or ``None`` when valid)
+    and the ranges for ``registar_devolucoes`` as ``(report index, row)``
+    pairs. A request that fails is left out whole, even if it spans valid
+    blocks.
+    """
+    if hasattr(pedidos, 'to_dict'):
+        pedidos = pedidos.to_dict('records')
+    hoje = date.today().isoformat()
+    # Ranges of earlier rows of the batch per block, with their line
+    planeados = {}
+
+    relatorio, registos = [], []
+    for idx, pedido in enumerate(pedidos):
+        linha = idx + 2  # as in the uploaded file (row 1 is the header)
+        bloco_id = '' if _vazio(pedido.get('bloco_id')) else str(pedido['bloco_id']).strip()
+        inicio, fim, quantidade = pedido.get('inicio'), pedido.get('fim'), pedido.get('quantidade')
+        if not bloco_id and _vazio(inicio):
+            continue
+
+        # partes: (bloco, de, ate) ranges the request returns
+        erro, partes = None, []
+        try:
+            inicio = None if _vazio(inicio) else int(float(inicio))
+            fim = inicio if _vazio(fim) else int(float(fim))
+            quantidade = None if _vazio(quantidade) else int(float(quantidade))
+        except (TypeError, ValueError):
+            erro = "início, fim ou quantidade não numéricos"
+        data_pedido = pedido.get('data_devolucao')
+        if not erro:
+            try:
+                data_pedido = (data_devolucao or hoje) if _vazio(data_pedido) else _data(data_pedido)
+            except (TypeError, ValueError):
+                erro = f"data inválida: {data_pedido}"
+
+        if erro:
+            pass  # already set while parsing
+        elif bloco_id:
+            # A whole block, or its last tickets not returned yet by quantity
+            bloco = indice.bloco(bloco_id)
+            if bloco is None:
+                erro = f"bloco {bloco_id} não existe nesta campanha"
+            elif inicio is not None:
+                erro = "indique o bloco ou o intervalo de rifas, não ambos"
+            elif not bloco.get('escuteiro_id'):
+                erro = f"o bloco {_rotulo(bloco)} não está atribuído"
+            else:
+                livres = _livres(bloco, juntar_intervalos(
+                    devolvidas.get(bloco_id, []) + [(de, ate) for de, ate, _ in planeados.get(bloco_id, ())]
+                ))
+                restantes = contar(livres)
+                if restantes == 0:
+                    erro = f"o bloco {_rotulo(bloco)} já foi todo devolvido"
+                elif quantidade is not None and quantidade < 1:
+                    erro = "a quantidade tem de ser positiva"
+                elif quantidade is not None and quantidade > restantes:
+                    erro = f"o bloco {_rotulo(bloco)} só tem {restantes} rifa(s) por devolver"
+                else:
+                    partes = [(bloco, de, ate) for de, ate in _ultimas(livres, quantidade or restantes)]
+        elif fim < inicio:
+            erro = f"intervalo inválido: {inicio}-{fim}"
+        elif quantidade is not None:
+            erro = "a quantidade é calculada a partir do intervalo; deixe-a em branco"
+        else:
+            # A ticket range, split over the blocks it covers
+            cobertas = 0
+            for bloco in indice.intersetar(inicio, fim):
+                de, ate = max(inicio, bloco['numero_inicial']), min(fim, bloco['numero_final'])
+                partes.append((bloco, de, ate))
+                cobertas += ate - de + 1
+            if cobertas < fim - inicio + 1:
+                erro = f"{fim - inicio + 1 - cobertas} rifa(s) de {inicio}-{fim} não pertencem a nenhum bloco"
+
+        for bloco, de, ate in partes:
+            if erro:
+                break
+            if not bloco.get('escuteiro_id'):
+                erro = f"o bloco {_rotulo(bloco)} não está atribuído"
+                break
+            for a, b in devolvidas.get(bloco['id'], ()):
+                if a <= ate and de <= b:
+                    erro = f"rifas {max(a, de)}-{min(b, ate)} já devolvidas"
+                    break
+            for a, b, outra in planeados.get(bloco['id'], ()):
+                if not erro and a <= ate and de <= b:
+                    erro = f"rifas {max(a, de)}-{min(b, ate)} repetidas (linha {outra})"
+
+        relatorio.append({
+            'Linha': linha,
+            'Pedido': (f"{inicio}-{fim}" if fim != inicio else str(inicio)) if inicio is not None else bloco_id,
+            'Blocos': ', '.join(dict.fromkeys(_rotulo(b) for b, _, _ in partes)),
+            'Rifas': sum(ate - de + 1 for _, de, ate in partes) or None,
+            'Resultado': f"❌ {erro}" if erro else None,
+        })
+        if erro:
+            continue
+        texto_motivo = pedido.get('motivo')
+        texto_motivo = motivo if _vazio(texto_motivo) else str(texto_motivo).strip()
+        for bloco, de, ate in partes:
+            planeados.setdefault(bloco['id'], []).append((de, ate, linha))
+            registos.append((len(relatorio) - 1, {
+                'bloco_id': bloco['id'],
+                'inicio': de,
+                'fim': ate,
+                'quantidade': ate - de + 1,
+                'motivo': texto_motivo or None,
+                'data_devolucao': data_pedido,
+            }))
+    return relatorio, registos
+
+
+def registar(registos):
+    """Register the ranges of ``validar_lote`` with one call to
+    ``registar_devolucoes`` (all or nothing; raises on failure).
+
+    Returns the database function's rows (block id, new ``estado``, tickets
+    returned and remaining).
+    """
+    from utils import data_access as db
+
+    return db.rpc('registar_devolucoes', {'p_devolucoes': [registo for _, registo in registos]}) or []
+
+
+def registar_lote(relatorio, registos):
+    """``registar`` the valid rows of ``validar_lote`` and fill in their
+    ``Resultado``. Returns the rows of ``registar``, or an empty list when
+    nothing was registered.
+    """
+    if not registos:
+        return []
+    try:
+        estados = registar(registos)
+    except Exception as e:
+        for pos, _ in registos:
+            relatorio[pos]['Resultado'] = f"❌ não gravado: {e}"
+        return []
+    for pos, _ in registos:
+        relatorio[pos]['Resultado'] = OK
+    return estados
+
+
+def eliminar(devolucao_ids):
+    """Delete returns and recompute their blocks' state (one transaction).
+
+    Returns the state of the blocks involved; empty when nothing was deleted.
+    """
+    from utils import data_access as db
+
+    return db.rpc('eliminar_devolucoes', {'p_ids': list(devolucao_ids)}) or []
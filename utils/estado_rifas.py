@@ -0,0 +1,167 @@
+"""
+Per-ticket status of the raffle tickets, stored as a compact bitmap per block
+
+Each ticket of a block takes 2 bits in ``blocos_rifas.estado_rifas``
+(base64 text, 4 tickets per byte): ticket ``numero_inicial + k`` lives in
+byte ``k // 4`` at bit ``2 * (k % 4)``. A 100 000-ticket campaign therefore
+needs ~25 KB instead of 100 000 rows. A NULL (or short) bitmap means the
+missing tickets are still ``por_vender``; extra bytes beyond the block's
+range are ignored, so a block that shrinks (e.g. a split between siblings)
+keeps the status of the tickets it still holds; the blocks created for the
+other siblings get their slice of the bitmap (``fatia``).
+
+Writes go through the ``marcar_intervalo_rifas`` / ``marcar_rifas``
+database functions (``scripts/estado_rifas.sql``), which change the bitmaps
+under row locks; the same bit layout is implemented there, keep both in sync.
+"""
+import base64
+
+import numpy as np
+
+POR_VENDER, VENDIDA, DEVOLVIDA, PERDIDA = 0, 1, 2, 3
+ESTADOS = {
+    'por_vender': POR_VENDER,
+    'vendida': VENDIDA,
+    'devolvida': DEVOLVIDA,
+    'perdida': PERDIDA,
+}
+NOMES_ESTADOS = {codigo: nome for nome, codigo in ESTADOS.items()}
+
+_DESLOCAMENTOS = np.array([0, 2, 4, 6], dtype=np.uint8)
+
+
+def _bytes(bitmap):
+    if not bitmap:
+        return b''
+    if isinstance(bitmap, (bytes, bytearray, memoryview)):
+        return bytes(bitmap)
+    return base64.b64decode(bitmap)
+
+
+def desempacotar(bitmap, total):
+    """Status codes (uint8 array of length ``total``) of a block's tickets."""
+    dados = np.frombuffer(_bytes(bitmap), dtype=np.uint8)[:(total + 3) // 4]
+    codigos = ((dados[:, None] >> _DESLOCAMENTOS) & 3).ravel()[:total]
+    if len(codigos) < total:
+        codigos = np.concatenate([codigos, np.zeros(total - len(codigos), dtype=np.uint8)])
+    return codigos
+
+
+def empacotar(codigos):
+    """Inverse of ``desempacotar``: base64 bitmap of an array of status codes."""
+    codigos = np.asarray(codigos, dtype=np.uint8)
+    preenchidos = np.zeros(-(-len(codigos) // 4) * 4, dtype=np.uint8)
+    preenchidos[:len(codigos)] = codigos & 3
+    dados = (preenchidos.reshape(-1, 4) << _DESLOCAMENTOS).sum(axis=1, dtype=np.uint8)
+    return base64.b64encode(dados.tobytes()).decode('ascii')
+
+
+def fatia(bitmap, k0, total):
+    """Bitmap of the ``total`` tickets starting at index ``k0`` of a block
+    (None when the block has no bitmap)."""
+    if not bitmap:
+        return None
+    return empacotar(desempacotar(bitmap, k0 + total)[k0:])
+
+
+def marcar(bitmap, numero_inicial, numero_final, inicio, fim, estado):
+    """Return the bitmap of a block with tickets ``inicio..fim`` set to ``estado``."""
+    if estado not in NOMES_ESTADOS:
+        raise ValueError(f"Estado de rifa inválido: {estado}")
+    if inicio > fim or inicio < numero_inicial or fim > numero_final:
+        raise ValueError(f"As rifas {inicio}-{fim} não pertencem ao bloco {numero_inicial}-{numero_final}")
+    codigos = desempacotar(bitmap, numero_final - numero_inicial + 1).copy()
+    codigos[inicio - numero_inicial:fim - numero_inicial + 1] = estado
+    return empacotar(codigos)
+
+
+def codigos_blocos(blocos):
+    """Decode the bitmaps of many blocks at once.
+
+    Returns ``(numeros, codigos)``: the ticket number and status code of every
+    ticket of ``blocos`` (dicts with ``numero_inicial``, ``numero_final`` and
+    ``estado_rifas``), concatenated in block order.
+    """
+    if not blocos:
+        vazio = np.zeros(0, dtype=np.int64)
+        return vazio, vazio.astype(np.uint8)
+    inicios = np.fromiter((b['numero_inicial'] for b in blocos), dtype=np.int64, count=len(blocos))
+    totais = np.fromiter((b['numero_final'] - b['numero_inicial'] + 1 for b in blocos),
+                         dtype=np.int64, count=len(blocos))
+    tamanhos = (totais + 3) // 4
+
+    # Bitmaps normalized to exactly ceil(total / 4) bytes, then decoded in one pass
+    partes = []
+    for bloco, tamanho in zip(blocos, tamanhos.tolist()):
+        dados = _bytes(bloco.get('estado_rifas'))[:tamanho]
+        partes.append(dados + bytes(tamanho - len(dados)))
+    dados = np.frombuffer(b''.join(partes), dtype=np.uint8)
+    codigos = ((dados[:, None] >> _DESLOCAMENTOS) & 3).ravel()
+
+    # Drop the padding bits of each block's last byte
+    bits_por_bloco = tamanhos * 4
+    deslocamento = np.arange(len(codigos)) - np.repeat(np.cumsum(bits_por_bloco) - bits_por_bloco, bits_por_bloco)
+    validos = deslocamento < np.repeat(totais, bits_por_bloco)
+    numeros = np.repeat(inicios, bits_por_bloco) + deslocamento
+    return numeros[validos], codigos[validos]
+
+
+def contar(blocos):
+    """Number of tickets per status name over ``blocos``."""
+    _, codigos = codigos_blocos(blocos)
+    contagem = np.bincount(codigos, minlength=len(NOMES_ESTADOS))
+    return {nome: int(contagem[codigo]) for codigo, nome in NOMES_ESTADOS.items()}
+
+
+def numeros_com_estado(blocos, estado):
+    """Sorted ticket numbers of ``blocos`` with status ``estado``."""
+    numeros, codigos = codigos_blocos(blocos)
+    return np.sort(numeros[codigos == estado])
+
+
+def compactar_intervalos(numeros):
+    """``[1, 2, 3, 7, 9, 10]`` -> ``[(1, 3), (7, 7), (9, 10)]`` (sorted input)."""
+    numeros = np.asarray(numeros, dtype=np.int64)
+    if len(numeros) == 0:
+        return []
+    quebras = np.flatnonzero(np.diff(numeros) != 1)
+    inicios = numeros[np.concatenate([[0], quebras + 1])]
+    fins = numeros[np.concatenate([quebras, [len(numeros) - 1]])]
+    return list(zip(inicios.tolist(), fins.tolist()))
+
+
+def blocos_campanha(campanha_id):
+    """Blocks of a campaign with the columns needed by ``contar``/``numeros_com_estado``."""
+    from utils import data_access as db
+    return db.select(
+        'blocos_rifas', 'id, numero_inicial, numero_final, estado_rifas',
+        filters=[('eq', 'campanha_id', campanha_id)]
+    )
+
+
+def marcar_rifas(bloco_id, inicio, fim, estado):
+    """Set tickets ``inicio..fim`` of a block to ``estado`` (one atomic call)."""
+    from utils import data_access as db
+    return db.rpc('marcar_rifas', {
+        'p_bloco_id': bloco_id,
+        'p_inicio': int(inicio),
+        'p_fim': int(fim),
+        'p_estado': int(estado),
+    })
+
+
+def marcar_intervalo(campanha_id, inicio, fim, estado):
+    """Set tickets ``inicio..fim`` of every block of a campaign to ``estado``.
+
+    One atomic call, however many blocks the range covers. Returns
+    ``(blocos, marcadas)``: blocks changed and tickets marked.
+    """
+    from utils import data_access as db
+    resultado = db.rpc('marcar_intervalo_rifas', {
+        'p_campanha_id': campanha_id,
+        'p_inicio': int(inicio),
+        'p_fim': int(fim),
+        'p_estado': int(estado),
+    })
+    linha = (resultado[0] if isinstance(resultado, list) else resultado) or {}
+    return linha.get('blocos') or 0, linha.get('rifas_marcadas') or 0
@@ -0,0 +1,1294 @@
+"""
+Offline stand-in for the Supabase client, backed by SQLite
+
+Implements the subset of the postgrest query builder used by the app so the
+whole application (and the benchmark scripts) can run on a laptop without a
+Supabase project or network access:
+
+- ``select`` with embedded resources (``escuteiros(nome)``,
+  ``blocos_rifas!inner(..., escuteiros(nome))``) and filters on embedded
+  columns (``blocos_rifas.campanha_id``)
+- filters ``eq``, ``neq``, ``gt``, ``gte``, ``lt``, ``lte``, ``like``,
+  ``ilike``, ``in_``, ``is_`` and ``not_.<filter>``
+- ``order``, ``limit``, ``range``, ``single``, ``maybe_single`` and
+  ``count='exact'``, with the same silent max-rows cap PostgREST applies
+  (``RIFAS_SQLITE_MAX_ROWS``, default 1000 like Supabase)
+- ``insert``, ``upsert``, ``update`` and ``delete`` returning the affected rows
+- ``rpc`` for the database functions registered in ``RPC_FUNCTIONS``
+
+Enable it with ``RIFAS_BACKEND=sqlite`` (see ``utils/supabase_client.py``);
+the database file is ``RIFAS_SQLITE_PATH`` (default ``rifas_local.db``).
+Errors are raised as ``postgrest.exceptions.APIError`` with the same codes
+and messages PostgREST uses, so the pages' error handling is exercised too.
+"""
+import json
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from postgrest.exceptions import APIError
+
+from utils.blocos import dividir_intervalo
+from utils import estado_rifas
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS campanhas (
+    id TEXT PRIMARY KEY,
+    nome TEXT NOT NULL UNIQUE,
+    descricao TEXT,
+    data_inicio TEXT,
+    data_fim TEXT,
+    ativa BOOLEAN DEFAULT 0,
+    created_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS escuteiros (
+    id TEXT PRIMARY KEY,
+    nome TEXT NOT NULL,
+    email TEXT,
+    telefone TEXT,
+    seccao TEXT,
+    ativo BOOLEAN DEFAULT 1,
+    created_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS blocos_rifas (
+    id TEXT PRIMARY KEY,
+    campanha_id TEXT REFERENCES campanhas(id) ON DELETE CASCADE,
+    nome TEXT,
+    numero_inicial INTEGER NOT NULL,
+    numero_final INTEGER NOT NULL,
+    preco_unitario REAL,
+    preco_bloco REAL,
+    escuteiro_id TEXT REFERENCES escuteiros(id),
+    seccao TEXT,
+    data_atribuicao TEXT,
+    estado TEXT DEFAULT 'disponivel',
+    observacoes TEXT,
+    estado_rifas TEXT,
+    created_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS pagamentos (
+    id TEXT PRIMARY KEY,
+    venda_id TEXT,
+    bloco_id TEXT REFERENCES blocos_rifas(id) ON DELETE CASCADE,
+    quantidade_rifas INTEGER,
+    valor_pago REAL NOT NULL DEFAULT 0,
+    data_pagamento TEXT,
+    metodo_pagamento TEXT,
+    referencia TEXT,
+    observacoes TEXT,
+    canhotos_entregues INTEGER,
+    canhotos_esperados INTEGER,
+    data_entrega_canhotos TEXT,
+    observacoes_canhotos TEXT,
+    rifas_entregues INTEGER,
+    created_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS devolucoes (
+    id TEXT PRIMARY KEY,
+    escuteiro_id TEXT REFERENCES escuteiros(id),
+    bloco_id TEXT REFERENCES blocos_rifas(id) ON DELETE CASCADE,
+    inicio INTEGER,
+    fim INTEGER,
+    quantidade INTEGER NOT NULL,
+    motivo TEXT,
+    data_devolucao TEXT,
+    created_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_blocos_campanha ON blocos_rifas(campanha_id, numero_inicial);
+CREATE INDEX IF NOT EXISTS idx_blocos_escuteiro ON blocos_rifas(escuteiro_id);
+CREATE INDEX IF NOT EXISTS idx_pagamentos_bloco ON pagamentos(bloco_id);
+CREATE INDEX IF NOT EXISTS idx_devolucoes_bloco ON devolucoes(bloco_id);
+
+CREATE TABLE IF NOT EXISTS sorteios (
+    id TEXT PRIMARY KEY,
+    campanha_id TEXT REFERENCES campanhas(id) ON DELETE CASCADE,
+    semente TEXT NOT NULL,
+    criterio TEXT NOT NULL,
+    n_premios INTEGER NOT NULL,
+    total_rifas INTEGER NOT NULL,
+    impressao_digital TEXT NOT NULL,
+    vencedores TEXT NOT NULL,
+    observacoes TEXT,
+    created_at TEXT
+);
+
+-- scripts/saldos.sql (replaces the vw_saldos_blocos view)
+DROP VIEW IF EXISTS vw_saldos_blocos;
+
+CREATE TABLE IF NOT EXISTS saldos_blocos (
+    bloco_id TEXT PRIMARY KEY REFERENCES blocos_rifas(id) ON DELETE CASCADE,
+    campanha_id TEXT REFERENCES campanhas(id) ON DELETE CASCADE,
+    escuteiro_id TEXT REFERENCES escuteiros(id),
+    valor_esperado REAL NOT NULL DEFAULT 0,
+    valor_recebido REAL NOT NULL DEFAULT 0,
+    n_pagamentos INTEGER NOT NULL DEFAULT 0,
+    rifas_devolvidas INTEGER NOT NULL DEFAULT 0,
+    valor_devolvido REAL NOT NULL DEFAULT 0,
+    saldo REAL NOT NULL DEFAULT 0,
+    atualizado_em TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_saldos_blocos_campanha ON saldos_blocos(campanha_id, escuteiro_id);
+
+CREATE TABLE IF NOT EXISTS saldos_escuteiros (
+    escuteiro_id TEXT REFERENCES escuteiros(id) ON DELETE CASCADE,
+    campanha_id TEXT REFERENCES campanhas(id) ON DELETE CASCADE,
+    n_blocos INTEGER NOT NULL DEFAULT 0,
+    valor_esperado REAL NOT NULL DEFAULT 0,
+    valor_recebido REAL NOT NULL DEFAULT 0,
+    n_pagamentos INTEGER NOT NULL DEFAULT 0,
+    rifas_devolvidas INTEGER NOT NULL DEFAULT 0,
+    valor_devolvido REAL NOT NULL DEFAULT 0,
+    saldo REAL NOT NULL DEFAULT 0,
+    atualizado_em TEXT,
+    PRIMARY KEY (escuteiro_id, campanha_id)
+);
+
+CREATE VIEW IF NOT EXISTS vw_saldos_calculados AS
+SELECT
+    bloco_id, campanha_id, escuteiro_id, valor_esperado, valor_recebido, n_pagamentos,
+    rifas_devolvidas, valor_devolvido,
+    valor_esperado - valor_devolvido - valor_recebido AS saldo
+FROM (
+    SELECT
+        b.id AS bloco_id,
+        b.campanha_id,
+        b.escuteiro_id,
+        COALESCE(b.preco_bloco, 0) AS valor_esperado,
+        (SELECT COALESCE(sum(valor_pago), 0) FROM pagamentos WHERE bloco_id = b.id) AS valor_recebido,
+        (SELECT count(*) FROM pagamentos WHERE bloco_id = b.id) AS n_pagamentos,
+        min((SELECT COALESCE(sum(quantidade), 0) FROM devolucoes WHERE bloco_id = b.id),
+            b.numero_final - b.numero_inicial + 1) AS rifas_devolvidas,
+        round(min((SELECT COALESCE(sum(quantidade), 0) FROM devolucoes WHERE bloco_id = b.id),
+                  b.numero_final - b.numero_inicial + 1)
+              * COALESCE(b.preco_unitario, COALESCE(b.preco_bloco, 0) * 1.0 / (b.numero_final - b.numero_inicial + 1)),
+              2) AS valor_devolvido
+    FROM blocos_rifas b
+);
+
+-- scripts/vw_campanhas_stats.sql
+CREATE VIEW IF NOT EXISTS vw_campanhas_stats AS
+SELECT
+    campanha_id,
+    count(*) AS total_blocos,
+    COALESCE(sum(numero_final - numero_inicial + 1), 0) AS total_rifas,
+    sum(estado = 'vendido') AS blocos_vendidos
+FROM blocos_rifas
+GROUP BY campanha_id;
+"""
+
+# Many-to-one foreign keys: (table, column) -> referenced table (by id).
+# The reverse (one-to-many) embeds are derived from the same list.
+FOREIGN_KEYS = {
+    ('blocos_rifas', 'campanha_id'): 'campanhas',
+    ('blocos_rifas', 'escuteiro_id'): 'escuteiros',
+    ('pagamentos', 'bloco_id'): 'blocos_rifas',
+    ('devolucoes', 'escuteiro_id'): 'escuteiros',
+    ('devolucoes', 'bloco_id'): 'blocos_rifas',
+    ('sorteios', 'campanha_id'): 'campanhas',
+    ('saldos_blocos', 'bloco_id'): 'blocos_rifas',
+    ('saldos_blocos', 'escuteiro_id'): 'escuteiros',
+    ('saldos_escuteiros', 'escuteiro_id'): 'escuteiros',
+    ('saldos_escuteiros', 'campanha_id'): 'campanhas',
+}
+
+BOOLEAN_COLUMNS = {'ativa', 'ativo'}
+# jsonb columns, stored as JSON text
+JSON_COLUMNS = {'vencedores'}
+
+# Columns added after the first release: (table, column, type), added with
+# ALTER TABLE to database files created before them (like the scripts/*.sql
+# migrations do on Supabase).
+ADDED_COLUMNS = [
+    ('blocos_rifas', 'estado_rifas', 'TEXT'),  # scripts/estado_rifas.sql
+    ('devolucoes', 'inicio', 'INTEGER'),  # scripts/devolucoes_lote.sql
+    ('devolucoes', 'fim', 'INTEGER'),
+]
+
+# Triggers keeping saldos_blocos / saldos_escuteiros up to date
+# (scripts/saldos.sql: atualizar_saldo_bloco / atualizar_saldo_escuteiro).
+# SQLite triggers cannot call functions, so the refresh statements are
+# generated for each (trigger, key expression).
+_SALDOS_COLUNAS = ('bloco_id, campanha_id, escuteiro_id, valor_esperado, valor_recebido, '
+                   'n_pagamentos, rifas_devolvidas, valor_devolvido, saldo')
+_AGORA = "strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')"
+
+
+def _refrescar_bloco(bloco):
+    return (
+        f'DELETE FROM saldos_blocos WHERE bloco_id = {bloco};\n'
+        f'INSERT INTO saldos_blocos ({_SALDOS_COLUNAS}, atualizado_em) '
+        f'SELECT {_SALDOS_COLUNAS}, {_AGORA} FROM vw_saldos_calculados WHERE bloco_id = {bloco};\n'
+    )
+
+
+def _refrescar_escuteiro(escuteiro, campanha):
+    return (
+        f'DELETE FROM saldos_escuteiros WHERE escuteiro_id = {escuteiro} AND campanha_id = {campanha};\n'
+        'INSERT INTO saldos_escuteiros (escuteiro_id, campanha_id, n_blocos, valor_esperado, valor_recebido, '
+        'n_pagamentos, rifas_devolvidas, valor_devolvido, saldo, atualizado_em) '
+        f'SELECT {escuteiro}, {campanha}, count(*), sum(valor_esperado), sum(valor_recebido), sum(n_pagamentos), '
+        f'sum(rifas_devolvidas), sum(valor_devolvido), sum(saldo), {_AGORA} FROM saldos_blocos '
+        f'WHERE escuteiro_id = {escuteiro} AND campanha_id = {campanha} HAVING count(*) > 0;\n'
+    )
+
+
+def _refrescar_por_bloco_id(linha):
+    """Refresh for a pagamentos/devolucoes row (``NEW``/``OLD``) and its block's scout."""
+    return _refrescar_bloco(f'{linha}.bloco_id') + _refrescar_escuteiro(
+        f'(SELECT escuteiro_id FROM blocos_rifas WHERE id = {linha}.bloco_id)',
+        f'(SELECT campanha_id FROM blocos_rifas WHERE id = {linha}.bloco_id)'
+    )
+
+
+def _trigger(nome, evento, corpo):
+    return f'CREATE TRIGGER IF NOT EXISTS {nome} AFTER {evento} FOR EACH ROW BEGIN\n{corpo}END;\n'
+
+
+SALDOS_TRIGGERS_SQL = ''.join([
+    *(
+        _trigger(f'trg_saldos_{tabela}_ins', f'INSERT ON {tabela}', _refrescar_por_bloco_id('NEW'))
+        + _trigger(f'trg_saldos_{tabela}_upd', f'UPDATE OF bloco_id, {coluna} ON {tabela}',
+                   _refrescar_por_bloco_id('OLD') + _refrescar_por_bloco_id('NEW'))
+        + _trigger(f'trg_saldos_{tabela}_del', f'DELETE ON {tabela}', _refrescar_por_bloco_id('OLD'))
+        for tabela, coluna in (('pagamentos', 'valor_pago'), ('devolucoes', 'quantidade'))
+    ),
+    _trigger('trg_saldos_blocos_rifas_ins', 'INSERT ON blocos_rifas',
+             _refrescar_bloco('NEW.id') + _refrescar_escuteiro('NEW.escuteiro_id', 'NEW.campanha_id')),
+    _trigger('trg_saldos_blocos_rifas_upd',
+             'UPDATE OF campanha_id, escuteiro_id, preco_bloco, preco_unitario, numero_inicial, numero_final '
+             'ON blocos_rifas',
+             _refrescar_bloco('NEW.id') + _refrescar_escuteiro('OLD.escuteiro_id', 'OLD.campanha_id')
+             + _refrescar_escuteiro('NEW.escuteiro_id', 'NEW.campanha_id')),
+    _trigger('trg_saldos_blocos_rifas_del', 'DELETE ON blocos_rifas',
+             'DELETE FROM saldos_blocos WHERE bloco_id = OLD.id;\n'
+             + _refrescar_escuteiro('OLD.escuteiro_id', 'OLD.campanha_id')),
+])
+
+# Database functions callable through client.rpc(name, params).
+# Each entry is ``fn(conn, params) -> data`` and runs inside a transaction.
+RPC_FUNCTIONS = {}
+
+_CHUNK = 500
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='microseconds')
+
+
+def _error(message, code='PGRST000', details=None, hint=None):
+    return APIError({'message': message, 'code': code, 'details': details, 'hint': hint})
+
+
+def _translate_integrity_error(exc):
+    text = str(exc)
+    if 'UNIQUE' in text:
+        return _error(f'duplicate key value violates unique constraint ({text})', code='23505')
+    if 'FOREIGN KEY' in text:
+        return _error(f'update or delete on table violates foreign key constraint ({text})', code='23503')
+    if 'NOT NULL' in text:
+        return _error(f'null value violates not-null constraint ({text})', code='23502')
+    return _error(text, code='23000')
+
+
+def _encode_json(row):
+    for column in JSON_COLUMNS.intersection(row):
+        if row[column] is not None:
+            row[column] = json.dumps(row[column])
+    return row
+
+
+def _like_to_regex(pattern):
+    out = []
+    for ch in pattern:
+        if ch == '%' or ch == '*':
+            out.append('.*')
+        elif ch == '_':
+            out.append('.')
+        else:
+            out.append(re.escape(ch))
+    return '^' + ''.join(out) + '$'
+
+
+def _pg_like(value, pattern, case_insensitive):
+    if value is None or pattern is None:
+        return None
+    flags = re.IGNORECASE | re.DOTALL if case_insensitive else re.DOTALL
+    return 1 if re.match(_like_to_regex(str(pattern)), str(value), flags) else 0
+
+
+# ---------------------------------------------------------------------------
+# select parsing
+# ---------------------------------------------------------------------------
+
+class _Embed:
+    def __init__(self, name, alias, inner, projection):
+        self.name = name
+        self.alias = alias
+        self.inner = inner
+        self.projection = projection
+
+
+class _Projection:
+    def __init__(self, columns, embeds):
+        self.columns = columns  # None means '*'
+        self.embeds = embeds
+
+
+def _split_top_level(text):
+    parts, depth, buf = [], 0, []
+    for ch in text:
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        if ch == ',' and depth == 0:
+            parts.append(''.join(buf))
+            buf = []
+        else:
+            buf.append(ch)
+    parts.append(''.join(buf))
+    return [p.strip() for p in parts if p.strip()]
+
+
+_EMBED_ITEM_RE = re.compile(r'^(?:(\w+):)?(\w+)(?:!(\w+))?\s*\((.*)\)$', re.S)
+
+
+def _parse_select(text):
+    columns, embeds, star = [], [], False
+    for item in _split_top_level(text or '*'):
+        m = _EMBED_ITEM_RE.match(item)
+        if m:
+            alias, name, hint, inner = m.groups()
+            embeds.append(_Embed(name, alias or name, hint == 'inner', _parse_select(inner)))
+        elif item == '*':
+            star = True
+        else:
+            columns.append(item.split('::')[0].strip())
+    return _Projection(None if star or not columns else columns, embeds)
+
+
+# ---------------------------------------------------------------------------
+# filters
+# ---------------------------------------------------------------------------
+
+_SQL_OPERATORS = {'eq': '=', 'neq': '<>', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+
+class _Filter:
+    def __init__(self, column, op, value, negate=False):
+        self.column = column
+        self.op = op
+        self.value = value
+        self.negate = negate
+
+    @property
+    def path(self):
+        return self.column.split('.')[:-1]
+
+    @property
+    def leaf(self):
+        return self.column.split('.')[-1]
+
+    def to_sql(self):
+        col = f'"{self.leaf}"'
+        if self.op in _SQL_OPERATORS:
+            sql, params = f'{col} {_SQL_OPERATORS[self.op]} ?', [self.value]
+        elif self.op in ('like', 'ilike'):
+            sql, params = f'pg_like({col}, ?, {1 if self.op == "ilike" else 0})', [self.value]
+        elif self.op == 'in':
+            values = list(self.value)
+            if not values:
+                sql, params = '0', []
+            else:
+                sql, params = f'{col} IN ({",".join("?" * len(values))})', values
+        elif self.op == 'is':
+            literal = {None: 'NULL', 'null': 'NULL', True: '1', 'true': '1', False: '0', 'false': '0'}[self.value]
+            sql, params = f'{col} IS {literal}', []
+        else:
+            raise _error(f'unsupported filter operator "{self.op}"', code='PGRST100')
+        if self.negate:
+            sql = f'NOT ({sql})'
+        return sql, params
+
+    def matches(self, row):
+        value = row.get(self.leaf)
+        if self.op == 'is':
+            expected = {None: None, 'null': None, True: True, 'true': True, False: False, 'false': False}[self.value]
+            result = value is expected if expected is None else value == expected
+        elif value is None:
+            result = False
+        elif self.op in ('like', 'ilike'):
+            result = bool(_pg_like(value, self.value, self.op == 'ilike'))
+        elif self.op == 'in':
+            result = value in list(self.value)
+        else:
+            result = {
+                'eq': lambda a, b: a == b, 'neq': lambda a, b: a != b,
+                'gt': lambda a, b: a > b, 'gte': lambda a, b: a >= b,
+                'lt': lambda a, b: a < b, 'lte': lambda a, b: a <= b,
+            }[self.op](value, self.value)
+        return not result if self.negate else result
+
+
+class _FilterMixin:
+    """Filter methods shared by select/update/delete builders."""
+
+    def _add_filter(self, column, op, value):
+        self._filters.append(_Filter(column, op, value, negate=self._negate_next))
+        self._negate_next = False
+        return self
+
+    @property
+    def not_(self):
+        self._negate_next = True
+        return self
+
+    def eq(self, column, value):
+        return self._add_filter(column, 'eq', value)
+
+    def neq(self, column, value):
+        return self._add_filter(column, 'neq', value)
+
+    def gt(self, column, value):
+        return self._add_filter(column, 'gt', value)
+
+    def gte(self, column, value):
+        return self._add_filter(column, 'gte', value)
+
+    def lt(self, column, value):
+        return self._add_filter(column, 'lt', value)
+
+    def lte(self, column, value):
+        return self._add_filter(column, 'lte', value)
+
+    def like(self, column, pattern):
+        return self._add_filter(column, 'like', pattern)
+
+    def ilike(self, column, pattern):
+        return self._add_filter(column, 'ilike', pattern)
+
+    def in_(self, column, values):
+        return self._add_filter(column, 'in', list(values))
+
+    def is_(self, column, value):
+        return self._add_filter(column, 'is', value)
+
+
+class LocalResponse:
+    """Mimics postgrest's APIResponse (``.data`` and ``.count``)."""
+
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+# ---------------------------------------------------------------------------
+# builders
+# ---------------------------------------------------------------------------
+
+class LocalQueryBuilder(_FilterMixin):
+    def __init__(self, client, table):
+        self._client = client
+        self._table = table
+        self._filters = []
+        self._negate_next = False
+        self._method = None
+        self._projection = None
+        self._count = None
+        self._payload = None
+        self._order = []
+        self._limit = None
+        self._offset = 0
+        self._single = None
+        self._returning = None
+
+    # -- verbs ---------------------------------------------------------------
+    def select(self, columns='*', count=None, **kwargs):
+        self._method = 'select'
+        self._projection = _parse_select(columns)
+        self._count = count
+        return self
+
+    def insert(self, rows, returning=None, **kwargs):
+        self._method = 'insert'
+        self._payload = rows
+        self._returning = returning
+        return self
+
+    def upsert(self, rows, returning=None, on_conflict='', ignore_duplicates=False, **kwargs):
+        self._method = 'upsert'
+        self._payload = rows
+        self._returning = returning
+        self._on_conflict = on_conflict or 'id'
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, values, **kwargs):
+        self._method = 'update'
+        self._payload = values
+        return self
+
+    def delete(self, **kwargs):
+        self._method = 'delete'
+        return self
+
+    # -- modifiers -----------------------------------------------------------
+    def order(self, column, desc=False, nullsfirst=None, **kwargs):
+        self._order.append((column, bool(desc), nullsfirst))
+        return self
+
+    def limit(self, size, **kwargs):
+        self._limit = int(size)
+        return self
+
+    def range(self, start, end, **kwargs):
+        self._offset = int(start)
+        self._limit = int(end) - int(start) + 1
+        return self
+
+    def single(self):
+        self._single = 'single'
+        return self
+
+    def maybe_single(self):
+        self._single = 'maybe'
+        return self
+
+    def execute(self):
+        with self._client._lock:
+            if self._method == 'select':
+                response = self._client._select(self)
+            elif self._method in ('insert', 'upsert'):
+                conflict = None
+                if self._method == 'upsert':
+                    conflict = (self._on_conflict, self._ignore_duplicates)
+                response = LocalResponse(self._client._insert(self._table, self._payload, conflict))
+                if self._returning == 'minimal':
+                    response.data = []
+            elif self._method == 'update':
+                response = LocalResponse(self._client._update(self._table, self._payload, self._filters))
+            elif self._method == 'delete':
+                response = LocalResponse(self._client._delete(self._table, self._filters))
+            else:
+                raise _error('no operation specified on query builder', code='PGRST100')
+
+        if self._single is not None:
+            rows = response.data or []
+            if len(rows) == 1:
+                response.data = rows[0]
+            elif self._single == 'maybe' and not rows:
+                return None
+            else:
+                raise _error(
+                    'JSON object requested, multiple (or no) rows returned',
+                    code='PGRST116', details=f'The result contains {len(rows)} rows'
+                )
+        return response
+
+
+class LocalRPCBuilder:
+    def __init__(self, client, name, params):
+        self._client = client
+        self._name = name
+        self._params = params or {}
+
+    def execute(self):
+        fn = RPC_FUNCTIONS.get(self._name)
+        if fn is None:
+            raise _error(f'Could not find the function public.{self._name} in the schema cache', code='PGRST202')
+        with self._client._lock:
+            conn = self._client._conn
+            conn.execute('BEGIN')
+            try:
+                data = fn(conn, self._params)
+            except sqlite3.IntegrityError as exc:
+                conn.execute('ROLLBACK')
+                raise _translate_integrity_error(exc)
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        return LocalResponse(data)
+
+
+class LocalClient:
+    """Drop-in replacement for ``supabase.Client`` backed by a SQLite file."""
+
+    def __init__(self, path=':memory:', max_rows=None):
+        self.path = path
+        # Like PostgREST's db-max-rows: selects silently return at most this many rows
+        self.max_rows = max_rows
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.create_function('pg_like', 3, _pg_like, deterministic=True)
+        self._conn.execute('PRAGMA foreign_keys = ON')
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode = WAL')
+        novo_saldos = not self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'saldos_blocos'"
+        ).fetchone()
+        self._conn.executescript(SCHEMA_SQL)
+        self._conn.executescript(SALDOS_TRIGGERS_SQL)
+        self._columns = {}
+        for table, column, kind in ADDED_COLUMNS:
+            if column not in self.columns(table):
+                self._conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {kind}')
+                self._columns.pop(table)
+        if novo_saldos:
+            # Database file created before scripts/saldos.sql: fill the ledger once
+            self.rpc('reconstruir_saldos').execute()
+
+    # public surface ----------------------------------------------------------
+    def table(self, name):
+        return LocalQueryBuilder(self, name)
+
+    from_ = table
+
+    def rpc(self, name, params=None, **kwargs):
+        return LocalRPCBuilder(self, name, params)
+
+    def close(self):
+        self._conn.close()
+
+    # helpers -----------------------------------------------------------------
+    def columns(self, table):
+        if table not in self._columns:
+            info = self._conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+            if not info:
+                raise _error(f'relation "public.{table}" does not exist', code='42P01')
+            self._columns[table] = [row['name'] for row in info]
+        return self._columns[table]
+
+    def _check_columns(self, table, names):
+        known = set(self.columns(table))
+        for name in names:
+            if name not in known:
+                raise _error(f"Could not find the '{name}' column of '{table}' in the schema cache", code='PGRST204')
+
+    @staticmethod
+    def _to_dict(row):
+        data = dict(row)
+        for column in BOOLEAN_COLUMNS.intersection(data):
+            if data[column] is not None:
+                data[column] = bool(data[column])
+        for column in JSON_COLUMNS.intersection(data):
+            if data[column] is not None:
+                data[column] = json.loads(data[column])
+        return data
+
+    def _where(self, table, filters):
+        clauses, params = [], []
+        for f in filters:
+            self._check_columns(table, [f.leaf])
+            sql, values = f.to_sql()
+            clauses.append(sql)
+            params.extend(values)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def _fetch_by(self, table, column, values):
+        rows = []
+        values = list(values)
+        for start in range(0, len(values), _CHUNK):
+            chunk = values[start:start + _CHUNK]
+            cur = self._conn.execute(
+                f'SELECT * FROM "{table}" WHERE "{column}" IN ({",".join("?" * len(chunk))})', chunk
+            )
+            rows.extend(self._to_dict(r) for r in cur)
+        return rows
+
+    # relations ---------------------------------------------------------------
+    @staticmethod
+    def _relation(parent, child):
+        """Return (parent_key, child_key, many) for embedding child into parent."""
+        for (table, column), target in FOREIGN_KEYS.items():
+            if table == parent and target == child:
+                return column, 'id', False
+        for (table, column), target in FOREIGN_KEYS.items():
+            if table == child and target == parent:
+                return 'id', column, True
+        raise _error(
+            f"Could not find a relationship between '{parent}' and '{child}' in the schema cache",
+            code='PGRST200'
+        )
+
+    def _embed(self, table, rows, embed, filters):
+        """Attach ``embed`` to ``rows``; returns rows kept (for !inner)."""
+        parent_key, child_key, many = self._relation(table, embed.name)
+        keys = {r.get(parent_key) for r in rows if r.get(parent_key) is not None}
+        children = self._fetch_by(embed.name, child_key, keys) if keys else []
+
+        own = [f for f in filters if len(f.path) == 1]
+        nested = [_Filter('.'.join(f.column.split('.')[1:]), f.op, f.value, f.negate)
+                  for f in filters if len(f.path) > 1]
+        children = [c for c in children if all(f.matches(c) for f in own)]
+        children = self._attach_embeds(embed.name, children, embed.projection, nested)
+
+        grouped = {}
+        for child in children:
+            grouped.setdefault(child.get(child_key), []).append(child)
+
+        kept = []
+        for row in rows:
+            matches = grouped.get(row.get(parent_key), [])
+            projected = [self._project(embed.name, c, embed.projection) for c in matches]
+            if many:
+                row[embed.alias] = projected
+                has_match = bool(projected)
+            else:
+                row[embed.alias] = projected[0] if projected else None
+                has_match = bool(projected)
+            if has_match or not embed.inner:
+                kept.append(row)
+        return kept
+
+    def _attach_embeds(self, table, rows, projection, filters):
+        for embed in projection.embeds:
+            embed_filters = [f for f in filters if f.path and f.path[0] == embed.alias]
+            rows = self._embed(table, rows, embed, embed_filters)
+        return rows
+
+    def _project(self, table, row, projection):
+        if projection.columns is None:
+            base = {c: row.get(c) for c in self.columns(table)}
+        else:
+            self._check_columns(table, projection.columns)
+            base = {c: row.get(c) for c in projection.columns}
+        for embed in projection.embeds:
+            base[embed.alias] = row.get(embed.alias)
+        return base
+
+    # verbs -------------------------------------------------------------------
+    def _select(self, builder):
+        table = builder._table
+        self.columns(table)
+        base_filters = [f for f in builder._filters if not f.path]
+        embed_filters = [f for f in builder._filters if f.path]
+        where, params = self._where(table, base_filters)
+
+        # !inner embeds become a semi-join in SQL (like PostgREST does) when
+        # their filters are one level deep; deeper ones are filtered in Python
+        needs_post_filter = False
+        for embed in builder._projection.embeds:
+            if not embed.inner:
+                continue
+            filters = [f for f in embed_filters if f.path[0] == embed.alias]
+            if any(len(f.path) > 1 for f in filters) or any(e.inner for e in embed.projection.embeds):
+                needs_post_filter = True
+                continue
+            parent_key, child_key, _ = self._relation(table, embed.name)
+            child_where, child_params = self._where(embed.name, filters)
+            clause = f'"{parent_key}" IN (SELECT "{child_key}" FROM "{embed.name}"{child_where})'
+            where = f'{where} AND {clause}' if where else f' WHERE {clause}'
+            params = params + child_params
+
+        order_sql = []
+        for column, desc, nullsfirst in builder._order:
+            self._check_columns(table, [column])
+            nulls_first = desc if nullsfirst is None else nullsfirst
+            if column != 'id':  # primary key: never NULL, and the index stays usable
+                order_sql.append(f'("{column}" IS NULL) {"DESC" if nulls_first else "ASC"}')
+            order_sql.append(f'"{column}" {"DESC" if desc else "ASC"}')
+        order_clause = (' ORDER BY ' + ', '.join(order_sql)) if order_sql else ''
+
+        # Post-filtered !inner embeds drop parent rows after the SQL query, so paging happens in Python
+        limit = builder._limit
+        if self.max_rows is not None:
+            limit = self.max_rows if limit is None else min(limit, self.max_rows)
+        sql = f'SELECT * FROM "{table}"{where}{order_clause}'
+        if not needs_post_filter and limit is not None:
+            sql += f' LIMIT {limit} OFFSET {builder._offset}'
+        elif not needs_post_filter and builder._offset:
+            sql += f' LIMIT -1 OFFSET {builder._offset}'
+
+        rows = [self._to_dict(r) for r in self._conn.execute(sql, params)]
+        rows = self._attach_embeds(table, rows, builder._projection, embed_filters)
+
+        count = None
+        if needs_post_filter:
+            count = len(rows)
+            end = None if limit is None else builder._offset + limit
+            rows = rows[builder._offset:end]
+        elif builder._count:
+            count = self._conn.execute(f'SELECT COUNT(*) FROM "{table}"{where}', params).fetchone()[0]
+
+        data = [self._project(table, row, builder._projection) for row in rows]
+        return LocalResponse(data, count=count if builder._count else None)
+
+    def _prepare_rows(self, table, payload):
+        # Same JSON round-trip the HTTP client does: non-serialisable values fail here too
+        rows = json.loads(json.dumps(payload if isinstance(payload, list) else [payload]))
+        prepared = []
+        for row in rows:
+            row = dict(row)
+            row.setdefault('id', str(uuid.uuid4()))
+            if 'created_at' in self.columns(table):
+                row.setdefault('created_at', _now())
+            self._check_columns(table, row.keys())
+            prepared.append(_encode_json(row))
+        return prepared
+
+    def _insert(self, table, payload, conflict=None):
+        """INSERT rows; ``conflict=(columns, ignore_duplicates)`` makes it an upsert."""
+        rows = self._prepare_rows(table, payload)
+        if not rows:
+            return []
+        self._conn.execute('BEGIN')
+        by_columns = {}
+        for row in rows:
+            by_columns.setdefault(tuple(row.keys()), []).append(row)
+        try:
+            for cols, group in by_columns.items():
+                sql = (f'INSERT INTO "{table}" ({",".join(f"{chr(34)}{c}{chr(34)}" for c in cols)}) '
+                       f'VALUES ({",".join("?" * len(cols))})')
+                if conflict is not None:
+                    on_conflict, ignore_duplicates = conflict
+                    target = ', '.join(f'"{c.strip()}"' for c in on_conflict.split(','))
+                    # created_at keeps the original value on update, like a column default
+                    updates = [c for c in cols if c not in ('id', 'created_at')]
+                    if ignore_duplicates or not updates:
+                        sql += f' ON CONFLICT ({target}) DO NOTHING'
+                    else:
+                        sql += f' ON CONFLICT ({target}) DO UPDATE SET ' + \
+                            ', '.join(f'"{c}" = excluded."{c}"' for c in updates)
+                self._conn.executemany(sql, [[row[c] for c in cols] for row in group])
+        except sqlite3.IntegrityError as exc:
+            self._conn.execute('ROLLBACK')
+            raise _translate_integrity_error(exc)
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+        by_id = {r['id']: r for r in self._fetch_by(table, 'id', [r['id'] for r in rows])}
+        return [by_id[r['id']] for r in rows if r['id'] in by_id]
+
+    def _matching_ids(self, table, filters):
+        if any(f.path for f in filters):
+            raise _error('filters on embedded resources are not allowed in writes', code='PGRST100')
+        where, params = self._where(table, filters)
+        return [r[0] for r in self._conn.execute(f'SELECT id FROM "{table}"{where}', params)]
+
+    def _update(self, table, values, filters):
+        values = _encode_json(json.loads(json.dumps(values)))
+        self._check_columns(table, values.keys())
+        ids = self._matching_ids(table, filters)
+        if not ids or not values:
+            return self._fetch_by(table, 'id', ids)
+        assignments = ', '.join(f'"{c}" = ?' for c in values)
+        self._conn.execute('BEGIN')
+        try:
+            for start in range(0, len(ids), _CHUNK):
+                chunk = ids[start:start + _CHUNK]
+                self._conn.execute(
+                    f'UPDATE "{table}" SET {assignments} WHERE id IN ({",".join("?" * len(chunk))})',
+                    list(values.values()) + chunk
+                )
+        except sqlite3.IntegrityError as exc:
+            self._conn.execute('ROLLBACK')
+            raise _translate_integrity_error(exc)
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+        return self._fetch_by(table, 'id', ids)
+
+    def _delete(self, table, filters):
+        ids = self._matching_ids(table, filters)
+        rows = self._fetch_by(table, 'id', ids)
+        self._conn.execute('BEGIN')
+        try:
+            for start in range(0, len(ids), _CHUNK):
+                chunk = ids[start:start + _CHUNK]
+                self._conn.execute(f'DELETE FROM "{table}" WHERE id IN ({",".join("?" * len(chunk))})', chunk)
+        except sqlite3.IntegrityError as exc:
+            self._conn.execute('ROLLBACK')
+            raise _translate_integrity_error(exc)
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+        return rows
+
+
+# Database functions (SQLite versions of the SQL scripts in scripts/) -----------
+def _rpc_dashboard_kpis(conn, params):
+    """scripts/dashboard_kpis.sql"""
+    campanha_id = params.get('p_campanha_id')
+    conn.execute('DROP TABLE IF EXISTS temp._kpi_blocos')
+    conn.execute(
+        'CREATE TEMP TABLE _kpi_blocos AS '
+        'SELECT id, escuteiro_id, estado, numero_inicial, numero_final '
+        'FROM blocos_rifas WHERE ? IS NULL OR campanha_id = ?',
+        (campanha_id, campanha_id)
+    )
+    pagamentos = (
+        'SELECT pg.bloco_id, pg.valor_pago, pg.quantidade_rifas, pg.canhotos_entregues, '
+        'pg.data_pagamento, b.escuteiro_id FROM pagamentos pg JOIN _kpi_blocos b ON b.id = pg.bloco_id'
+    )
+
+    def scalar(sql):
+        return conn.execute(sql).fetchone()[0]
+
+    result = {
+        'total_escuteiros': scalar('SELECT count(*) FROM escuteiros'),
+        'total_blocos': scalar('SELECT count(*) FROM _kpi_blocos'),
+        'estados': dict(conn.execute(
+            "SELECT COALESCE(estado, 'desconhecido'), count(*) FROM _kpi_blocos GROUP BY 1"
+        ).fetchall()),
+        'blocos_atribuidos': scalar("SELECT count(*) FROM _kpi_blocos WHERE estado = 'atribuido'"),
+        'rifas_atribuidas': scalar(
+            "SELECT COALESCE(sum(numero_final - numero_inicial + 1), 0) FROM _kpi_blocos WHERE estado = 'atribuido'"
+        ),
+        'blocos_com_pagamento': scalar(f'SELECT count(DISTINCT bloco_id) FROM ({pagamentos})'),
+        'rifas_confirmadas': scalar(
+            f'SELECT COALESCE(sum(COALESCE(quantidade_rifas, canhotos_entregues, 0)), 0) FROM ({pagamentos})'
+        ),
+        'valor_recebido': scalar(f'SELECT COALESCE(sum(valor_pago), 0) FROM ({pagamentos})'),
+        'saldo_pendente': conn.execute(
+            'SELECT COALESCE(sum(saldo), 0) FROM saldos_blocos '
+            'WHERE escuteiro_id IS NOT NULL AND (? IS NULL OR campanha_id = ?)',
+            (campanha_id, campanha_id)
+        ).fetchone()[0],
+        'recebimentos_diarios': [
+            {'data': d, 'valor': v} for d, v in conn.execute(
+                f'SELECT substr(data_pagamento, 1, 10) AS d, sum(valor_pago) FROM ({pagamentos}) '
+                'WHERE data_pagamento IS NOT NULL GROUP BY 1 ORDER BY 1'
+            )
+        ],
+        'top_escuteiros': [
+            {'nome': nome, 'valor_pago': v, 'quantidade_rifas': q} for nome, v, q in conn.execute(
+                f"SELECT COALESCE(e.nome, 'Desconhecido'), sum(p.valor_pago), COALESCE(sum(p.quantidade_rifas), 0) "
+                f'FROM ({pagamentos}) p LEFT JOIN escuteiros e ON e.id = p.escuteiro_id '
+                'GROUP BY 1 ORDER BY 2 DESC LIMIT 10'
+            )
+        ],
+    }
+    conn.execute('DROP TABLE temp._kpi_blocos')
+    return result
+
+
+RPC_FUNCTIONS['dashboard_kpis'] = _rpc_dashboard_kpis
+
+
+def _rpc_dividir_blocos_irmaos(conn, params):
+    """scripts/dividir_blocos_irmaos.sql"""
+    def row(sql, args):
+        found = conn.execute(sql, args).fetchone()
+        return LocalClient._to_dict(found) if found is not None else None
+
+    resultado = []
+    for divisao in params.get('p_divisoes') or []:
+        irmaos = list(divisao.get('escuteiros') or [])
+        if len(irmaos) < 2:
+            raise _error(f"A divisão do bloco {divisao.get('bloco_id')} precisa de pelo menos 2 irmãos", code='P0001')
+        bloco = row('SELECT * FROM blocos_rifas WHERE id = ?', (divisao.get('bloco_id'),))
+        if bloco is None:
+            raise _error(f"Bloco {divisao.get('bloco_id')} não encontrado", code='P0001')
+        if bloco['escuteiro_id'] is not None:
+            raise _error(
+                f"O bloco {bloco['id']} (rifas {bloco['numero_inicial']}-{bloco['numero_final']}) já está atribuído",
+                code='P0001'
+            )
+        try:
+            intervalos = dividir_intervalo(bloco['numero_inicial'], bloco['numero_final'], len(irmaos))
+        except ValueError as exc:
+            raise _error(str(exc), code='P0001')
+
+        total = bloco['numero_final'] - bloco['numero_inicial'] + 1
+        preco = bloco['preco_unitario']
+        if preco is None:
+            preco = float(bloco['preco_bloco'] or 0) / total
+        escuteiros = {
+            r['id']: dict(r) for r in conn.execute(
+                f'SELECT id, nome, seccao FROM escuteiros WHERE id IN ({",".join("?" * len(irmaos))})', irmaos
+            )
+        }
+        nomes = ', '.join(escuteiros[e]['nome'] for e in irmaos if e in escuteiros)
+
+        for i, (inicio, fim) in enumerate(intervalos):
+            irmao = irmaos[i]
+            seccao = escuteiros.get(irmao, {}).get('seccao')
+            preco_bloco = round(preco * (fim - inicio + 1), 2)
+            if i == 0:
+                conn.execute(
+                    'UPDATE blocos_rifas SET escuteiro_id = ?, numero_inicial = ?, numero_final = ?, '
+                    'preco_unitario = ?, preco_bloco = ?, seccao = ?, observacoes = ? WHERE id = ?',
+                    (irmao, inicio, fim, preco, preco_bloco, seccao,
+                     f'Divisão automática entre irmãos: {nomes}', bloco['id'])
+                )
+                novo_id = bloco['id']
+            else:
+                novo_id = str(uuid.uuid4())
+                conn.execute(
+                    'INSERT INTO blocos_rifas (id, campanha_id, nome, numero_inicial, numero_final, preco_unitario, '
+                    'preco_bloco, estado, escuteiro_id, seccao, data_atribuicao, observacoes, created_at, '
+                    'estado_rifas) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (novo_id, bloco['campanha_id'], f'Bloco {inicio}-{fim}', inicio, fim, preco, preco_bloco,
+                     'atribuido', irmao, seccao or bloco['seccao'], _now(),
+                     f"Divisão automática entre irmãos: {nomes} "
+                     f"(original {bloco['numero_inicial']}-{bloco['numero_final']})", _now(),
+                     estado_rifas.fatia(bloco['estado_rifas'], inicio - bloco['numero_inicial'],
+                                        fim - inicio + 1))
+                )
+            resultado.append(row('SELECT * FROM blocos_rifas WHERE id = ?', (novo_id,)))
+    return resultado
+
+
+RPC_FUNCTIONS['dividir_blocos_irmaos'] = _rpc_dividir_blocos_irmaos
+
+
+def _rpc_atribuir_blocos(conn, params):
+    """scripts/atribuir_blocos.sql"""
+    atribuicoes = list(params.get('p_atribuicoes') or [])
+    campanha_id = params.get('p_campanha_id')
+    nao_encontrados = []
+    for a in atribuicoes:
+        atualizado = conn.execute(
+            'UPDATE blocos_rifas SET escuteiro_id = ?, seccao = coalesce(?, seccao), '
+            'data_atribuicao = coalesce(?, data_atribuicao), observacoes = coalesce(?, observacoes) '
+            'WHERE id = ? AND campanha_id = ?',
+            (a.get('escuteiro_id'), a.get('seccao'), a.get('data_atribuicao'), a.get('observacoes'),
+             a.get('id'), campanha_id)
+        ).rowcount
+        if not atualizado:
+            nao_encontrados.append({'bloco_id': a.get('id')})
+    return nao_encontrados
+
+
+RPC_FUNCTIONS['atribuir_blocos'] = _rpc_atribuir_blocos
+
+
+def _rpc_marcar_rifas(conn, params):
+    """scripts/estado_rifas.sql"""
+    bloco = conn.execute('SELECT * FROM blocos_rifas WHERE id = ?', (params.get('p_bloco_id'),)).fetchone()
+    if bloco is None:
+        raise _error(f"Bloco {params.get('p_bloco_id')} não encontrado", code='P0001')
+    try:
+        bitmap = estado_rifas.marcar(
+            bloco['estado_rifas'], bloco['numero_inicial'], bloco['numero_final'],
+            params.get('p_inicio'), params.get('p_fim'), params.get('p_estado')
+        )
+    except (TypeError, ValueError) as exc:
+        raise _error(str(exc), code='P0001')
+    conn.execute('UPDATE blocos_rifas SET estado_rifas = ? WHERE id = ?', (bitmap, bloco['id']))
+    return LocalClient._to_dict(conn.execute('SELECT * FROM blocos_rifas WHERE id = ?', (bloco['id'],)).fetchone())
+
+
+RPC_FUNCTIONS['marcar_rifas'] = _rpc_marcar_rifas
+
+
+def _rpc_marcar_intervalo_rifas(conn, params):
+    """scripts/estado_rifas.sql"""
+    inicio, fim, estado = params.get('p_inicio'), params.get('p_fim'), params.get('p_estado')
+    if estado not in estado_rifas.NOMES_ESTADOS:
+        raise _error(f"Estado de rifa inválido: {estado}", code='P0001')
+    if inicio is None or fim is None or inicio > fim:
+        raise _error(f"Intervalo de rifas inválido: {inicio}-{fim}", code='P0001')
+    blocos = conn.execute(
+        'SELECT id, numero_inicial, numero_final, estado_rifas FROM blocos_rifas '
+        'WHERE campanha_id = ? AND numero_inicial <= ? AND numero_final >= ?',
+        (params.get('p_campanha_id'), fim, inicio)
+    ).fetchall()
+    novos, marcadas = [], 0
+    for b in blocos:
+        de, ate = max(inicio, b['numero_inicial']), min(fim, b['numero_final'])
+        novos.append((estado_rifas.marcar(b['estado_rifas'], b['numero_inicial'], b['numero_final'],
+                                          de, ate, estado), b['id']))
+        marcadas += ate - de + 1
+    conn.executemany('UPDATE blocos_rifas SET estado_rifas = ? WHERE id = ?', novos)
+    return [{'blocos': len(novos), 'rifas_marcadas': marcadas}]
+
+
+RPC_FUNCTIONS['marcar_intervalo_rifas'] = _rpc_marcar_intervalo_rifas
+
+
+def _rpc_reconstruir_saldos(conn, params):
+    """scripts/saldos.sql"""
+    conn.execute('DELETE FROM saldos_escuteiros')
+    conn.execute('DELETE FROM saldos_blocos')
+    n = conn.execute(
+        f'INSERT INTO saldos_blocos ({_SALDOS_COLUNAS}, atualizado_em) '
+        f'SELECT {_SALDOS_COLUNAS}, {_AGORA} FROM vw_saldos_calculados'
+    ).rowcount
+    conn.execute(
+        'INSERT INTO saldos_escuteiros (escuteiro_id, campanha_id, n_blocos, valor_esperado, valor_recebido, '
+        'n_pagamentos, rifas_devolvidas, valor_devolvido, saldo, atualizado_em) '
+        'SELECT escuteiro_id, campanha_id, count(*), sum(valor_esperado), sum(valor_recebido), sum(n_pagamentos), '
+        f'sum(rifas_devolvidas), sum(valor_devolvido), sum(saldo), {_AGORA} FROM saldos_blocos '
+        'WHERE escuteiro_id IS NOT NULL AND campanha_id IS NOT NULL GROUP BY escuteiro_id, campanha_id'
+    )
+    return n
+
+
+RPC_FUNCTIONS['reconstruir_saldos'] = _rpc_reconstruir_saldos
+
+
+def _rpc_verificar_saldos(conn, params):
+    """scripts/saldos.sql (amounts compared to the cent, like numeric in Postgres)"""
+    def chaveado(sql, chave):
+        linhas = {}
+        for row in conn.execute(sql):
+            linha = {k: (round(v, 2) if isinstance(v, float) else v) for k, v in dict(row).items()}
+            linhas[chave(linha)] = linha
+        return linhas
+
+    def por_bloco(linha):
+        return linha['bloco_id']
+
+    def por_escuteiro(linha):
+        return f"{linha['escuteiro_id']}/{linha['campanha_id']}"
+
+    valores = 'valor_esperado, valor_recebido, n_pagamentos, rifas_devolvidas, valor_devolvido, saldo'
+    somas = ('sum(valor_esperado) AS valor_esperado, sum(valor_recebido) AS valor_recebido, '
+             'sum(n_pagamentos) AS n_pagamentos, sum(rifas_devolvidas) AS rifas_devolvidas, '
+             'sum(valor_devolvido) AS valor_devolvido, sum(saldo) AS saldo')
+    pares = [
+        ('saldos_blocos',
+         chaveado(f'SELECT bloco_id, campanha_id, escuteiro_id, {valores} FROM saldos_blocos', por_bloco),
+         chaveado(f'SELECT bloco_id, campanha_id, escuteiro_id, {valores} FROM vw_saldos_calculados', por_bloco)),
+        ('saldos_escuteiros',
+         chaveado(f'SELECT escuteiro_id, campanha_id, n_blocos, {valores} FROM saldos_escuteiros', por_escuteiro),
+         chaveado(f'SELECT escuteiro_id, campanha_id, count(*) AS n_blocos, {somas} FROM vw_saldos_calculados '
+                  'WHERE escuteiro_id IS NOT NULL AND campanha_id IS NOT NULL GROUP BY escuteiro_id, campanha_id',
+                  por_escuteiro)),
+    ]
+    diferencas = []
+    for tabela, guardados, calculados in pares:
+        for chave in sorted(set(guardados) | set(calculados)):
+            if guardados.get(chave) != calculados.get(chave):
+                diferencas.append({'tabela': tabela, 'chave': chave,
+                                   'guardado': guardados.get(chave), 'calculado': calculados.get(chave)})
+    return diferencas
+
+
+RPC_FUNCTIONS['verificar_saldos'] = _rpc_verificar_saldos
+
+
+_DEVOLVIDAS_POR_BLOCO = (
+    'SELECT b.id AS bloco_id, min(coalesce(sum(d.quantidade), 0), b.numero_final - b.numero_inicial + 1) AS n, '
+    'b.numero_final - b.numero_inicial + 1 AS total '
+    'FROM blocos_rifas b LEFT JOIN devolucoes d ON d.bloco_id = b.id '
+    'WHERE b.id IN (SELECT value FROM json_each(?)) GROUP BY b.id'
+)
+
+
+def _rpc_recalcular_estado_blocos(conn, params):
+    """scripts/devolucoes_lote.sql"""
+    blocos = json.dumps(list(params.get('p_blocos') or []))
+    conn.execute(
+        f'WITH devolvidas AS ({_DEVOLVIDAS_POR_BLOCO}) '
+        "UPDATE blocos_rifas SET estado = CASE "
+        "WHEN dv.n >= dv.total THEN 'devolvido' "
+        "WHEN blocos_rifas.estado = 'devolvido' THEN "
+        "CASE WHEN blocos_rifas.escuteiro_id IS NULL THEN 'disponivel' ELSE 'atribuido' END "
+        'ELSE blocos_rifas.estado END '
+        'FROM devolvidas dv WHERE blocos_rifas.id = dv.bloco_id',
+        (blocos,)
+    )
+    return [
+        dict(row) for row in conn.execute(
+            f'SELECT dv.bloco_id, b.estado, dv.n AS rifas_devolvidas, dv.total - dv.n AS rifas_restantes '
+            f'FROM ({_DEVOLVIDAS_POR_BLOCO}) dv JOIN blocos_rifas b ON b.id = dv.bloco_id',
+            (blocos,)
+        )
+    ]
+
+
+RPC_FUNCTIONS['recalcular_estado_blocos'] = _rpc_recalcular_estado_blocos
+
+
+def _rpc_registar_devolucoes(conn, params):
+    """scripts/devolucoes_lote.sql"""
+    devolucoes = list(params.get('p_devolucoes') or [])
+    if not devolucoes:
+        return []
+    lote = json.dumps(devolucoes)
+    pedidos = (
+        "SELECT CAST(key AS INTEGER) AS ordem, json_extract(value, '$.bloco_id') AS bloco_id, "
+        "CAST(json_extract(value, '$.inicio') AS INTEGER) AS inicio, "
+        "CAST(json_extract(value, '$.fim') AS INTEGER) AS fim FROM json_each(?)"
+    )
+    erro = conn.execute(
+        f"WITH pedidos AS ({pedidos}) "
+        "SELECT * FROM (SELECT p.bloco_id, p.inicio, p.fim, b.id AS existe, b.escuteiro_id, b.numero_inicial, "
+        "b.numero_final, "
+        "(SELECT max(d.inicio, p.inicio) || '-' || min(d.fim, p.fim) FROM devolucoes d "
+        " WHERE d.bloco_id = p.bloco_id AND d.inicio <= p.fim AND p.inicio <= d.fim LIMIT 1) AS devolvidas, "
+        "(SELECT max(q.inicio, p.inicio) || '-' || min(q.fim, p.fim) FROM pedidos q "
+        " WHERE q.bloco_id = p.bloco_id AND q.ordem < p.ordem AND q.inicio <= p.fim AND p.inicio <= q.fim "
+        " LIMIT 1) AS repetidas, p.ordem "
+        "FROM pedidos p LEFT JOIN blocos_rifas b ON b.id = p.bloco_id) "
+        "WHERE existe IS NULL OR escuteiro_id IS NULL OR inicio IS NULL OR fim IS NULL OR fim < inicio "
+        "OR inicio < numero_inicial OR fim > numero_final OR devolvidas IS NOT NULL OR repetidas IS NOT NULL "
+        "ORDER BY ordem LIMIT 1",
+        (lote,)
+    ).fetchone()
+    if erro is not None:
+        intervalo = f"(rifas {erro['numero_inicial']}-{erro['numero_final']})"
+        if erro['existe'] is None:
+            raise _error(f"Bloco {erro['bloco_id']} não encontrado", code='P0001')
+        if erro['escuteiro_id'] is None:
+            raise _error(f"O bloco {erro['bloco_id']} {intervalo} não está atribuído a nenhum escuteiro",
+                         code='P0001')
+        if erro['devolvidas'] is None and erro['repetidas'] is None:
+            raise _error(f"As rifas {erro['inicio']}-{erro['fim']} não pertencem ao bloco {erro['bloco_id']} "
+                         f"{intervalo}", code='P0001')
+        if erro['devolvidas'] is not None:
+            raise _error(f"As rifas {erro['devolvidas']} do bloco {erro['bloco_id']} já foram devolvidas",
+                         code='P0001')
+        raise _error(f"As rifas {erro['repetidas']} do bloco {erro['bloco_id']} estão repetidas no lote",
+                     code='P0001')
+
+    # Returns without a range only count by quantity
+    erro = conn.execute(
+        f"SELECT p.bloco_id, p.quantidade, b.numero_inicial, b.numero_final, coalesce(d.n, 0) AS ja_devolvidas "
+        f"FROM (SELECT bloco_id, sum(fim - inicio + 1) AS quantidade FROM ({pedidos}) GROUP BY 1) p "
+        "JOIN blocos_rifas b ON b.id = p.bloco_id "
+        "LEFT JOIN (SELECT bloco_id, sum(quantidade) AS n FROM devolucoes GROUP BY bloco_id) d "
+        "ON d.bloco_id = p.bloco_id "
+        "WHERE p.quantidade + coalesce(d.n, 0) > b.numero_final - b.numero_inicial + 1 "
+        "LIMIT 1",
+        (lote,)
+    ).fetchone()
+    if erro is not None:
+        restantes = erro['numero_final'] - erro['numero_inicial'] + 1 - erro['ja_devolvidas']
+        raise _error(
+            f"O bloco {erro['bloco_id']} (rifas {erro['numero_inicial']}-{erro['numero_final']}) só tem "
+            f"{restantes} rifa(s) por devolver, pedidas {erro['quantidade']}",
+            code='P0001'
+        )
+
+    agora = _now()
+    conn.executemany(
+        'INSERT INTO devolucoes (id, escuteiro_id, bloco_id, inicio, fim, quantidade, motivo, data_devolucao, '
+        'created_at) SELECT ?, escuteiro_id, id, ?, ?, ?, ?, ?, ? FROM blocos_rifas WHERE id = ?',
+        [(str(uuid.uuid4()), int(d['inicio']), int(d['fim']), int(d['fim']) - int(d['inicio']) + 1,
+          d.get('motivo') or None, d.get('data_devolucao') or agora, agora, d['bloco_id']) for d in devolucoes]
+    )
+    return _rpc_recalcular_estado_blocos(conn, {'p_blocos': list(dict.fromkeys(d['bloco_id'] for d in devolucoes))})
+
+
+RPC_FUNCTIONS['registar_devolucoes'] = _rpc_registar_devolucoes
+
+
+def _rpc_eliminar_devolucoes(conn, params):
+    """scripts/devolucoes_lote.sql"""
+    ids = json.dumps(list(params.get('p_ids') or []))
+    blocos = [
+        row[0] for row in conn.execute(
+            'SELECT DISTINCT bloco_id FROM devolucoes WHERE id IN (SELECT value FROM json_each(?))', (ids,)
+        )
+    ]
+    conn.execute('DELETE FROM devolucoes WHERE id IN (SELECT value FROM json_each(?))', (ids,))
+    return _rpc_recalcular_estado_blocos(conn, {'p_blocos': blocos})
+
+
+RPC_FUNCTIONS['eliminar_devolucoes'] = _rpc_eliminar_devolucoes
@@ -0,0 +1,166 @@
+"""
+Receipts (``pagamentos`` of assigned blocks) shared by the Recebimento tabs
+
+``blocos_pendentes`` lists the blocks of a campaign that still have a
+balance, read from the ``saldos_blocos`` ledger (``scripts/saldos.sql``).
+``validar_lote`` checks a batch of receipts (edited grid or uploaded
+file) locally against those blocks, and ``registar_lote`` writes the valid
+ones with one bulk insert, recording a per-row outcome.
+"""
+import uuid
+from datetime import date
+
+import pandas as pd
+
+METODOS_PAGAMENTO = ["Dinheiro", "Transferência Bancária", "MB Way", "Multibanco", "Cheque", "Outro"]
+
+# Columns of a batch (grid or file); only bloco_id and one of
+# valor_recebido / rifas_entregues are required per row
+COLUNAS_LOTE = [
+    'bloco_id', 'valor_recebido', 'rifas_entregues', 'observacoes_canhotos', 'metodo_pagamento', 'data_recebimento',
+]
+
+OK = "✅ Registado"
+
+
+def blocos_pendentes(campanha_id):
+    """Assigned blocks of a campaign with a pending balance, by ticket number.
+
+    Each dict has the block's ``id``, numbers and price, ``seccao``,
+    ``escuteiro_id``, ``escuteiros`` (``{'nome': ...}``) and ``saldo``.
+    """
+    from utils import data_access as db
+
+    saldos = db.select(
+        'saldos_blocos',
+        'bloco_id, saldo, escuteiro_id, blocos_rifas(numero_inicial, numero_final, preco_bloco, seccao), escuteiros(nome)',
+        filters=[('eq', 'campanha_id', campanha_id), ('not_is', 'escuteiro_id', None), ('gt', 'saldo', 0)],
+        order=[('bloco_id', False)]  # keyset pagination; sorted by number below
+    )
+    blocos = [
+        {**(s.get('blocos_rifas') or {}), 'id': s['bloco_id'], 'saldo': s['saldo'],
+         'escuteiro_id': s['escuteiro_id'], 'escuteiros': s.get('escuteiros')}
+        for s in saldos if s.get('blocos_rifas')
+    ]
+    blocos.sort(key=lambda b: b['numero_inicial'])
+    return blocos
+
+
+def ler_ficheiro(ficheiro):
+    """Read an uploaded batch (``.csv`` or Excel) into a DataFrame."""
+    if ficheiro.name.lower().endswith('.csv'):
+        # Accepts both ',' and ';' (Excel in Portuguese saves CSV with ';')
+        return pd.read_csv(ficheiro, sep=None, engine='python', dtype={'bloco_id': str})
+    return pd.read_excel(ficheiro, dtype={'bloco_id': str})
+
+
+def _vazio(valor):
+    return valor is None or (not isinstance(valor, str) and pd.isna(valor)) or str(valor).strip() == ''
+
+
+def _data(valor):
+    """ISO date of a cell: a date, ``AAAA-MM-DD`` or a day-first ``DD/MM/AAAA``."""
+    texto = str(valor).strip()
+    if isinstance(valor, str) and len(texto) >= 10 and texto[4] == '-':
+        return pd.to_datetime(texto[:10], format='%Y-%m-%d').date().isoformat()
+    return pd.to_datetime(valor, dayfirst=True).date().isoformat()
+
+
+def validar_lote(linhas, blocos):
+    """Validate a batch against the pending ``blocos`` (as ``blocos_pendentes``).
+
+    ``linhas`` is a DataFrame (or list of dicts) with ``COLUNAS_LOTE``. Rows
+    without an amount and without stubs are ignored. Returns
+    ``(relatorio, registos)``: one report dict per remaining row (its
+    ``Resultado`` is an error or ``None`` when valid) and the payment rows to
+    insert as ``(report index, row)`` pairs.
+    """
+    if isinstance(linhas, pd.DataFrame):
+        linhas = linhas.to_dict('records')
+    por_id = {b['id']: b for b in blocos}
+    hoje = date.today().isoformat()
+
+    relatorio, registos, linha_do_bloco = [], [], {}
+    for idx, row in enumerate(linhas):
+        linha = idx + 2  # as in the uploaded file (row 1 is the header)
+        valor, canhotos = row.get('valor_recebido'), row.get('rifas_entregues')
+        if _vazio(valor) and _vazio(canhotos):
+            continue
+
+        bloco_id = '' if _vazio(row.get('bloco_id')) else str(row['bloco_id']).strip()
+        bloco = por_id.get(bloco_id)
+        escuteiro = ((bloco or {}).get('escuteiros') or {}).get('nome', '')
+        erro = None
+        try:
+            valor = 0.0 if _vazio(valor) else round(float(valor), 2)
+            canhotos = None if _vazio(canhotos) else int(float(canhotos))
+        except (TypeError, ValueError):
+            erro = "valor ou canhotos não numéricos"
+        metodo = METODOS_PAGAMENTO[0] if _vazio(row.get('metodo_pagamento')) else str(row['metodo_pagamento']).strip()
+        data_recebimento = row.get('data_recebimento')
+        if not erro:
+            try:
+                data_recebimento = hoje if _vazio(data_recebimento) else _data(data_recebimento)
+            except (TypeError, ValueError):
+                erro = f"data inválida: {data_recebimento}"
+
+        if erro:
+            pass  # already set while parsing
+        elif not bloco_id:
+            erro = "bloco_id é obrigatório"
+        elif bloco is None:
+            erro = f"bloco {bloco_id} não está atribuído nesta campanha ou não tem saldo pendente"
+        elif bloco_id in linha_do_bloco:
+            erro = f"bloco repetido (já na linha {linha_do_bloco[bloco_id]})"
+        elif valor < 0:
+            erro = "o valor não pode ser negativo"
+        elif canhotos is not None and not 0 <= canhotos <= bloco['numero_final'] - bloco['numero_inicial'] + 1:
+            erro = f"canhotos fora do intervalo 0-{bloco['numero_final'] - bloco['numero_inicial'] + 1}"
+        elif metodo not in METODOS_PAGAMENTO:
+            erro = f"método de pagamento desconhecido: {metodo}"
+
+        relatorio.append({
+            'Linha': linha,
+            'Bloco': f"{bloco['numero_inicial']}-{bloco['numero_final']}" if bloco else bloco_id,
+            'Escuteiro': escuteiro,
+            'Valor': valor if isinstance(valor, float) else None,
+            'Resultado': f"❌ {erro}" if erro else None,
+        })
+        if erro:
+            continue
+        linha_do_bloco[bloco_id] = linha
+        observacoes = row.get('observacoes_canhotos')
+        registos.append((len(relatorio) - 1, {
+            'bloco_id': bloco_id,
+            'valor_pago': valor,
+            'rifas_entregues': canhotos,
+            'observacoes_canhotos': None if _vazio(observacoes) else str(observacoes).strip(),
+            'data_pagamento': data_recebimento,
+            'metodo_pagamento': metodo,
+        }))
+    return relatorio, registos
+
+
+def registar_lote(relatorio, registos, on_progress=None):
+    """Insert the valid rows of ``validar_lote`` in one all-or-nothing bulk
+    insert and fill in their ``Resultado`` (rows a failed rollback left in
+    the table are flagged). Returns the number registered."""
+    from utils import data_access as db
+
+    if not registos:
+        return 0
+    for _, registo in registos:
+        registo.setdefault('id', str(uuid.uuid4()))
+    try:
+        db.insert_many('pagamentos', [registo for _, registo in registos], on_progress=on_progress)
+    except Exception as e:
+        por_remover = set(getattr(e, 'leftover_ids', ()))
+        for pos, registo in registos:
+            if registo['id'] in por_remover:
+                relatorio[pos]['Resultado'] = f"⚠️ gravado, mas o lote falhou: {e}"
+            else:
+                relatorio[pos]['Resultado'] = f"❌ não gravado: {e}"
+        return 0
+    for pos, _ in registos:
+        relatorio[pos]['Resultado'] = OK
+    return len(registos)
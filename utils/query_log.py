@@ -0,0 +1,293 @@
+"""
+Per-rerun instrumentation of every Supabase call
+
+``get_supabase_client()`` wraps the client in ``InstrumentedClient``: each
+``execute()`` is timed and recorded with its table, operation, filter summary,
+row count and payload size. Records are grouped per Streamlit rerun (and per
+browser session), so N+1 patterns show up as hundreds of calls in a single
+render.
+
+- ``render_query_panel()`` shows the current rerun's calls in an optional
+  sidebar panel (enabled with ``RIFAS_DEBUG_QUERIES=1`` or ``?debug=1``)
+- ``RIFAS_QUERY_LOG=<ficheiro>`` appends every call as a JSON line
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+_MAX_SESSIONS = 100
+_N_PLUS_ONE_THRESHOLD = 10
+_VERBS = ('select', 'insert', 'update', 'upsert', 'delete')
+
+
+def log_path():
+    return os.getenv('RIFAS_QUERY_LOG')
+
+
+def debug_enabled() -> bool:
+    if os.getenv('RIFAS_DEBUG_QUERIES', '').lower() in ('1', 'true', 'yes'):
+        return True
+    try:
+        import streamlit as st
+        return st.query_params.get('debug') == '1'
+    except Exception:
+        return False
+
+
+class QueryRecord:
+    __slots__ = ('table', 'operation', 'filters', 'rows', 'bytes', 'ms', 'error', 'started_at')
+
+    def __init__(self, table, operation, filters, rows, payload_bytes, ms, error, started_at):
+        self.table = table
+        self.operation = operation
+        self.filters = filters
+        self.rows = rows
+        self.bytes = payload_bytes
+        self.ms = ms
+        self.error = error
+        self.started_at = started_at
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class RunLog:
+    """Calls made during one script run of one session."""
+
+    def __init__(self, session_id, page, marker):
+        self.session_id = session_id
+        self.page = page
+        self.marker = marker
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.records = []
+
+    def add(self, record):
+        self.records.append(record)
+
+    def summary(self) -> dict:
+        return {
+            'calls': len(self.records),
+            'ms': round(sum(r.ms for r in self.records), 1),
+            'rows': sum(r.rows for r in self.records),
+            'bytes': sum(r.bytes or 0 for r in self.records),
+        }
+
+    def repeated_patterns(self, threshold=_N_PLUS_ONE_THRESHOLD):
+        """(table, operation, filter shape) groups repeated ``threshold``+ times."""
+        shapes = Counter((r.table, r.operation, _filter_shape(r.filters)) for r in self.records)
+        return [(key, n) for key, n in shapes.most_common() if n >= threshold]
+
+
+_lock = threading.Lock()
+_runs = OrderedDict()
+# Calls made outside a script run (CLI scripts, benchmarks) have no rerun to
+# group them: they only go to RIFAS_QUERY_LOG, not kept in memory
+_bare_run = RunLog(None, None, None)
+_log_lock = threading.Lock()
+_thread = threading.local()
+
+
+def current_run() -> RunLog:
+    """Return the RunLog of the script run executing in this thread.
+
+    A new rerun is detected by the identity of ``ctx.cursors``, which Streamlit
+    replaces on every (full or fragment) rerun. The RunLog keeps a reference to
+    it, so the identity check cannot be fooled by id reuse.
+    """
+    bound = getattr(_thread, 'run', None)
+    if bound is not None:
+        return bound
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        ctx = None
+    if ctx is None:
+        return _bare_run
+
+    marker = getattr(ctx, 'cursors', None)
+    with _lock:
+        run = _runs.get(ctx.session_id)
+        if run is None or run.marker is not marker:
+            page = getattr(ctx, 'page_script_hash', None)
+            run = RunLog(ctx.session_id, page, marker)
+            _runs[ctx.session_id] = run
+        _runs.move_to_end(ctx.session_id)
+        while len(_runs) > _MAX_SESSIONS:
+            _runs.popitem(last=False)
+        return run
+
+
+@contextmanager
+def bound_run(run):
+    """Attribute calls made in this thread (e.g. by a prefetch worker) to ``run``."""
+    previous = getattr(_thread, 'run', None)
+    _thread.run = run
+    try:
+        yield
+    finally:
+        _thread.run = previous
+
+
+def _short(value):
+    if isinstance(value, (list, tuple)):
+        return f'[{len(value)} valores]'
+    text = str(value)
+    return text[:8] + '…' if len(text) > 12 else text
+
+
+def _summarize_call(name, args, kwargs):
+    if name == 'order':
+        return f"order({args[0] if args else ''}{' desc' if kwargs.get('desc') else ''})"
+    if name in ('limit', 'range'):
+        return f"{name}({', '.join(str(a) for a in args)})"
+    if len(args) >= 2:
+        return f'{name}({args[0]}={_short(args[1])})'
+    return name
+
+
+def _filter_shape(filters):
+    """Filter summary without the values, used to spot N+1 loops."""
+    return ' '.join(part.split('=')[0] for part in filters.split(' '))
+
+
+def _payload_size(data):
+    try:
+        return len(json.dumps(data, default=str))
+    except Exception:
+        return None
+
+
+def _record(table, operation, calls, started, data, error):
+    ms = (time.perf_counter() - started) * 1000
+    if isinstance(data, list):
+        rows = len(data)
+    elif data is None:
+        rows = 0
+    else:
+        rows = 1
+    measure = debug_enabled() or log_path()
+    record = QueryRecord(
+        table=table,
+        operation=operation,
+        filters=' '.join(calls),
+        rows=rows,
+        payload_bytes=_payload_size(data) if measure else None,
+        ms=round(ms, 2),
+        error=error,
+        started_at=datetime.now(timezone.utc).isoformat(),
+    )
+    run = current_run()
+    if run is not _bare_run:
+        with _lock:
+            run.add(record)
+    path = log_path()
+    if path:
+        line = {'session': run.session_id, 'run_started_at': run.started_at, 'page': run.page, **record.as_dict()}
+        with _log_lock:
+            with open(path, 'a', encoding='utf-8') as fh:
+                fh.write(json.dumps(line, default=str) + '\n')
+
+
+class _TracedBuilder:
+    """Proxy over a postgrest request builder that records ``execute()``."""
+
+    def __init__(self, inner, table, operation=None, calls=()):
+        self._inner = inner
+        self._table = table
+        self._operation = operation
+        self._calls = calls
+
+    def _wrap(self, result, operation, calls):
+        if hasattr(result, 'execute'):
+            return _TracedBuilder(result, self._table, operation, calls)
+        return result
+
+    def __getattr__(self, name):
+        attr = getattr(self._inner, name)
+        if name == 'execute':
+            return self._execute
+        if not callable(attr):
+            calls = self._calls + ('not',) if name == 'not_' else self._calls
+            return self._wrap(attr, self._operation, calls)
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            operation = self._operation or (name if name in _VERBS else None)
+            calls = self._calls if name in _VERBS else self._calls + (_summarize_call(name, args, kwargs),)
+            return self._wrap(result, operation, calls)
+        return call
+
+    def _execute(self):
+        started = time.perf_counter()
+        try:
+            response = self._inner.execute()
+        except Exception as exc:
+            _record(self._table, self._operation, self._calls, started, None, str(exc)[:200])
+            raise
+        _record(self._table, self._operation, self._calls, started,
+                getattr(response, 'data', None) if response is not None else None, None)
+        return response
+
+
+class InstrumentedClient:
+    """Wraps a Supabase (or local) client; everything else is delegated."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name):
+        return _TracedBuilder(self._client.table(name), name)
+
+    from_ = table
+
+    def rpc(self, name, params=None, *args, **kwargs):
+        return _TracedBuilder(self._client.rpc(name, params, *args, **kwargs), f'rpc:{name}', 'rpc')
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def render_query_panel():
+    """Sidebar panel with the Supabase calls of the current rerun.
+
+    Rendered at the end of a full rerun; the pages' tabs are fragments, so a
+    rerun of a single tab leaves the panel showing the last full rerun.
+    """
+    if not debug_enabled():
+        return
+    import streamlit as st
+    import pandas as pd
+    from utils.supabase_client import get_connection_stats
+    from utils.data_access import cache
+
+    run = current_run()
+    resumo = run.summary()
+    with st.sidebar.expander(f"🐞 Consultas: {resumo['calls']} chamadas · {resumo['ms']:.0f} ms", expanded=False):
+        col1, col2 = st.columns(2)
+        col1.metric("Chamadas", resumo['calls'])
+        col2.metric("Tempo total", f"{resumo['ms']:.0f} ms")
+        col1.metric("Linhas", resumo['rows'])
+        col2.metric("Payload", f"{resumo['bytes'] / 1024:.1f} KB")
+
+        for (table, operation, shape), n in run.repeated_patterns():
+            st.warning(f"⚠️ Possível N+1: {n}× {operation or ''} {table} {shape}")
+
+        if run.records:
+            df = pd.DataFrame([r.as_dict() for r in run.records])
+            st.dataframe(
+                df[['table', 'operation', 'filters', 'rows', 'bytes', 'ms', 'error']],
+                hide_index=True,
+                use_container_width=True
+            )
+
+        conn = get_connection_stats()
+        cache_stats = cache.stats()
+        st.caption(
+            f"Ligações HTTP: {conn['connections_opened']} abertas · {conn['connections_reused']} reutilizadas | "
+            f"Cache: {cache_stats['hits']} hits · {cache_stats['misses']} misses · {cache_stats['entries']} entradas"
+        )
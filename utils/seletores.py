@@ -0,0 +1,68 @@
+"""
+Id-based pickers shared by the pages
+
+A picker selects a row id (stable across reruns) and shows a label. The
+``Opcoes`` behind it (id -> row and id -> label maps) are built once per
+version of the data with ``db.memoize``: reruns reuse them, and the next
+write to one of the tables they come from rebuilds them. ``seletor``
+returns the picked row from memory, so picking costs no extra request.
+"""
+import streamlit as st
+
+from utils import data_access as db
+
+
+class Opcoes:
+    """Rows of a picker keyed by ``id``, in display order, with their labels."""
+
+    def __init__(self, linhas, rotulo):
+        self.linhas = {linha['id']: linha for linha in linhas}
+        self.ids = list(self.linhas)
+        self.rotulos = {id_: rotulo(linha) for id_, linha in self.linhas.items()}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, id_):
+        return id_ in self.linhas
+
+
+def seletor(label, opcoes, vazio=None, key=None, **kwargs):
+    """``st.selectbox`` over ``opcoes``; returns the picked row (or None).
+
+    With ``vazio`` (the placeholder label) nothing is picked by default. A
+    value left in ``st.session_state[key]`` that is no longer an option (e.g.
+    a block that was just deleted) is dropped first.
+    """
+    if key is not None and st.session_state.get(key) is not None and st.session_state[key] not in opcoes:
+        del st.session_state[key]
+    escolhido = st.selectbox(
+        label,
+        options=([None] if vazio else []) + opcoes.ids,
+        format_func=lambda id_: vazio if id_ is None else opcoes.rotulos.get(id_, str(id_)),
+        key=key,
+        **kwargs
+    )
+    return opcoes.linhas.get(escolhido)
+
+
+def blocos_atribuidos(campanha_id):
+    """Blocks of a campaign assigned to a scout, by name, labelled with the
+    ticket range and the scout's name."""
+
+    def construir():
+        nomes = {e['id']: e['nome'] for e in db.select('escuteiros', 'id, nome')}
+        blocos = db.select(
+            'blocos_rifas', 'id, nome, numero_inicial, numero_final, escuteiro_id, campanha_id',
+            filters=[('eq', 'campanha_id', campanha_id), ('not_is', 'escuteiro_id', None)],
+            order=[('nome', False)]
+        )
+        return Opcoes(blocos, lambda b: (
+            f"{b['nome']} (Rifas {b['numero_inicial']}-{b['numero_final']}) | "
+            f"Escuteiro: {nomes.get(b['escuteiro_id'], 'N/A')}"
+        ))
+
+    return db.memoize(
+        ('seletor_blocos_atribuidos', campanha_id), 'blocos_rifas', construir,
+        filters=[('eq', 'campanha_id', campanha_id)], tables=('blocos_rifas', 'escuteiros')
+    )
@@ -0,0 +1,192 @@
+"""
+Verifiable raffle draw over the eligible tickets of a campaign
+
+The eligible tickets are kept as sorted ranges (``inicios``/``fins``), never
+as one number per ticket: a draw index ``0 <= i < total`` is mapped to a
+ticket with a binary search over the cumulative range sizes, so drawing from
+millions of tickets costs O(k log n).
+
+Eligibility (``populacao_campanha``):
+
+- tickets of blocks assigned to a scout whose state is not ``devolvido``
+- minus the ticket ranges returned in ``devolucoes`` (``utils/devolucoes.py``;
+  old returns without a range stand for the last tickets of the block)
+- minus tickets marked ``devolvida``/``perdida`` in the per-ticket bitmap
+  (``utils/estado_rifas.py``); with ``criterio='vendidas'`` only tickets
+  explicitly marked ``vendida`` are eligible
+
+Winners come from a SHA-256 counter stream: draw ``j`` uses
+``int(sha256(f"{semente}:{j}")) mod total`` and repeated indexes are skipped
+until ``n`` distinct tickets are drawn. The stream depends only on the seed,
+so the result can be re-computed by anyone (and by ``verificar_sorteio``)
+independently of the NumPy version. ``impressao_digital`` is a SHA-256 of
+the eligible ranges, recorded with the draw to detect a changed population.
+"""
+import hashlib
+import secrets
+
+import numpy as np
+
+from utils import estado_rifas
+from utils.devolucoes import devolvidas_por_bloco, juntar_intervalos
+
+CRITERIOS = {
+    'atribuidas': 'Rifas atribuídas (sem devoluções)',
+    'vendidas': 'Apenas rifas marcadas como vendidas',
+}
+
+
+class PopulacaoSorteio:
+    """Eligible tickets of a draw as sorted, non-overlapping ranges."""
+
+    def __init__(self, inicios, fins):
+        inicios = np.asarray(inicios, dtype=np.int64)
+        fins = np.asarray(fins, dtype=np.int64)
+        ordem = np.lexsort((fins, inicios))
+        self.inicios, self.fins = _fundir(inicios[ordem], fins[ordem])
+        self._acumulado = np.cumsum(self.fins - self.inicios + 1)
+        self.total = int(self._acumulado[-1]) if len(self._acumulado) else 0
+
+    def __len__(self):
+        return self.total
+
+    @property
+    def impressao_digital(self):
+        dados = np.stack([self.inicios, self.fins], axis=1).astype('<i8').tobytes()
+        return hashlib.sha256(dados).hexdigest()
+
+    def numeros(self, indices):
+        """Ticket numbers at positions ``indices`` (0-based) of the population."""
+        indices = np.asarray(indices, dtype=np.int64)
+        faixa = np.searchsorted(self._acumulado, indices, side='right')
+        antes = self._acumulado[faixa] - (self.fins[faixa] - self.inicios[faixa] + 1)
+        return self.inicios[faixa] + (indices - antes)
+
+
+def _fundir(inicios, fins):
+    """Merge overlapping/adjacent sorted ranges (a ticket must count once)."""
+    if len(inicios) == 0:
+        return inicios, fins
+    fim_acumulado = np.maximum.accumulate(fins)
+    novos = np.concatenate([[True], inicios[1:] > fim_acumulado[:-1] + 1])
+    return inicios[novos], np.maximum.reduceat(fins, np.flatnonzero(novos))
+
+
+def _subtrair(inicios, fins, sem_inicios, sem_fins):
+    """Ranges ``inicios``/``fins`` minus the sorted, merged ranges ``sem_inicios``/``sem_fins``."""
+    inicios = np.asarray(inicios, dtype=np.int64)
+    fins = np.asarray(fins, dtype=np.int64)
+    # The gaps between the removed ranges, open at both ends
+    infinito = np.iinfo(np.int64).max
+    lacunas_inicios = np.concatenate([[-infinito], np.asarray(sem_fins, dtype=np.int64) + 1])
+    lacunas_fins = np.concatenate([np.asarray(sem_inicios, dtype=np.int64) - 1, [infinito]])
+    # Each range keeps its intersection with every gap it touches
+    primeira = np.searchsorted(lacunas_fins, inicios, side='left')
+    ultima = np.searchsorted(lacunas_inicios, fins, side='right')
+    partes = np.maximum(ultima - primeira, 0)
+    faixa = np.repeat(np.arange(len(inicios)), partes)
+    lacuna = np.repeat(primeira, partes) + np.arange(partes.sum()) - np.repeat(np.cumsum(partes) - partes, partes)
+    novos_inicios = np.maximum(inicios[faixa], lacunas_inicios[lacuna])
+    novos_fins = np.minimum(fins[faixa], lacunas_fins[lacuna])
+    validos = novos_inicios <= novos_fins
+    return novos_inicios[validos], novos_fins[validos]
+
+
+def gerar_semente():
+    """Random seed for a new draw (it can also be chosen and announced beforehand)."""
+    return secrets.token_hex(16)
+
+
+def indices_sorteados(semente, n, total):
+    """First ``n`` distinct indexes of the SHA-256 stream of ``semente`` in ``[0, total)``."""
+    if n < 1:
+        raise ValueError("O número de prémios tem de ser pelo menos 1")
+    if n > total:
+        raise ValueError(f"Não é possível sortear {n} prémios entre {total} rifas elegíveis")
+    escolhidos, vistos, j = [], set(), 0
+    while len(escolhidos) < n:
+        digest = hashlib.sha256(f"{semente}:{j}".encode('utf-8')).digest()
+        indice = int.from_bytes(digest, 'big') % total
+        j += 1
+        if indice not in vistos:
+            vistos.add(indice)
+            escolhidos.append(indice)
+    return escolhidos
+
+
+def sortear(populacao, n, semente):
+    """Draw ``n`` distinct winning tickets (in prize order) from ``populacao``."""
+    indices = indices_sorteados(semente, n, populacao.total)
+    return [int(numero) for numero in populacao.numeros(indices)]
+
+
+def populacao_campanha(campanha_id, criterio='atribuidas'):
+    """Build the eligible population of a campaign (see module docstring)."""
+    from utils import data_access as db
+
+    if criterio not in CRITERIOS:
+        raise ValueError(f"Critério de sorteio desconhecido: {criterio}")
+    blocos = db.select(
+        'blocos_rifas', 'id, numero_inicial, numero_final, escuteiro_id, estado, estado_rifas',
+        filters=[('eq', 'campanha_id', campanha_id), ('not_is', 'escuteiro_id', None)],
+        use_cache=False
+    )
+    blocos = [b for b in blocos if b.get('estado') != 'devolvido']
+    devolvidas = devolvidas_por_bloco(campanha_id, use_cache=False)
+
+    # Blocks without a bitmap stay whole ranges; tracked blocks are decoded
+    # and compacted back into ranges of their eligible tickets
+    inteiros = [b for b in blocos if not b.get('estado_rifas')]
+    if criterio == 'vendidas':
+        inteiros = []
+    marcados = [b for b in blocos if b.get('estado_rifas')]
+    numeros, codigos = estado_rifas.codigos_blocos(marcados)
+    if criterio == 'vendidas':
+        numeros = numeros[codigos == estado_rifas.VENDIDA]
+    else:
+        numeros = numeros[(codigos == estado_rifas.POR_VENDER) | (codigos == estado_rifas.VENDIDA)]
+    faixas = estado_rifas.compactar_intervalos(np.sort(numeros))
+
+    inicios = [b['numero_inicial'] for b in inteiros] + [a for a, _ in faixas]
+    fins = [b['numero_final'] for b in inteiros] + [f for _, f in faixas]
+
+    # Returned tickets (ticket numbers are unique in a campaign: all ranges at once)
+    removidas = juntar_intervalos(faixa for faixas_bloco in devolvidas.values() for faixa in faixas_bloco)
+    inicios, fins = _subtrair(inicios, fins, [a for a, _ in removidas], [f for _, f in removidas])
+    return PopulacaoSorteio(inicios, fins)
+
+
+def registar_sorteio(campanha_id, criterio, n, semente=None, observacoes=None):
+    """Run a draw for a campaign and record it in ``sorteios``. Returns the record."""
+    from utils import data_access as db
+
+    semente = semente or gerar_semente()
+    populacao = populacao_campanha(campanha_id, criterio)
+    vencedores = sortear(populacao, n, semente)
+    registo = db.insert('sorteios', {
+        'campanha_id': campanha_id,
+        'semente': semente,
+        'criterio': criterio,
+        'n_premios': n,
+        'total_rifas': populacao.total,
+        'impressao_digital': populacao.impressao_digital,
+        'vencedores': vencedores,
+        'observacoes': observacoes,
+    })
+    return registo[0] if registo else None
+
+
+def verificar_sorteio(sorteio):
+    """Re-run a recorded draw against the campaign's current tickets.
+
+    Returns ``(resultado, populacao_igual, vencedores)``: whether the winners
+    match, whether the eligible tickets are still the ones drawn from and the
+    winners recomputed now.
+    """
+    populacao = populacao_campanha(sorteio['campanha_id'], sorteio['criterio'])
+    populacao_igual = populacao.impressao_digital == sorteio['impressao_digital']
+    try:
+        vencedores = sortear(populacao, sorteio['n_premios'], sorteio['semente'])
+    except ValueError:
+        vencedores = []
+    return vencedores == list(sorteio['vencedores']), populacao_igual, vencedores
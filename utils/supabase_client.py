@@ -1,9 +1,23 @@
 """
 Supabase client configuration with automatic environment detection
+
+The client is created once per process and shared by every page, every rerun
+and every browser session. All PostgREST traffic goes through a single pooled
+``httpx.Client`` so TCP/TLS connections are kept alive and reused between
+requests instead of being renegotiated on every Streamlit rerun.
+
+Every call is timed and counted per rerun by ``utils/query_log.py``.
+
+Set ``RIFAS_BACKEND=sqlite`` to use the offline SQLite stand-in from
+``utils/local_backend.py`` instead of Supabase (file: ``RIFAS_SQLITE_PATH``).
 """
 import os
+import threading
+import httpx
 from supabase import create_client, Client
+from supabase.lib.client_options import SyncClientOptions
 from dotenv import load_dotenv
+from utils.query_log import InstrumentedClient
 
 # Load environment variables in this order (first found wins):
 # 1. .env (standard)
@@ -16,21 +30,84 @@ if not os.getenv('SUPABASE_URL') and os.path.exists('.env.supabase'):
     # If SUPABASE_URL not already set and .env.supabase exists, load it
     load_dotenv('.env.supabase')
 
-def get_supabase_client() -> Client:
-    """
-    Create and return a Supabase client instance
-    
-    Automatically detects credentials from:
-    1. Streamlit Cloud: st.secrets
-    2. GitHub Codespaces / Local: environment variables
-    
-    Environment variables required:
-    - SUPABASE_URL: Your Supabase project URL
-    - SUPABASE_KEY: Your Supabase project API key (anon/public key)
+# Connection pool sizing: ~20 leaders using the app at the same time on a
+# receipt evening, each rerun issuing a handful of sequential requests.
+POOL_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=20, keepalive_expiry=60.0)
+POOL_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+_client_lock = threading.Lock()
+_client = None
+
+
+class ConnectionStats:
+    """Thread-safe counters for the shared HTTP connection pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.connections_reused = 0
+
+    def record(self, opened_new_connection: bool):
+        with self._lock:
+            self.requests += 1
+            if opened_new_connection:
+                self.connections_opened += 1
+            else:
+                self.connections_reused += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'connections_opened': self.connections_opened,
+                'connections_reused': self.connections_reused,
+            }
+
+
+connection_stats = ConnectionStats()
+
+
+class _CountingTransport(httpx.HTTPTransport):
+    """HTTP transport that records whether each request needed a new connection.
+
+    httpcore emits a ``connection.connect_tcp.complete`` trace event only when a
+    fresh TCP connection is opened; requests served from the keep-alive pool
+    never emit it.
     """
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        opened = []
+        previous_trace = request.extensions.get('trace')
+
+        def trace(event_name, info):
+            if event_name == 'connection.connect_tcp.complete':
+                opened.append(True)
+            if previous_trace is not None:
+                previous_trace(event_name, info)
+
+        request.extensions['trace'] = trace
+        try:
+            return super().handle_request(request)
+        finally:
+            connection_stats.record(bool(opened))
+
+
+def _build_http_client() -> httpx.Client:
+    """Create the pooled HTTP client shared by all Supabase sub-clients."""
+    try:
+        transport = _CountingTransport(http2=True, limits=POOL_LIMITS)
+    except ImportError:
+        # h2 not installed: HTTP/1.1 keep-alive still reuses connections
+        transport = _CountingTransport(limits=POOL_LIMITS)
+    return httpx.Client(transport=transport, timeout=POOL_TIMEOUT, follow_redirects=True)
+
+
+def _get_credentials():
+    """Resolve Supabase URL and key from Streamlit secrets or environment."""
     supabase_url = None
     supabase_key = None
-    
+
     # Try to get credentials from Streamlit secrets first (for Streamlit Cloud)
     try:
         import streamlit as st
@@ -40,12 +117,12 @@ def get_supabase_client() -> Client:
     except (ImportError, KeyError, FileNotFoundError):
         # Streamlit not available or secrets not configured
         pass
-    
+
     # If not found in Streamlit secrets, try environment variables
     if not supabase_url or not supabase_key:
         supabase_url = os.getenv("SUPABASE_URL")
         supabase_key = os.getenv("SUPABASE_KEY")
-    
+
     # Validate that we have the required credentials
     if not supabase_url or not supabase_key:
         raise ValueError(
@@ -64,6 +141,55 @@ def get_supabase_client() -> Client:
             "   SUPABASE_URL=sua_url_do_supabase\n"
             "   SUPABASE_KEY=sua_chave_do_supabase"
         )
-    
-    # Create and return the Supabase client
-    return create_client(supabase_url, supabase_key)
+    return supabase_url, supabase_key
+
+
+def get_supabase_client() -> Client:
+    """
+    Return the process-wide Supabase client instance
+
+    The client is created on first use and then reused across reruns and
+    sessions. Credentials are detected from:
+    1. Streamlit Cloud: st.secrets
+    2. GitHub Codespaces / Local: environment variables
+
+    Environment variables required:
+    - SUPABASE_URL: Your Supabase project URL
+    - SUPABASE_KEY: Your Supabase project API key (anon/public key)
+    """
+    global _client
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is None and os.getenv('RIFAS_BACKEND', 'supabase').lower() == 'sqlite':
+            from utils.local_backend import LocalClient
+            _client = InstrumentedClient(LocalClient(
+                os.getenv('RIFAS_SQLITE_PATH', 'rifas_local.db'),
+                max_rows=int(os.getenv('RIFAS_SQLITE_MAX_ROWS', '1000')) or None
+            ))
+        if _client is None:
+            supabase_url, supabase_key = _get_credentials()
+            options = SyncClientOptions(httpx_client=_build_http_client())
+            _client = InstrumentedClient(create_client(supabase_url, supabase_key, options=options))
+    return _client
+
+
+def reset_supabase_client():
+    """Close the shared client so the next call re-reads credentials."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            try:
+                if hasattr(_client, 'options'):
+                    _client.options.httpx_client.close()
+                else:
+                    _client.close()
+            except Exception:
+                pass
+        _client = None
+
+
+def get_connection_stats() -> dict:
+    """Return how many HTTP connections were opened and reused so far."""
+    return connection_stats.snapshot()